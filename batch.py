@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser, Namespace
+import traceback
+import threading
+import time
+import sys
+import os
+
+testpath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testpath)
+from runner import CLIEngine, DockerEngine, LocalEngine, ParallelRunner, default_engine, FAILED
+from shards import default_shards, keep_reports, merge_reports, write_shards
+from checkpoint import Checkpoint
+from dockerapi import DockerError
+from logtail import LogTail
+from samplesheet import read_samplesheet
+from metrics import Metrics, METRICS
+import runfolder
+import jobqueue
+__author__ = 'adamkoziol'
+
+
+def find_samplesheet(miseqpath, miseqfolder, outputpath, customsamplesheet=None):
+    """
+    Determine the sample sheet used in the analysis of a run: the one reported in the portal.log of the run,
+    otherwise the custom sample sheet, otherwise the sample sheet in the run folder
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :param outputpath: path of the folder containing the output folder of the run
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :return: path of the sample sheet
+    """
+    tail = LogTail(os.path.join(outputpath, miseqfolder, 'portal.log'))
+    tail.read()
+    if tail.samplesheet and os.path.isfile(tail.samplesheet):
+        return tail.samplesheet
+    if customsamplesheet:
+        return os.path.join(customsamplesheet, 'SampleSheet.csv')
+    return os.path.join(miseqpath, miseqfolder, 'SampleSheet.csv')
+
+
+def run_metrics(outputpath, on_record=None):
+    """
+    :param outputpath: path of the folder containing the output folders of the runs
+    :param on_record: function called with each record
+    :return: Metrics that append to the metrics file in the output folder
+    """
+    return Metrics(os.path.join(outputpath, METRICS), on_record=on_record)
+
+
+def create_report(miseqpath, miseqfolder, outputpath, customsamplesheet=None, metrics=None, samples=None):
+    """
+    Create the GAR for an analysed run
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :param outputpath: path of the folder containing the output folder of the run
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :param metrics: Metrics in which to record the duration of each step
+    :param samples: list of the Sample_ID of each sample in the sample sheet. Read from the sample sheet if None
+    :return: the completed gar.GAR object
+    """
+    metrics = metrics or run_metrics(outputpath)
+    with metrics.stage(miseqfolder, 'import_report_engine'):
+        # The report engine pulls in pandas and pylatex, so only import it once a report is needed
+        import gar
+    report = gar.GAR(Namespace(miseqpath=miseqpath,
+                               miseqfolder=miseqfolder,
+                               outputfolder=outputpath,
+                               samplesheet=find_samplesheet(miseqpath, miseqfolder, outputpath, customsamplesheet),
+                               metrics=metrics,
+                               samples=samples))
+    with metrics.stage(miseqfolder, 'ingest_results'):
+        # Add the results to the index of all runs, so that they can be searched without re-reading the reports
+        import results_db
+        results_db.results_index(outputpath).ingest(outputpath, miseqfolder)
+    return report
+
+
+def report_process(miseqpath, miseqfolder, outputpath, customsamplesheet=None, samples=None):
+    """
+    Create the GAR for a run. Runs in the child process started by create_report_process
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :param outputpath: path of the folder containing the output folder of the run
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :param samples: list of the Sample_ID of each sample, as parsed by the parent process
+    :return: path of the PDF, and list of the metrics records of the steps of the report
+    """
+    metrics = Metrics()
+    report = create_report(miseqpath, miseqfolder, outputpath, customsamplesheet, metrics=metrics, samples=samples)
+    return '{}.pdf'.format(report.gar_path), list(metrics.records)
+
+
+def create_report_process(miseqpath, miseqfolder, outputpath, customsamplesheet=None, metrics=None, preview=None):
+    """
+    Create the GAR for an analysed run in a child process. LaTeX compilation changes the working directory of the
+    whole process, so GARs created on the threads of the analysis queue would otherwise race each other
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :param outputpath: path of the folder containing the output folder of the run
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :param metrics: Metrics to which the records of the steps of the report are added
+    :param preview: preview.ReportPreview of the run, whose normalised data is re-used through the report cache
+    :return: path of the PDF
+    """
+    import multiprocessing
+    metrics = metrics or run_metrics(outputpath)
+    if preview is not None:
+        preview.save_cache()
+    # The sample sheet was parsed when the run was queued; its samples are passed on rather than parsed again
+    samples = read_samplesheet(find_samplesheet(miseqpath, miseqfolder, outputpath, customsamplesheet)).sample_ids()
+    # Spawned rather than forked, as forking a process with other threads running (e.g. Qt's) is not safe
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        path, records = pool.apply(report_process, (miseqpath, miseqfolder, outputpath, customsamplesheet, samples))
+    for entry in records:
+        metrics.add(entry)
+    return path
+
+
+def prewarm(engine=None):
+    """
+    Import the report engine and the results index ahead of their first use, and pull the sipprverse image
+    :param engine: runner engine to prepare
+    """
+    import gar
+    import results_db
+    if engine is not None:
+        try:
+            engine.prepare()
+        except DockerError as error:
+            print('Could not prepare the sipprverse image: {}'.format(error), file=sys.stderr)
+
+
+def report_task(miseqpath, miseqfolder, outputpath, customsamplesheet=None):
+    """
+    Create the GAR for a run in a worker process. Errors are returned rather than raised, so that one failed run
+    is reported without affecting the others
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :param outputpath: path of the folder containing the output folder of the run
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :return: name of the run, path of the PDF (or None), and the traceback of any error
+    """
+    try:
+        report = create_report(miseqpath, miseqfolder, outputpath, customsamplesheet)
+        return miseqfolder, '{}.pdf'.format(report.gar_path), str()
+    except Exception:
+        return miseqfolder, None, traceback.format_exc()
+
+
+def create_reports(miseqpath, miseqfolders, outputpath, customsamplesheet=None, workers=None, on_result=None):
+    """
+    Create the GARs of many analysed runs concurrently, each in its own process so that LaTeX compilation uses
+    every core
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolders: names of the MiSeq run folders
+    :param outputpath: path of the folder containing the output folders of the runs
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :param workers: number of worker processes. The number of cores if None
+    :param on_result: function called with the result tuple of each run as it completes
+    :return: list of tuples of name of the run, path of the PDF (or None), and the traceback of any error
+    """
+    # Only needed for report-only batches, so kept out of the import of this module by the GUI
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    results = list()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = [executor.submit(report_task, miseqpath, miseqfolder, outputpath, customsamplesheet)
+                   for miseqfolder in miseqfolders]
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception:
+                # The worker process itself failed (e.g. it was killed)
+                result = (miseqfolders[futures.index(future)], None, traceback.format_exc())
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+def analyse(job, miseqpath, outputpath, customsamplesheet=None, on_output=None, on_status=None, report=True,
+            metrics=None, on_preview=None, preview_interval=10, engine=None, shards=1, resume=True, on_logs=None):
+    """
+    Run the sipprverse pipeline on a run folder, and create the GAR if it succeeds
+    :param job: jobqueue.Job of the run folder to analyse
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param outputpath: path of the folder in which the output folder for the run is to be created
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :param on_output: function called with each line written by the pipeline
+    :param on_status: function called with the name of the run, the exit status, and the end of stderr
+    :param report: Boolean of whether to create the GAR
+    :param metrics: Metrics in which to record the duration of each stage
+    :param on_preview: function called with the name of the run and the path of the HTML preview of its reports
+    whenever the preview is updated
+    :param preview_interval: seconds between checks of the reports for new results while the pipeline runs
+    :param engine: runner.CLIEngine, DockerEngine, or LocalEngine with which to run the pipeline. The default
+    engine of the host if None
+    :param shards: number of shards into which the samples are split, each analysed at once by its own container
+    (or process). 0 to use as many shards as the host can analyse at once
+    :param resume: Boolean of whether to only analyse the samples that the checkpoint of the run does not record as
+    complete. Every sample is analysed again if False
+    :param on_logs: function called with the name of the run and the list of the paths of the portal.log written by
+    each analysis of the run (the run itself, or each of its shards) before they are started
+    :return: exit status of the pipeline
+    """
+    metrics = metrics or run_metrics(outputpath)
+    engine = engine or default_engine()
+    started = time.perf_counter()
+    first_output = list()
+
+    def output(line):
+        # The time until the pipeline first writes anything is the start-up time of the container
+        if not first_output:
+            first_output.append(True)
+            metrics.record(job.miseqfolder, 'container_start', time.perf_counter() - started)
+        if on_output is not None:
+            on_output(line)
+    sample_sheet = find_samplesheet(miseqpath, job.miseqfolder, outputpath, customsamplesheet)
+    samples = read_samplesheet(sample_sheet).samples
+    checkpoint = Checkpoint(outputpath, job.miseqfolder)
+    if not resume:
+        checkpoint.reset()
+    completed = checkpoint.completed(samples)
+    pending = [sample for sample in samples if sample.sample_id not in completed]
+    # Reports left by an earlier analysis, whose rows cannot show that a sample was completed by this one
+    before = checkpoint.report_stamps()
+    # Folders (relative to outputpath) whose reports are merged into the reports of the run
+    folders = list()
+    shard_list = list()
+    if completed:
+        if on_output is not None:
+            on_output('{done} of {total} samples of {mf} were analysed previously{rest}\n'
+                      .format(done=len(completed), total=len(samples), mf=job.miseqfolder,
+                              rest='; analysing the remaining {}'.format(len(pending)) if pending else str()))
+        folders.append(keep_reports(outputpath, job.miseqfolder, completed))
+    if pending and (completed or shards != 1):
+        with metrics.stage(job.miseqfolder, 'write_shards'):
+            shard_list = write_shards(sample_sheet, outputpath, job.miseqfolder,
+                                      shards or default_shards(len(pending)), pending)
+        folders.extend(folder for folder, _ in shard_list)
+    merge_lock = threading.Lock()
+
+    def merge():
+        with merge_lock:
+            merge_reports(outputpath, job.miseqfolder, folders)
+
+    def finished(index, returncode):
+        # Record each shard as soon as it finishes, so that its samples are not analysed again if the rest of the run
+        # is interrupted. Of a shard that failed, or raised an error, only the samples with rows in every report
+        # written by the shard are recorded; the others are analysed again
+        merge()
+        checkpoint.record(shard_list[index][1], before=None if returncode == 0 else before)
+    if shard_list:
+        runner = ParallelRunner([engine.runner(miseqpath, job.miseqfolder, outputpath, customsamplesheet,
+                                               on_stdout=shard_output(index, output),
+                                               on_stderr=shard_output(index, output),
+                                               subfolder=folder)
+                                 for index, (folder, _) in enumerate(shard_list)],
+                                on_finished=finished)
+    elif pending:
+        runner = engine.runner(miseqpath, job.miseqfolder, outputpath, customsamplesheet,
+                               on_stdout=output,
+                               on_stderr=output)
+    else:
+        runner = None
+    if runner is not None and on_logs is not None:
+        # Each shard stands in for the output folder, so writes its own log
+        on_logs(job.miseqfolder, [os.path.join(outputpath, folder, job.miseqfolder, 'portal.log')
+                                  for folder, _ in shard_list]
+                or [os.path.join(outputpath, job.miseqfolder, 'portal.log')])
+    job.runner = runner
+    # The job was cancelled before its runner was set, so the runner could not be terminated then
+    if runner is not None and job.cancelled.is_set():
+        runner.terminate()
+    preview = None
+    stop = threading.Event()
+    if report:
+        preview = report_preview(miseqpath, job.miseqfolder, outputpath, customsamplesheet)
+        watcher = threading.Thread(target=watch_reports,
+                                   args=(preview, stop, preview_interval, on_preview, merge if folders else None),
+                                   daemon=True)
+        watcher.start()
+    try:
+        if runner is not None:
+            with metrics.stage(job.miseqfolder, 'sipprverse'):
+                returncode = runner.run()
+            # A runner that finished without an exit status did not complete, and must not be checkpointed
+            if returncode is None:
+                returncode = FAILED
+        else:
+            returncode = 0
+    finally:
+        stop.set()
+    if preview is not None:
+        watcher.join()
+    if returncode == 0:
+        if folders:
+            with metrics.stage(job.miseqfolder, 'merge_shards'):
+                merge()
+        checkpoint.record(pending)
+    elif not shard_list:
+        # A run that failed or was interrupted keeps the samples with rows in every report that it wrote
+        checkpoint.record(pending, before=before)
+    if on_status is not None:
+        on_status(job.miseqfolder, returncode, runner.stderr_tail() if runner is not None else str())
+    if returncode == 0 and report and not job.cancelled.is_set():
+        with metrics.stage(job.miseqfolder, 'report'):
+            create_report_process(miseqpath, job.miseqfolder, outputpath, customsamplesheet, metrics=metrics,
+                                  preview=preview)
+    return returncode
+
+
+def shard_output(index, output):
+    """
+    :param index: number of a shard
+    :param output: function called with each line written by the pipeline
+    :return: function that passes each line written by the shard to output, prefixed with the number of the shard
+    """
+    def labelled(line):
+        output('[shard {index}] {line}'.format(index=index, line=line))
+    return labelled
+
+
+def report_preview(miseqpath, miseqfolder, outputpath, customsamplesheet=None):
+    """
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :param outputpath: path of the folder containing the output folder of the run
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :return: preview.ReportPreview of the reports of the run
+    """
+    # Imports the report engine, so only import it once a run is analysed
+    from preview import ReportPreview
+    return ReportPreview(outputpath, miseqfolder,
+                         sample_sheet=find_samplesheet(miseqpath, miseqfolder, outputpath, customsamplesheet))
+
+
+def watch_reports(preview, stop, interval, on_preview=None, merge=None):
+    """
+    Update the preview of the reports of a run whenever they change, until stopped, and once more at the end
+    :param preview: preview.ReportPreview of the run
+    :param stop: threading.Event set once the pipeline has finished
+    :param interval: seconds between checks of the reports
+    :param on_preview: function called with the name of the run and the path of the HTML preview when it changes
+    :param merge: function that combines the reports of the shards of the run, if it is sharded
+    """
+    while True:
+        stopped = stop.wait(interval)
+        try:
+            if merge is not None:
+                merge()
+            if preview.update():
+                path = preview.write_html()
+                if on_preview is not None:
+                    on_preview(preview.miseqfolder, path)
+        except (IOError, OSError) as error:
+            # The preview is a convenience; never let it interrupt the analysis
+            print('Could not update the preview of {mf}: {error}'.format(mf=preview.miseqfolder, error=error))
+        if stopped:
+            return
+
+
+class Batch(object):
+
+    def main(self):
+        self.validate()
+        try:
+            self.analyse()
+        finally:
+            self.engine.close()
+        self.summarise()
+
+    def validate(self):
+        """
+        Ensure that each run folder can be analysed. Invalid runs are reported, and skipped
+        """
+        for miseqfolder in self.miseqfolders:
+            try:
+                if not self.report_only:
+                    runfolder.validate(self.miseqpath, miseqfolder)
+                    sample_sheet = find_samplesheet(self.miseqpath, miseqfolder, self.outputpath,
+                                                    self.customsamplesheet)
+                    if not os.path.isfile(sample_sheet):
+                        raise FileNotFoundError('No sample sheet {ss}!'.format(ss=sample_sheet))
+                    if not read_samplesheet(sample_sheet).samples:
+                        raise ValueError('No samples in the [Data] section of {ss}'.format(ss=sample_sheet))
+                self.valid.append(miseqfolder)
+            except (OSError, ValueError) as error:
+                print('{mf}: {e}'.format(mf=miseqfolder, e=error), file=sys.stderr)
+                self.failed.append(miseqfolder)
+
+    def analyse(self):
+        """
+        Queue each valid run, and wait for all of them to finish. In report only mode, compile the GARs on a pool
+        of processes instead
+        """
+        if self.report_only:
+            for miseqfolder, _, error in create_reports(self.miseqpath, self.valid, self.outputpath,
+                                                        customsamplesheet=self.customsamplesheet,
+                                                        workers=self.jobs,
+                                                        on_result=self.report_status):
+                if error:
+                    self.failed.append(miseqfolder)
+            return
+        queue = jobqueue.JobQueue(workers=self.jobs, on_status=self.status)
+        for miseqfolder in self.valid:
+            # Each shard of a run is analysed at once, so occupies a worker of the queue
+            queue.submit(miseqfolder, self.sippr, slots=self.shards or queue.workers)
+        queue.wait()
+        queue.shutdown()
+        for job in queue.jobs:
+            if job.status != jobqueue.DONE:
+                self.failed.append(job.miseqfolder)
+
+    def sippr(self, job):
+        """
+        Analyse a single queued run
+        :param job: jobqueue.Job of the run folder
+        :return: exit status of the pipeline
+        """
+        return analyse(job, self.miseqpath, self.outputpath,
+                       customsamplesheet=self.customsamplesheet,
+                       on_output=lambda line: self.output(job.miseqfolder, line),
+                       on_status=self.exit_status,
+                       metrics=self.metrics,
+                       engine=self.engine,
+                       shards=self.shards,
+                       resume=self.resume)
+
+    def report_status(self, result):
+        """
+        Print the outcome of creating the GAR of a run
+        :param result: tuple of name of the run, path of the PDF (or None), and the traceback of any error
+        """
+        miseqfolder, pdf, error = result
+        with self.lock:
+            if error:
+                print('{mf}: failed\n{e}'.format(mf=miseqfolder, e=error), file=sys.stderr)
+            else:
+                print('{mf}: {pdf}'.format(mf=miseqfolder, pdf=pdf))
+
+    def output(self, miseqfolder, line):
+        """
+        Print a line written by the pipeline, prefixed with the name of its run
+        :param miseqfolder: name of the MiSeq run folder
+        :param line: line of output
+        """
+        if not self.quiet:
+            with self.lock:
+                sys.stdout.write('[{mf}] {line}'.format(mf=miseqfolder, line=line))
+                sys.stdout.flush()
+
+    def exit_status(self, miseqfolder, returncode, stderr):
+        """
+        Print the end of stderr of a failed analysis
+        :param miseqfolder: name of the MiSeq run folder
+        :param returncode: exit status of the pipeline
+        :param stderr: final lines written to stderr
+        """
+        if returncode != 0:
+            with self.lock:
+                print('{mf}: pipeline exited with status {rc}\n{stderr}'
+                      .format(mf=miseqfolder, rc=returncode, stderr=stderr), file=sys.stderr)
+
+    def status(self, job):
+        """
+        Print changes in the status of the queued runs
+        :param job: jobqueue.Job whose status changed
+        """
+        with self.lock:
+            print('{mf}: {status}'.format(mf=job.miseqfolder, status=job.status))
+            if job.error:
+                print(job.error, file=sys.stderr)
+
+    def summarise(self):
+        """
+        Print the runs that could not be analysed
+        """
+        if self.failed:
+            print('Failed: {}'.format(', '.join(self.failed)), file=sys.stderr)
+        else:
+            print('All {} runs completed'.format(len(self.valid)))
+
+    def __init__(self, args):
+        self.miseqpath = os.path.join(args.miseqpath)
+        self.outputpath = os.path.join(args.outputpath)
+        self.customsamplesheet = args.customsamplesheet
+        self.miseqfolders = [os.path.basename(os.path.normpath(folder)) for folder in args.miseqfolders]
+        self.jobs = args.jobs
+        self.report_only = args.report_only
+        self.quiet = args.quiet
+        self.valid = list()
+        self.failed = list()
+        self.lock = threading.Lock()
+        self.metrics = run_metrics(self.outputpath)
+        self.shards = getattr(args, 'shards', 1)
+        self.resume = not getattr(args, 'fresh', False)
+        engine = getattr(args, 'engine', 'auto')
+        if engine == 'docker':
+            self.engine = DockerEngine()
+        elif engine == 'cli':
+            self.engine = CLIEngine()
+        elif engine == 'local':
+            self.engine = LocalEngine(args.sipprverse)
+        else:
+            self.engine = default_engine()
+        self.main()
+
+
+def cli(argv=None):
+    """
+    Parse the command line, and analyse the requested runs
+    :param argv: list of arguments. Taken from sys.argv if None
+    :return: exit status; 1 if any run failed
+    """
+    parser = ArgumentParser(description='Analyse MiSeq runs with the sipprverse, and create their GARs, without '
+                                        'starting the GUI')
+    parser.add_argument('miseqfolders',
+                        nargs='+',
+                        help='Names of (or paths to) the MiSeq run folders to analyse')
+    parser.add_argument('-o', '--outputpath',
+                        required=True,
+                        help='Path to directory in which report folder is to be created')
+    parser.add_argument('-m', '--miseqpath',
+                        required=True,
+                        help='Path of the folder containing MiSeq run data folder')
+    parser.add_argument('-c', '--customsamplesheet',
+                        help='Path of folder containing a custom sample sheet (still must be named "SampleSheet.csv")')
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        help='Maximum number of runs to analyse at once (or, with --report_only, the number of '
+                             'processes compiling GARs). Determined from the available cores and memory if not '
+                             'provided')
+    parser.add_argument('-r', '--report_only',
+                        action='store_true',
+                        help='Only create the GARs of runs that have already been analysed, compiling them '
+                             'concurrently')
+    parser.add_argument('-e', '--engine',
+                        choices=['auto', 'docker', 'cli', 'local'],
+                        default='auto',
+                        help='How to run the sipprverse: through the docker socket (exec\'ing runs into a warm '
+                             'container), with the docker command line, or with a local installation given by '
+                             '--sipprverse. Default is the socket if it is accessible, otherwise the command line')
+    parser.add_argument('-s', '--sipprverse',
+                        help='Path of method.py of a local sipprverse installation (or a stand-in script), for '
+                             '--engine local')
+    parser.add_argument('-k', '--shards',
+                        type=int,
+                        default=1,
+                        help='Split the samples of each run into this many shards, analysed at once in separate '
+                             'containers and merged for the GAR. 0 to use as many shards as the cores and memory '
+                             'of the host allow. Default is 1 (no sharding)')
+    parser.add_argument('-f', '--fresh',
+                        action='store_true',
+                        help='Analyse every sample again, rather than resuming from the checkpoint of each run. '
+                             'The checkpoint records samples with results in every report, and the sipprverse '
+                             'writes each report for all the samples of a run (or shard) at once, so a run is '
+                             'resumed at the granularity of its shards. Stages within the pipeline are always '
+                             'redone')
+    parser.add_argument('-q', '--quiet',
+                        action='store_true',
+                        help='Do not print the output of the pipeline')
+    args = parser.parse_args(argv)
+    if args.engine == 'local' and not args.sipprverse:
+        parser.error('--engine local requires --sipprverse')
+    batch = Batch(args)
+    return 1 if batch.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
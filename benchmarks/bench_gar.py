@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark the steps of GAR creation on synthetic runs of increasing size. Each result is written as a line of
+JSON, so that the output of successive runs can be compared to track regressions. Runs offline; PDF compilation is
+only timed if pdflatex is installed.
+
+python benchmarks/bench_gar.py -o bench_gar.jsonl
+"""
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime
+import statistics
+import subprocess
+import tempfile
+import platform
+import random
+import shutil
+import time
+import json
+import sys
+import os
+
+testpath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(testpath))
+import gar
+__author__ = 'adamkoziol'
+
+MISEQFOLDER = '000000_M00000_0000_000000000-BENCH'
+GENERA = ('Escherichia', 'Listeria', 'Salmonella', 'Campylobacter', 'Vibrio')
+SIXTEENS_HEADERS = ('Strain', 'Gene', 'PercentIdentity', 'Genus', 'FoldCoverage')
+GDCS_HEADERS = ('Strain', 'Genus', 'Matches', 'MeanCoverage', 'Pass/Fail')
+MARKERS = ('eae', 'O26', 'O45', 'O103', 'O111', 'O121', 'O145', 'O157', 'VT1', 'VT2', 'VT2f', 'uidA', 'hlyA', 'IGS',
+           'inlJ', 'invA', 'stn')
+
+
+def sample_name(index):
+    """
+    :param index: number of the sample
+    :return: SEQID-style name of the sample
+    """
+    return '2018-SEQ-{:05d}'.format(index)
+
+
+def write_samplesheet(path, samples):
+    """
+    Write a MiSeq sample sheet listing the supplied number of samples
+    :param path: path of the sample sheet
+    :param samples: number of samples
+    """
+    with open(path, 'w') as sample_sheet:
+        sample_sheet.write('[Header]\nIEMFileVersion,4\nInvestigator Name,bench\nExperiment Name,bench\n'
+                           'Date,2018-01-01\nWorkflow,GenerateFASTQ\n\n[Reads]\n301\n301\n\n[Settings]\n'
+                           'ReverseComplement,0\n\n[Data]\n'
+                           'Sample_ID,Sample_Name,Sample_Plate,Sample_Well,I7_Index_ID,index,I5_Index_ID,index2,'
+                           'Sample_Project,Description\n')
+        for index in range(samples):
+            sample_sheet.write('{name},{name},,,N701,TAAGGCGA,S502,CTCTCTAT,bench,\n'
+                               .format(name=sample_name(index)))
+
+
+def write_reports(folder, samples, seed=0):
+    """
+    Write genesippr.csv, sixteens_full.csv, and GDCS.csv reports with random results for each sample
+    :param folder: reports folder
+    :param samples: number of samples
+    :param seed: seed for the random number generator, so that fixtures are reproducible
+    """
+    rng = random.Random(seed)
+    markers = list(MARKERS)
+    with open(os.path.join(folder, 'genesippr.csv'), 'w') as genesippr, \
+            open(os.path.join(folder, 'sixteens_full.csv'), 'w') as sixteens, \
+            open(os.path.join(folder, 'GDCS.csv'), 'w') as gdcs:
+        genesippr.write(','.join(['Strain', 'Genus'] + markers) + '\n')
+        sixteens.write(','.join(SIXTEENS_HEADERS) + '\n')
+        gdcs.write(','.join(GDCS_HEADERS) + '\n')
+        for index in range(samples):
+            name = sample_name(index)
+            genus = rng.choice(GENERA)
+            hits = ['{:.2f}%'.format(rng.uniform(90, 100)) if rng.random() < 0.3 else '' for _ in markers]
+            genesippr.write(','.join([name, genus] + hits) + '\n')
+            sixteens.write('{},{}_16S,{:.2f}%,{},{:.1f}\n'
+                           .format(name, genus, rng.uniform(95, 100), genus, rng.uniform(10, 200)))
+            gdcs.write('{},{},{}/{},{:.1f},{}\n'
+                       .format(name, genus, rng.randint(40, 50), 50, rng.uniform(10, 200),
+                               rng.choice(('+', '-'))))
+
+
+def make_run(folder, samples):
+    """
+    Create the output folder of a synthetic analysed run
+    :param folder: folder in which the run output is to be created
+    :param samples: number of samples
+    :return: object with the attributes expected by GAR
+    """
+    reports = os.path.join(folder, MISEQFOLDER, 'reports')
+    os.makedirs(reports)
+    write_reports(reports, samples)
+    sample_sheet = os.path.join(folder, MISEQFOLDER, 'SampleSheet.csv')
+    write_samplesheet(sample_sheet, samples)
+
+    class Inputs(object):
+        miseqfolder = MISEQFOLDER
+        outputfolder = folder
+        samplesheet = sample_sheet
+    return Inputs()
+
+
+class BenchGAR(gar.GAR):
+    """
+    GAR that does not run its steps on creation, so that they can be timed individually
+    """
+    def main(self):
+        pass
+
+
+def timed(function, *args, **kwargs):
+    """
+    :return: seconds taken to call the function with the supplied arguments
+    """
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        return time.perf_counter() - start
+
+
+def commit():
+    """
+    :return: the current git commit of the repository, or an empty string
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=testpath,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return str()
+
+
+def benchmark(samples, repeats, pdf):
+    """
+    Time each step of GAR creation for a synthetic run
+    :param samples: number of samples in the run
+    :param repeats: number of times to repeat each measurement
+    :param pdf: Boolean of whether to time PDF compilation
+    :return: dictionary of step name: list of timings in seconds, or None if the step was skipped
+    """
+    timings = {'sample_names': list(), 'extract_report_data': list(), 'create_gar_tex': list(),
+               'create_gar_pdf': list() if pdf else None}
+    for _ in range(repeats):
+        folder = tempfile.mkdtemp(prefix='bench_gar_')
+        try:
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                report = BenchGAR(make_run(folder, samples))
+            # Always compile, rather than re-using the PDF of an earlier repeat
+            report.pdf_cache = None
+            timings['sample_names'].append(timed(report.sample_names))
+            timings['extract_report_data'].append(timed(report.extract_report_data))
+            timings['create_gar_tex'].append(timed(report.create_gar, compile_pdf=False))
+            if pdf:
+                timings['create_gar_pdf'].append(timed(report.create_gar))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+    return timings
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark GAR creation with synthetic run data')
+    parser.add_argument('-s', '--samples',
+                        type=int,
+                        nargs='+',
+                        default=[10, 100, 1000, 10000],
+                        help='Numbers of samples in the synthetic runs')
+    parser.add_argument('-r', '--repeats',
+                        type=int,
+                        default=3,
+                        help='Number of times to repeat each measurement')
+    parser.add_argument('-n', '--no_pdf',
+                        action='store_true',
+                        help='Do not time PDF compilation, even if pdflatex is available')
+    parser.add_argument('-o', '--output',
+                        help='JSON lines file to which results are appended. Written to stdout if not provided')
+    args = parser.parse_args(argv)
+    pdf = not args.no_pdf and shutil.which('pdflatex') is not None
+    context = {
+        'date': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit(),
+        'python': platform.python_version(),
+        'pandas': gar.pandas.__version__,
+        'host': platform.node()
+    }
+    output = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        for samples in args.samples:
+            for step, timings in sorted(benchmark(samples, args.repeats, pdf).items()):
+                result = dict(context, benchmark=step, samples=samples)
+                if timings is None:
+                    result['skipped'] = 'pdflatex not available' if not args.no_pdf else 'disabled'
+                else:
+                    result.update(repeats=len(timings), min=min(timings), median=statistics.median(timings),
+                                  max=max(timings))
+                output.write(json.dumps(result, sort_keys=True) + '\n')
+                output.flush()
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark GUI startup: the time to import gui.py, and the time until the main window has been shown and the event
+loop is running. Each measurement is taken in a fresh interpreter, so module caches are not shared between
+repeats. Each result is written as a line of JSON, so that the output of successive runs can be compared to track
+regressions. Runs without a display using the offscreen Qt platform.
+
+python benchmarks/bench_startup.py -o bench_startup.jsonl
+"""
+from argparse import ArgumentParser
+from datetime import datetime
+import statistics
+import subprocess
+import tempfile
+import platform
+import shutil
+import json
+import sys
+import os
+
+testpath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(testpath))
+
+# Modules that should not be imported before the first window is shown
+HEAVY_MODULES = ['gar', 'pandas', 'pylatex', 'results_db']
+
+# Run in a fresh interpreter: prints a JSON dictionary of the startup timings
+STARTUP = """
+import time
+start = time.perf_counter()
+import json
+import sys
+sys.path.insert(0, {root!r})
+from argparse import Namespace
+import gui
+imported = time.perf_counter()
+app = gui.QApplication(sys.argv)
+window = gui.GUI(Namespace(miseqpath={miseqpath!r}, outputpath={outputpath!r}, customsamplesheet=None, jobs=1))
+window.show()
+timings = dict()
+
+
+def shown():
+    timings.update(import_gui=imported - start, first_window=time.perf_counter() - start,
+                   loaded=[module for module in {heavy!r} if module in sys.modules])
+    print(json.dumps(timings))
+    window.queue.shutdown(cancel=True)
+    app.quit()
+
+
+gui.QTimer.singleShot(0, shown)
+app.exec_()
+window.threadpool.waitForDone()
+"""
+
+
+def startup(folder):
+    """
+    Start the GUI in a new interpreter, and close it once the window is shown
+    :param folder: temporary folder for the MiSeq and output folders
+    :return: dictionary of import_gui and first_window in seconds, and the heavy modules that were loaded
+    """
+    miseqpath = os.path.join(folder, 'miseq')
+    outputpath = os.path.join(folder, 'output')
+    os.makedirs(miseqpath, exist_ok=True)
+    os.makedirs(outputpath, exist_ok=True)
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    # Keep the cache of run metadata out of the home folder
+    env['HOME'] = folder
+    script = STARTUP.format(root=os.path.dirname(testpath), miseqpath=miseqpath, outputpath=outputpath,
+                            heavy=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', script], env=env, stderr=subprocess.DEVNULL)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def commit():
+    """
+    :return: the current git commit of the repository, or an empty string
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=testpath,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return str()
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark the time taken for the GUI to show its window')
+    parser.add_argument('-r', '--repeats',
+                        type=int,
+                        default=5,
+                        help='Number of times to start the GUI')
+    parser.add_argument('-o', '--output',
+                        help='JSON lines file to which results are appended. Written to stdout if not provided')
+    args = parser.parse_args(argv)
+    context = {
+        'date': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit(),
+        'python': platform.python_version(),
+        'host': platform.node()
+    }
+    timings = {'import_gui': list(), 'first_window': list()}
+    loaded = set()
+    for _ in range(args.repeats):
+        folder = tempfile.mkdtemp(prefix='bench_startup_')
+        try:
+            result = startup(folder)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+        for step in timings:
+            timings[step].append(result[step])
+        loaded.update(result['loaded'])
+    output = open(args.output, 'a') if args.output else sys.stdout
+    try:
+        for step, values in sorted(timings.items()):
+            result = dict(context, benchmark=step, repeats=len(values), min=min(values),
+                          median=statistics.median(values), max=max(values), heavy_modules=sorted(loaded))
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+from shards import REPORT_FILES
+import threading
+import hashlib
+import json
+import time
+import csv
+import os
+__author__ = 'adamkoziol'
+
+MANIFEST = 'checkpoint.json'
+# Increment whenever the contents of the manifest change, so that older manifests are ignored
+MANIFEST_VERSION = 1
+
+
+def row_hash(row):
+    """
+    :param row: dictionary of the header: value of each cell of a row of a report
+    :return: hexadecimal SHA-256 digest of the non-empty cells of the row, which does not depend on the order of the
+    columns, or on blank columns added when reports are merged
+    """
+    return hashlib.sha256(json.dumps(sorted((key, value) for key, value in row.items() if value),
+                                     sort_keys=True).encode()).hexdigest()
+
+
+def file_stamp(path):
+    """
+    :param path: path of a report
+    :return: list of the modification time in nanoseconds and the size of the report, or None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def sample_hash(sample):
+    """
+    :param sample: samplesheet.Sample
+    :return: hexadecimal SHA-256 digest of every field of the sample in the sample sheet
+    """
+    return hashlib.sha256(json.dumps(list(sample.fields.items())).encode()).hexdigest()
+
+
+class Checkpoint(object):
+    """
+    Manifest of the samples of a run that have been analysed completely, i.e. that have a row in every report. Each
+    sample is recorded with the hash of its sample sheet entry and of each of its report rows, so that a sample
+    whose entry or results have since changed is analysed again
+    """
+
+    def report_stamps(self):
+        """
+        :return: dictionary of report file: file_stamp of the report (None if it does not exist), for the reports of
+        the run
+        """
+        return {report_file: file_stamp(os.path.join(self.reportpath, report_file))
+                for report_file in self.report_files}
+
+    def report_rows(self, before=None):
+        """
+        :param before: report_stamps of the reports before an analysis started. Reports that are unchanged since
+        were left by an earlier analysis, and are treated as missing. Every report is read if None
+        :return: dictionary of report file: dictionary of sample: row hash, for the reports of the run
+        """
+        rows = dict()
+        stamps = self.report_stamps() if before is not None else dict()
+        for report_file in self.report_files:
+            rows[report_file] = dict()
+            if before is not None and stamps[report_file] == before.get(report_file):
+                continue
+            try:
+                with open(os.path.join(self.reportpath, report_file), newline='') as report:
+                    for row in csv.DictReader(report):
+                        rows[report_file][row.get('Strain')] = row_hash(row)
+            except FileNotFoundError:
+                pass
+        return rows
+
+    def record(self, samples, before=None):
+        """
+        Add the samples that have results in every report of the run to the manifest
+        :param samples: list of samplesheet.Sample
+        :param before: report_stamps of the reports before the analysis of the samples started, so that only the
+        rows written by an analysis that did not finish are used. Every report is used if None
+        :return: list of the IDs of the recorded samples
+        """
+        rows = self.report_rows(before)
+        recorded = list()
+        with self.lock:
+            for sample in samples:
+                hashes = {report_file: rows[report_file].get(sample.sample_id) for report_file in self.report_files}
+                if all(hashes.values()):
+                    self.samples[sample.sample_id] = {'sample': sample_hash(sample),
+                                                      'reports': hashes,
+                                                      'completed': time.time()}
+                    recorded.append(sample.sample_id)
+            self.save()
+        return recorded
+
+    def completed(self, samples):
+        """
+        :param samples: list of samplesheet.Sample
+        :return: list of the IDs of the samples that are recorded, and whose sample sheet entry and results are
+        unchanged since
+        """
+        rows = self.report_rows()
+        with self.lock:
+            return [sample.sample_id for sample in samples
+                    if sample.sample_id in self.samples
+                    and self.samples[sample.sample_id]['sample'] == sample_hash(sample)
+                    and all(rows[report_file].get(sample.sample_id) == digest
+                            for report_file, digest in self.samples[sample.sample_id]['reports'].items())]
+
+    def load(self):
+        """
+        Read the manifest of the run, if there is one
+        """
+        try:
+            with open(self.path) as manifest:
+                data = json.load(manifest)
+        except (IOError, ValueError):
+            return
+        if data.get('version') == MANIFEST_VERSION:
+            self.samples = data.get('samples', dict())
+
+    def save(self):
+        """
+        Write the manifest atomically, so that it is never left partially written if the application is closed
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temporary, 'w') as manifest:
+            json.dump({'version': MANIFEST_VERSION, 'samples': self.samples}, manifest, indent=1, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def reset(self):
+        """
+        Forget every recorded sample, so that the whole run is analysed again
+        """
+        with self.lock:
+            self.samples = dict()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __init__(self, outputpath, miseqfolder, report_files=REPORT_FILES):
+        """
+        :param outputpath: path of the folder containing the output folder of the run
+        :param miseqfolder: name of the MiSeq run folder
+        :param report_files: reports in which a sample must have a row to be complete
+        """
+        self.path = os.path.join(outputpath, miseqfolder, MANIFEST)
+        self.reportpath = os.path.join(outputpath, miseqfolder, 'reports')
+        self.report_files = report_files
+        self.samples = dict()
+        self.lock = threading.Lock()
+        self.load()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+from contextlib import contextmanager
+from urllib.parse import quote, urlencode
+from collections import deque
+import http.client
+import threading
+import socket
+import struct
+import json
+__author__ = 'adamkoziol'
+
+DOCKER_SOCKET = '/var/run/docker.sock'
+# Oldest version of the Engine API with every endpoint used here. Requests use the version reported by the engine,
+# as current engines refuse versions they consider too old
+MIN_API_VERSION = '1.24'
+
+
+def version_tuple(version):
+    """
+    :param version: version of the Engine API e.g. 1.43
+    :return: tuple of the integer parts of the version, for comparison
+    """
+    try:
+        return tuple(int(part) for part in version.split('.'))
+    except (AttributeError, ValueError):
+        return tuple()
+
+
+class DockerError(Exception):
+    """
+    The container engine could not be reached, or refused a request
+    """
+
+    def __init__(self, message, status=None):
+        super(DockerError, self).__init__(message)
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection over a UNIX domain socket
+    """
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+    def __init__(self, socket_path, timeout=None):
+        super(UnixHTTPConnection, self).__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+
+def demultiplex(response):
+    """
+    Split the output of a container run without a TTY into its streams. Each frame has an eight byte header of the
+    stream (1: stdout, 2: stderr), three bytes of padding, and the big-endian length of the payload
+    :param response: streaming http.client.HTTPResponse of an attach or exec start request
+    :return: generator of tuples of stream number and payload bytes
+    """
+    while True:
+        header = response.read(8)
+        if len(header) < 8:
+            return
+        stream, length = struct.unpack('>BxxxL', header)
+        payload = response.read(length)
+        if payload:
+            yield stream, payload
+
+
+class DockerClient(object):
+    """
+    Client of the Docker Engine API on its UNIX socket. Connections are kept open and re-used between requests, so
+    that each request does not pay for a new connection, and the client can be shared between threads
+    """
+
+    def connection(self):
+        """
+        :return: an idle pooled connection, or a new connection if there are none
+        """
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        return UnixHTTPConnection(self.socket_path, timeout=self.timeout), False
+
+    def release(self, connection):
+        """
+        Return a connection to the pool, or close it if the pool is full
+        :param connection: UnixHTTPConnection whose response has been read completely
+        """
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def api_version(self):
+        """
+        Ask the engine for the version of its API the first time it is needed. The version endpoint is not versioned,
+        so it can be reached whatever the version of the engine
+        :return: version of the Engine API to use in request paths e.g. 1.43
+        """
+        with self.lock:
+            if self.version is not None:
+                return self.version
+        reported = self.request('GET', '/version', versioned=False)
+        version = reported.get('ApiVersion') if isinstance(reported, dict) else None
+        if version_tuple(version) < version_tuple(MIN_API_VERSION):
+            raise DockerError('The container engine reports API version {version}; at least {minimum} is required'
+                              .format(version=version, minimum=MIN_API_VERSION))
+        with self.lock:
+            self.version = version
+        return version
+
+    def send(self, method, path, params=None, body=None, versioned=True):
+        """
+        Send a request, retrying on another connection if a pooled connection had been closed by the engine
+        :param versioned: Boolean of whether to prefix the path with the version of the API used by the engine
+        :return: tuple of the connection and its http.client.HTTPResponse
+        """
+        url = '/v{version}{path}'.format(version=self.api_version(), path=path) if versioned else path
+        if params:
+            url += '?' + urlencode(params)
+        headers = dict()
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        while True:
+            connection, pooled = self.connection()
+            try:
+                connection.request(method, url, body=payload, headers=headers)
+                response = connection.getresponse()
+            except (http.client.HTTPException, OSError) as error:
+                connection.close()
+                if pooled:
+                    continue
+                raise DockerError('Could not reach the container engine at {socket}: {error}'
+                                  .format(socket=self.socket_path, error=error))
+            if response.status >= 400:
+                message = response.read().decode('utf-8', errors='replace')
+                self.release(connection)
+                try:
+                    message = json.loads(message).get('message', message)
+                except ValueError:
+                    pass
+                raise DockerError('{method} {path}: {message}'.format(method=method, path=path, message=message),
+                                  status=response.status)
+            return connection, response
+
+    def request(self, method, path, params=None, body=None, versioned=True):
+        """
+        Make a request, and read the whole of its response
+        :param method: HTTP method
+        :param path: path of the endpoint, without the API version
+        :param params: dictionary of query parameters
+        :param body: object sent as JSON
+        :param versioned: Boolean of whether to prefix the path with the version of the API used by the engine
+        :return: the decoded JSON response, or the raw bytes if the response is not JSON
+        """
+        connection, response = self.send(method, path, params, body, versioned)
+        data = response.read()
+        self.release(connection)
+        if data and response.getheader('Content-Type', '').startswith('application/json'):
+            return json.loads(data.decode())
+        return data
+
+    @contextmanager
+    def stream(self, method, path, params=None, body=None):
+        """
+        Make a request whose response is read as it arrives. The engine takes over the connection for the output
+        of the container, so it is closed rather than returned to the pool
+        :return: context manager of the http.client.HTTPResponse
+        """
+        connection, response = self.send(method, path, params, body)
+        try:
+            yield response
+        finally:
+            connection.close()
+
+    def ping(self):
+        """
+        :return: Boolean of whether the engine is reachable, and supports the version of the API used here
+        """
+        try:
+            return self.request('GET', '/_ping', versioned=False) == b'OK' and bool(self.api_version())
+        except DockerError:
+            return False
+
+    def inspect_image(self, image):
+        """
+        :param image: name or ID of the image
+        :return: dictionary of the details of the image
+        """
+        return self.request('GET', '/images/{}/json'.format(quote(image, safe='/:@')))
+
+    def pull(self, image):
+        """
+        Pull an image from its registry
+        :param image: name of the image e.g. olcbioinformatics/sipprverse:latest
+        """
+        repository, _, tag = image.rpartition(':')
+        if not repository or '/' in tag:
+            repository, tag = image, 'latest'
+        # The progress of the pull is streamed as JSON lines; failures are reported in the stream
+        connection, response = self.send('POST', '/images/create', params={'fromImage': repository, 'tag': tag})
+        data = response.read()
+        self.release(connection)
+        for line in data.splitlines():
+            try:
+                progress = json.loads(line.decode())
+            except ValueError:
+                continue
+            if 'error' in progress:
+                raise DockerError('Could not pull {image}: {error}'.format(image=image, error=progress['error']))
+
+    def create_container(self, image, command, binds=None, labels=None):
+        """
+        :param image: name, ID, or digest of the image
+        :param command: list of the command and its arguments
+        :param binds: list of host:container bind mounts
+        :param labels: dictionary of labels of the container
+        :return: ID of the created container
+        """
+        return self.request('POST', '/containers/create', body={
+            'Image': image,
+            'Cmd': command,
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'Tty': False,
+            'Labels': labels or dict(),
+            'HostConfig': {'Binds': binds or list()}
+        })['Id']
+
+    def inspect_container(self, container):
+        """
+        :param container: ID of the container
+        :return: dictionary of the details of the container
+        """
+        return self.request('GET', '/containers/{}/json'.format(container))
+
+    def start(self, container):
+        """
+        :param container: ID of the created container
+        """
+        self.request('POST', '/containers/{}/start'.format(container))
+
+    def attach(self, container):
+        """
+        :param container: ID of the container
+        :return: context manager of the streaming response of the stdout and stderr of the container
+        """
+        return self.stream('POST', '/containers/{}/attach'.format(container),
+                           params={'stream': 1, 'stdout': 1, 'stderr': 1})
+
+    def wait(self, container):
+        """
+        :param container: ID of the container
+        :return: exit status of the container once it stops
+        """
+        return self.request('POST', '/containers/{}/wait'.format(container))['StatusCode']
+
+    def kill(self, container, signal='SIGTERM'):
+        """
+        :param container: ID of the running container
+        :param signal: name of the signal to send to the main process of the container
+        """
+        self.request('POST', '/containers/{}/kill'.format(container), params={'signal': signal})
+
+    def remove(self, container, force=True):
+        """
+        :param container: ID of the container
+        :param force: Boolean of whether to kill the container first if it is running
+        """
+        self.request('DELETE', '/containers/{}'.format(container), params={'force': int(force), 'v': 1})
+
+    def exec_create(self, container, command):
+        """
+        :param container: ID of a running container
+        :param command: list of the command and its arguments
+        :return: ID of the exec instance
+        """
+        return self.request('POST', '/containers/{}/exec'.format(container), body={
+            'Cmd': command,
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'Tty': False
+        })['Id']
+
+    def exec_start(self, exec_id):
+        """
+        :param exec_id: ID of the exec instance
+        :return: context manager of the streaming response of the stdout and stderr of the command
+        """
+        return self.stream('POST', '/exec/{}/start'.format(exec_id), body={'Detach': False, 'Tty': False})
+
+    def exec_detached(self, container, command):
+        """
+        Run a command in a running container without waiting for it
+        :param container: ID of a running container
+        :param command: list of the command and its arguments
+        """
+        exec_id = self.exec_create(container, command)
+        self.request('POST', '/exec/{}/start'.format(exec_id), body={'Detach': True, 'Tty': False})
+
+    def exec_inspect(self, exec_id):
+        """
+        :param exec_id: ID of the exec instance
+        :return: dictionary of the details of the exec instance, including its ExitCode once it has finished
+        """
+        return self.request('GET', '/exec/{}/json'.format(exec_id))
+
+    def close(self):
+        """
+        Close every pooled connection
+        """
+        with self.lock:
+            while self.idle:
+                self.idle.pop().close()
+
+    def __init__(self, socket_path=DOCKER_SOCKET, pool_size=4, timeout=None):
+        """
+        :param socket_path: path of the UNIX socket of the engine
+        :param pool_size: maximum number of idle connections to keep open
+        :param timeout: seconds to wait on the socket. None to wait indefinitely, as waiting on a container
+        blocks until it exits
+        """
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.idle = deque()
+        self.lock = threading.Lock()
+        # Version of the API reported by the engine, once it has been asked
+        self.version = None
@@ -1,75 +1,138 @@
 #!/usr/bin/env/python3
-from pylatex.utils import italic, bold
+from pylatex.utils import italic, bold, escape_latex
 import pylatex
 from datetime import datetime
+from pdfcache import PDFCache
+from reportcache import ReportCache
+from samplesheet import read_samplesheet
+from metrics import Metrics
 import pandas
 import os
 __author__ = 'adamkoziol'
 
+# Increment whenever the layout of the report changes, so that previously cached PDFs are not re-used
+TEMPLATE_VERSION = 3
+
+# Each report is rendered as its own section of the GAR, in this order. The columns are the headers of the CSV
+# shown after the sample name, or None to show every column of the CSV. Only the values of reports that are normalised
+# are converted to marker presence (+) or absence (-); the values of the other reports are shown as written
+REPORT_SCHEMA = (
+    {
+        'name': 'genesippr',
+        'file': 'genesippr.csv',
+        'title': 'GeneSeekr Analysis',
+        'columns': ('Genus', 'eae', 'O26', 'O45', 'O103', 'O111', 'O121', 'O145', 'O157', 'VT1', 'VT2', 'VT2f',
+                    'uidA', 'hlyA', 'IGS', 'inlJ', 'invA', 'stn'),
+        'normalise': True,
+        'caption': '+ indicates marker presence : - indicates marker was not detected'
+    },
+    {
+        'name': 'sixteens_full',
+        'file': 'sixteens_full.csv',
+        'title': '16S Analysis',
+        'columns': None,
+        'normalise': False,
+        'caption': 'Closest 16S match, with its percent identity and fold coverage : - indicates no match'
+    },
+    {
+        'name': 'GDCS',
+        'file': 'GDCS.csv',
+        'title': 'GDCS Analysis',
+        'columns': None,
+        'normalise': False,
+        'caption': 'Genus-specific core genes matched, and their mean coverage : - indicates no value'
+    },
+)
+
+
+def read_report(path, report):
+    """
+    Read the columns of a report that are shown in the GAR. Reports that are not normalised are read as text, so that
+    their values are kept exactly as written
+    :param path: path of the CSV of the report
+    :param report: dictionary of the report in REPORT_SCHEMA
+    :return: pandas DataFrame of the report indexed by sample name
+    """
+    columns = report['columns']
+    usecols = None if columns is None else (lambda column: column == 'Strain' or column in columns)
+    dtype = None if report.get('normalise', True) else str
+    return pandas.read_csv(path, usecols=usecols, dtype=dtype).set_index('Strain')
+
 
 class GAR(object):
 
     def main(self):
-        self.file_assertions()
-        self.sample_names()
-        self.extract_report_data()
-        self.create_gar()
+        for step in (self.file_assertions, self.sample_names, self.extract_report_data, self.create_gar):
+            with self.metrics.stage(self.miseqfolder, step.__name__):
+                step()
 
     def file_assertions(self):
         """
-
+        Ensure that every report exists
+        :raises FileNotFoundError: if a report is missing
         """
         for report_name, report_file in self.report_dict.items():
-            assert os.path.isfile(report_file), 'No {rn}!'.format(rn=report_name)
+            if not os.path.isfile(report_file):
+                raise FileNotFoundError('No {rn}!'.format(rn=report_name))
 
     def sample_names(self):
         """
-        Extract the sample names from the SampleSheet
+        Extract the sample names from the SampleSheet, unless they were supplied
         """
-        with open(self.sample_sheet) as sample_sheet:
-            for line in sample_sheet:
-                if 'Sample_ID' in line:
-                    for subline in sample_sheet:
-                        data = subline.split(',')
-                        self.samples.append(data[0])
+        if not self.samples:
+            self.samples = read_samplesheet(self.sample_sheet).sample_ids()
 
     def extract_report_data(self):
         """
+        Read in each report, and convert the values of its cells to marker presence/absence. The normalised data
+        are cached beside the reports, so that they are only parsed again if a report changes. The data normalised
+        for the preview while the run was analysed are saved to the same cache, and are re-used from there
+        """
+        for report in self.report_schema:
+            report_name = report['name']
+            if report_name not in self.report_dict:
+                continue
+            report_file = self.report_dict[report_name]
+            # Each sample (Strain) is a row, and each header is a column
+            self.report_data[report_name] = self.report_cache.read(report, report_file).frame()
 
+    @staticmethod
+    def clean_report(report, normalise=True):
         """
-        for report_name, report_file in self.report_dict.items():
-            # Initialise a separate key for each report
-            self.report_data[report_name] = dict()
-            # Read in the report using pandas - convert it to a dictionary
-            dictionary = pandas.read_csv(report_file).set_index('Strain').to_dict()
-            # Iterate through the dictionary - each header from the CSV file
-            for header in dictionary:
-                # Sample is the primary key, and value is the value of the cell for that primary key + header combo
-                for sample, value in dictionary[header].items():
-                    if value == 'nan':
-                        clean_value = '-'
-                    elif type(value) is float:
-                        clean_value = '-'
-                    elif '%' in value:
-                        clean_value = '+'
-                    else:
-                        clean_value = value
-                    # Populate the dictionary with the variables
-                    try:
-                        self.report_data[report_name][sample].update({header: clean_value})
-                    except KeyError:
-                        self.report_data[report_name][sample] = dict()
-                        self.report_data[report_name][sample].update({header: clean_value})
-
-    def create_gar(self):
+        Convert the raw values of a report to presence (+) or absence (-) of each marker. Percentages (e.g. the
+        identity of a hit) indicate presence, and empty cells or numbers indicate absence. All other values
+        (e.g. Genus) are kept. Operates on whole columns rather than on individual cells
+        :param report: pandas DataFrame of a report indexed by sample name
+        :param normalise: boolean of whether to convert the values. If False, the values are kept as strings
+        :return: pandas DataFrame of strings with the same index and columns
+        """
+        # Keep the final entry for each sample, as the entries of repeated samples would overwrite each other
+        report = report[~report.index.duplicated(keep='last')]
+        if not normalise:
+            # Values are kept as written, and only converted to strings; empty cells remain missing
+            return report.astype(str).mask(report.isna())
+        missing = report.isna()
+        numeric = report.select_dtypes(include='number').columns
+        text = report.astype(str)
+        present = text.apply(lambda column: column.str.contains('%', regex=False))
+        clean = text.mask(present, '+').mask(missing, '-')
+        clean[numeric] = '-'
+        return clean
+
+    def create_gar(self, compile_pdf=True):
         """
         Create the genesippr analysis report (GAR) that summarises the
+        :param compile_pdf: Boolean of whether to compile the PDF with LaTeX, or to only write the .tex file
         """
         print('Maketh the report!')
-        # Date setup
-        date = datetime.today().strftime('%Y-%m-%d')
-        year = datetime.today().strftime('%Y')
-
+        if compile_pdf and self.pdf_cache is not None:
+            # The date of issue is printed in the header, so a PDF is only re-used on the day it was created
+            cache_key = self.pdf_cache.key(sorted(self.report_dict.values()) + [self.sample_sheet, self.get_image()],
+                                           self.report_schema, TEMPLATE_VERSION, self.date)
+            # Re-use the PDF created from identical inputs, rather than running LaTeX again
+            if self.pdf_cache.get(cache_key, '{}.pdf'.format(self.gar_path)):
+                print('{}.pdf'.format(self.gar_path))
+                return
         # Page setup
         geometry_options = {"tmargin": "2cm",
                             "lmargin": "1.8cm",
@@ -88,32 +151,94 @@ class GAR(object):
         # DOCUMENT BODY/CREATION
         with doc.create(pylatex.Section('GeneSippr Analysis Report', numbering=False)):
             doc.append('GeneSippr!')
-
-            with doc.create(pylatex.Subsection('GeneSeekr Analysis', numbering=False)) as genesippr_section:
-                with doc.create(pylatex.Tabular('|c|c|c|c|c|c|c|c|c|c|c|c|c|c|c|c|c|c|c|')) as table:
-                    # Header
-                    table.add_hline()
-                    table.add_row(self.genesippr_table_columns)
-                    for sample_name in self.samples:
-                        table_data = [sample_name]
-                        for data in self.genesippr_headers:
-                            try:
-                                print(sample_name, data, self.report_data['genesippr'][sample_name][data])
-                                table_data.append(self.report_data['genesippr'][sample_name][data])
-                            except KeyError:
-                                pass
-                        table.add_row(table_data)
-            self.create_caption(genesippr_section, 'a', "+ indicates marker presence : "
-                                                   "- indicates marker was not detected")
+            # Superscripts of the captions: a, b, c, ...
+            for superscript, report in zip('abcdefghijklmnopqrstuvwxyz', self.report_schema):
+                with doc.create(pylatex.Subsection(report['title'], numbering=False)) as report_section:
+                    self.report_table(doc, report_section, report)
+                self.create_caption(report_section, superscript, report['caption'])
 
         # Create the PDF
-        doc.generate_pdf('{}_{}_{}'
-                         .format(os.path.join('/home/adamkoziol/Bioinformatics/sippr/gui/161104_M02466_0002_000000000-AV4G5'), 'gar', date), clean_tex=False)
-        print('{}_{}_{}'.format(os.path.join('/home/adamkoziol/Bioinformatics/sippr/gui/161104_M02466_0002_000000000-AV4G5'), 'gar', date))
-        # for report_name in self.report_data:
-        #     for sample_name in self.samples:
-        #         for header, value in self.report_data[report_name][sample_name].items():
-        #             print(report_name, sample_name, header, value)
+        if compile_pdf:
+            doc.generate_pdf(self.gar_path, clean_tex=False)
+            print('{}.pdf'.format(self.gar_path))
+            if self.pdf_cache is not None:
+                self.pdf_cache.put(cache_key, '{}.pdf'.format(self.gar_path))
+        else:
+            doc.generate_tex(self.gar_path)
+
+    def report_columns(self, report):
+        """
+        Determine the columns of a report to display
+        :param report: report dictionary from the schema
+        :return: list of the configured columns present in the report, or all of its columns if none are configured
+        """
+        data = self.report_data[report['name']]
+        if report['columns'] is None:
+            return list(data.columns)
+        return [column for column in report['columns'] if column in data.columns]
+
+    def report_rows(self, report, columns):
+        """
+        Align a report with the sample sheet, selecting only the displayed columns
+        :param report: report dictionary from the schema
+        :param columns: list of the columns to display
+        :return: generator of lists of the sample name followed by the value of each column
+        """
+        rows = self.report_data[report['name']].reindex(index=self.samples, columns=columns).fillna('-')
+        for sample_name, table_data in zip(rows.index, rows.itertuples(index=False)):
+            yield [sample_name] + list(table_data)
+
+    def report_table(self, doc, section, report):
+        """
+        Add the table of a report to its section
+        :param doc: LaTeX document
+        :param section: LaTeX section object of the report
+        :param report: report dictionary from the schema
+        """
+        columns = self.report_columns(report)
+        column_spec = '|{}'.format('c|' * (len(columns) + 1))
+        header = [bold(column) for column in ['Strain'] + columns]
+        if len(self.samples) > self.longtable_threshold:
+            # Large runs are split across pages, and the rows are written straight to disk
+            doc.packages.append(pylatex.Package('longtable'))
+            self.stream_longtable(section, column_spec, header, self.report_rows(report, columns),
+                                  '{}_{}.tex'.format(self.gar_path, report['name']))
+        else:
+            with doc.create(pylatex.Tabular(column_spec)) as table:
+                # Header
+                table.add_hline()
+                table.add_row(header)
+                for table_data in self.report_rows(report, columns):
+                    table.add_row(table_data)
+
+    @staticmethod
+    def stream_longtable(section, column_spec, header, rows, rows_file):
+        """
+        Add a longtable, which LaTeX breaks across pages with the header repeated on each page, to a section. The
+        rows are written one at a time to a separate file that the document inputs, so that the table is never
+        held in memory as LaTeX objects
+        :param section: LaTeX section object
+        :param column_spec: LaTeX column specification
+        :param header: list of column headers formatted as LaTeX (e.g. with bold())
+        :param rows: iterable of lists of cell values
+        :param rows_file: path of the file to which the rows are written
+        """
+        header_row = ' & '.join(header)
+        with open(rows_file, 'w') as table_rows:
+            for row in rows:
+                table_rows.write(' & '.join(escape_latex(str(value)) for value in row))
+                table_rows.write(' \\\\ \\hline\n')
+        section.append(pylatex.NoEscape('\n'.join([
+            '\\begin{{longtable}}{{{}}}'.format(column_spec),
+            '\\hline',
+            '{} \\\\ \\hline'.format(header_row),
+            '\\endfirsthead',
+            '\\hline',
+            '{} \\\\ \\hline'.format(header_row),
+            '\\endhead',
+            '\\input{{{}}}'.format(os.path.basename(rows_file)),
+            '\\end{longtable}'
+        ])))
 
     def produce_header_footer(self):
         """
@@ -128,7 +253,7 @@ class GAR(object):
 
         # Date
         with header.create(pylatex.Head("R")):
-            header.append("Date Report Issued: " + datetime.today().strftime('%Y-%m-%d'))
+            header.append("Date Report Issued: " + self.date)
 
         # Footer
         with header.create(pylatex.Foot("C")):
@@ -167,66 +292,38 @@ class GAR(object):
         print(inputobject.miseqfolder)
         self.outputfolder = os.path.join(inputobject.outputfolder, inputobject.miseqfolder, 'reports')
         self.miseqfolder = os.path.join(inputobject.miseqfolder)
+        # Date the report was issued, shown in its header and in its name
+        self.date = datetime.today().strftime('%Y-%m-%d')
+        # The report is named after the run, and is written beside the output folder of the run
+        self.gar_path = '{}_{}_{}'.format(os.path.join(inputobject.outputfolder, inputobject.miseqfolder), 'gar',
+                                          self.date)
         self.sample_sheet = inputobject.samplesheet
-        self.report_dict = {
-            'genesippr': os.path.join(self.outputfolder, 'genesippr.csv'),
-            'sixteens_full': os.path.join(self.outputfolder, 'sixteens_full.csv'),
-            'GDCS': os.path.join(self.outputfolder, 'GDCS.csv')
-        }
+        # The reports to include may be overridden, e.g. to display a subset of the columns of a report
+        self.report_schema = getattr(inputobject, 'report_schema', None) or REPORT_SCHEMA
+        self.report_dict = {report['name']: os.path.join(self.outputfolder, report['file'])
+                            for report in self.report_schema}
         self.report_data = dict()
-        self.samples = list()
-        self.genesippr_headers = (
-            'Strain',
-            'Genus',
-            'eae',
-            'O26',
-            'O45',
-            'O103',
-            'O111',
-            'O121',
-            'O145',
-            'O157',
-            'VT1',
-            'VT2',
-            'VT2f',
-            'uidA',
-            'hlyA',
-            'IGS',
-            'inlJ',
-            'invA',
-            'stn'
-        )
-        self.genesippr_table_columns = [bold(x) for x in self.genesippr_headers]
-        # self.genesippr_table_columns = (
-        #     bold('Strain'),
-        #     bold('Genus'),
-        #     bold('eae'),
-        #     bold('O26'),
-        #     bold('O45'),
-        #     bold('O103'),
-        #     bold('O111'),
-        #     bold('O121'),
-        #     bold('O145'),
-        #     bold('O157'),
-        #     bold('VT1'),
-        #     bold('VT2'),
-        #     bold('VT2f'),
-        #     bold('uidA'),
-        #     bold('hlyA'),
-        #     bold('IGS'),
-        #     bold('inlJ'),
-        #     bold('invA'),
-        #     bold('stn')
-        # )
+        # Sample names already parsed from the sample sheet, e.g. by the process that started this one
+        self.samples = list(getattr(inputobject, 'samples', None) or list())
+        self.pdf_cache = PDFCache()
+        self.report_cache = ReportCache(self.outputfolder)
+        self.metrics = getattr(inputobject, 'metrics', None) or Metrics()
+        # Runs with more samples than this are rendered as a paginated longtable
+        self.longtable_threshold = 40
         self.main()
 
 
 if __name__ == '__main__':
     from argparse import ArgumentParser
-    parser = ArgumentParser()
+    parser = ArgumentParser(description='Create the GeneSippr analysis report (GAR) for an analysed MiSeq run')
+    parser.add_argument('-o', '--outputfolder',
+                        required=True,
+                        help='Path of the folder containing the output folder of the run')
+    parser.add_argument('-f', '--miseqfolder',
+                        required=True,
+                        help='Name of the MiSeq run folder')
+    parser.add_argument('-s', '--samplesheet',
+                        required=True,
+                        help='Path of the sample sheet used in the analysis')
     args = parser.parse_args()
-    args.miseqpath = '/home/adamkoziol/Bioinformatics/miseq_data'
-    args.miseqfolder = '161104_M02466_0002_000000000-AV4G5'
-    args.outputfolder = '/home/adamkoziol/Bioinformatics/sippr/gui/'
-    args.samplesheet = '/home/adamkoziol/Bioinformatics/sippr/gui/161104_M02466_0002_000000000-AV4G5/161104_M02466_0002_000000000-AV4G5/full_full/SampleSheet_modified.csv'
     GAR(args)
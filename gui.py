@@ -1,15 +1,13 @@
 #!/usr/bin/python3
-from PyQt5.QtWidgets import QWidget, QToolTip, QPushButton, QApplication, QFileDialog, QLabel, QVBoxLayout, QMainWindow, QErrorMessage, QMessageBox
+from PyQt5.QtWidgets import QWidget, QToolTip, QPushButton, QApplication, QFileDialog, QLabel, QVBoxLayout, QMainWindow, QErrorMessage, QMessageBox, \
+    QDockWidget, QTreeWidget, QTreeWidgetItem, QHBoxLayout, QCheckBox, QLineEdit, QComboBox, QSpinBox
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import QThreadPool, QRunnable, pyqtSlot, QTimer, Qt
+from PyQt5.QtCore import QThreadPool, QRunnable, QObject, QTimer, QFileSystemWatcher, pyqtSignal, pyqtSlot, Qt
 from PyQt5 import QtGui
 from argparse import ArgumentParser
-import subprocess
-from glob import glob
-try:
-    import xml.etree.cElementTree as ElementTree
-except ImportError:
-    import xml.etree.ElementTree as ElementTree
+from functools import partial
+import traceback
+import time
 import sys
 import os
 
@@ -17,7 +15,44 @@ testpath = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(testpath)
 sys.path.append(os.path.join(testpath, 'demos'))
 import design
-import gar
+from logtail import LogTail
+from logwatch import LogWatcher, network_filesystem
+import runfolder
+import jobqueue
+import batch
+
+
+class WorkerSignals(QObject):
+    """
+    Signals available from a running worker thread
+
+    output: line of text written by the pipeline
+    status: name of the run, exit status of the pipeline, and the final lines it wrote to stderr
+    job: jobqueue.Job whose status changed
+    run_info: name of a MiSeq run folder, and its metadata dictionary from runfolder.run_info
+    scanned: no data
+    metric: timing record dictionary from metrics.Metrics
+    preview: name of a run, and the path of the HTML preview of its reports
+    cycles: name of a run being sequenced, and its progress dictionary from runfolder.CycleMonitor.progress
+    polled: no data
+    results: name of an analysed run, and its report tables from resultsview.load_tables
+    error: traceback of an exception raised by a worker
+    search: names of the reports in the results index, and the run and sample of each search result
+    logs: name of a run being analysed, and the paths of the portal.log of the run or of each of its shards
+    """
+    output = pyqtSignal(str)
+    status = pyqtSignal(str, int, str)
+    job = pyqtSignal(object)
+    run_info = pyqtSignal(str, object)
+    scanned = pyqtSignal()
+    metric = pyqtSignal(object)
+    preview = pyqtSignal(str, str)
+    cycles = pyqtSignal(str, object)
+    polled = pyqtSignal()
+    results = pyqtSignal(str, object)
+    error = pyqtSignal(str)
+    search = pyqtSignal(object, object)
+    logs = pyqtSignal(str, object)
 
 
 class Worker(QRunnable):
@@ -40,6 +75,8 @@ class Worker(QRunnable):
         self.fn = fn
         self.args = args
         self.kwargs = kwargs
+        # Function called with the traceback of any exception raised by the callback
+        self.on_error = None
 
     @pyqtSlot()
     def run(self):
@@ -48,7 +85,14 @@ class Worker(QRunnable):
         """
 
         # Retrieve args/kwargs here; and fire processing using them
-        self.fn(*self.args, **self.kwargs)
+        try:
+            self.fn(*self.args, **self.kwargs)
+        except Exception:
+            # An exception that escapes a QRunnable aborts the application, so it is reported instead
+            error = traceback.format_exc()
+            sys.stderr.write(error)
+            if self.on_error is not None:
+                self.on_error(error)
 
 
 class GUI(QMainWindow, design.Ui_GeneSippr):
@@ -56,6 +100,53 @@ class GUI(QMainWindow, design.Ui_GeneSippr):
     def main(self):
         self.folder_browse()
         self.start_analyses()
+        self.queue_panel()
+        self.browser_panel()
+        self.timing_panel()
+        self.search_panel()
+        self.reports.clicked.connect(self.show_results)
+        # Import the report engine shortly after the window has been painted, so that it is ready when the first
+        # analysis finishes without competing with startup for the interpreter
+        QTimer.singleShot(self.prewarm_delay, self.prewarm)
+
+    def background(self, fn, *args):
+        """
+        Run a function in the thread pool, reporting any exception it raises in the status bar
+        :param fn: function to run
+        :param args: arguments of the function
+        """
+        worker = Worker(fn, *args)
+        worker.on_error = self.signals.error.emit
+        self.threadpool.start(worker)
+
+    def worker_error(self, error):
+        """
+        Show the final line of the traceback of an exception raised on a worker thread
+        :param error: traceback of the exception
+        """
+        self.statusBar().showMessage('Error: {}'.format(error.strip().splitlines()[-1]))
+
+    def prewarm(self):
+        """
+        Import the report engine (pandas, pylatex), and find and prepare the engine of the pipeline, in the thread pool
+        """
+        self.background(self.prepare_engine)
+
+    def prepare_engine(self):
+        """
+        Find the engine of the pipeline, pull the sipprverse image, and import the report engine. Runs in the thread
+        pool
+        """
+        batch.prewarm(self.default_engine())
+
+    def default_engine(self):
+        """
+        Find the engine shared by every analysis, unless it has already been found. Only called from worker threads,
+        as finding the engine waits for the Engine API to answer
+        :return: the runner engine
+        """
+        self.engine = batch.default_engine()
+        return self.engine
 
     def folder_browse(self):
         """
@@ -65,22 +156,289 @@ class GUI(QMainWindow, design.Ui_GeneSippr):
 
     def folder_choose(self):
         """
-
+        Select a MiSeq run folder with a file dialog
         """
         fname = QFileDialog.getExistingDirectory(self,
                                                  'Select MiSeq Folder',
-                                                 '/home/adamkoziol/Bioinformatics/miseq_data')
-        self.miseqfolder = os.path.split(fname)[-1]
-        if self.miseqfolder:
-            self.run_name.setText('MiSeq Run Name: {}'.format(self.miseqfolder))
-            self.readlength_determination()
-            try:
-                if self.cycles >= int(self.readlengthforward) + 16:
-                    self.analysis_btn.setEnabled(True)
-                else:
-                    pass
-            except ValueError:
-                pass
+                                                 self.miseqpath)
+        miseqfolder = os.path.split(fname)[-1]
+        if miseqfolder:
+            self.select_run(miseqfolder, warn=True)
+
+    def select_run(self, miseqfolder, warn=False):
+        """
+        Make the supplied run the current run, and look up its metadata in the background
+        :param miseqfolder: name of the MiSeq run folder
+        :param warn: Boolean of whether to show a message if the folder is not a valid run
+        """
+        self.miseqfolder = miseqfolder
+        self.warn_invalid = warn
+        self.run_name.setText('MiSeq Run Name: {}'.format(self.miseqfolder))
+        self.analysis_btn.setEnabled(False)
+        self.background(self.scan_run, miseqfolder)
+
+    def browser_panel(self):
+        """
+        Add a dockable panel listing every run in the MiSeq folder with its read lengths, cycle completion, and
+        whether it is ready to analyse. The folder is rescanned periodically in the thread pool
+        """
+        dock = QDockWidget('MiSeq Runs', self)
+        dock.setObjectName('browser_dock')
+        panel = QWidget(dock)
+        layout = QVBoxLayout(panel)
+        self.run_view = QTreeWidget(panel)
+        self.run_view.setHeaderLabels(['MiSeq Run', 'Forward', 'Reverse', 'Cycles', 'Status'])
+        self.run_view.setRootIsDecorated(False)
+        self.run_view.setSortingEnabled(True)
+        self.run_view.sortByColumn(0, Qt.DescendingOrder)
+        self.run_view.itemActivated.connect(lambda item, column: self.select_run(item.text(0)))
+        layout.addWidget(self.run_view)
+        button = QPushButton('Queue When Ready', panel)
+        button.setToolTip('Add the selected run to the analysis queue as soon as enough cycles have been sequenced')
+        button.clicked.connect(self.queue_when_ready)
+        layout.addWidget(button)
+        dock.setWidget(panel)
+        self.addDockWidget(Qt.LeftDockWidgetArea, dock)
+        self.browser_timer = QTimer(self)
+        self.browser_timer.setInterval(self.browser_interval)
+        self.browser_timer.timeout.connect(self.scan_runs)
+        self.browser_timer.start()
+        # Runs being sequenced are followed more closely than the periodic scan allows. Local base call folders
+        # are also watched, so that a new cycle is noticed as soon as its folder is created
+        self.monitor_timer = QTimer(self)
+        self.monitor_timer.setInterval(self.monitor_interval)
+        self.monitor_timer.timeout.connect(self.poll_monitors)
+        self.cycle_watcher = QFileSystemWatcher(self)
+        self.cycle_watcher.directoryChanged.connect(self.poll_monitors)
+        self.scan_runs()
+
+    def scan_runs(self):
+        """
+        Start a background scan of the MiSeq folder, unless one is already in progress
+        """
+        if not self.scanning:
+            self.scanning = True
+            self.background(self.list_runs)
+
+    def list_runs(self):
+        """
+        List the run folders in the MiSeq folder, and look up the metadata of each. Runs on a worker thread; each
+        run is reported through a signal as soon as it is processed
+        """
+        try:
+            folders = sorted((entry.name for entry in os.scandir(self.miseqpath) if entry.is_dir()), reverse=True)
+        except OSError:
+            folders = list()
+        try:
+            for miseqfolder in folders:
+                self.scan_run(miseqfolder, save=False)
+            # Write the metadata of every changed run at once, rather than rewriting the cache for each
+            runfolder.shared_cache().save()
+        finally:
+            # Allow the next scan even if this one failed
+            self.signals.scanned.emit()
+
+    def scan_run(self, miseqfolder, save=True):
+        """
+        Look up the metadata of a single run on a worker thread, and report it through a signal
+        :param miseqfolder: name of the MiSeq run folder
+        :param save: Boolean of whether to write the run metadata cache to disk if it changed
+        """
+        try:
+            info = runfolder.run_info(self.miseqpath, miseqfolder, save=save)
+        except (OSError, ValueError):
+            # e.g. an unreadable run folder, or a RunInfo.xml with a NumCycles that is not a number
+            info = {'cycles': 0, 'totalcycles': 0, 'readlengthforward': 'full', 'readlengthreverse': 'full'}
+        self.signals.run_info.emit(miseqfolder, info)
+
+    def scan_finished(self):
+        """
+        Allow the next periodic scan to start
+        """
+        self.scanning = False
+
+    def run_update(self, miseqfolder, info):
+        """
+        Show the metadata of a run in the run browser, and update the labels and buttons if it is the current run
+        :param miseqfolder: name of the MiSeq run folder
+        :param info: metadata dictionary from runfolder.run_info
+        """
+        self.run_data[miseqfolder] = info
+        ready = runfolder.ready(info['cycles'], info['readlengthforward'])
+        if not info['cycles']:
+            status = 'Invalid'
+        elif ready:
+            status = 'Ready'
+            self.stop_monitor(miseqfolder)
+            if miseqfolder in self.auto_queue:
+                self.auto_queue.discard(miseqfolder)
+                if not self.queued(miseqfolder):
+                    if miseqfolder == self.miseqfolder:
+                        self.output.setEnabled(True)
+                    self.queue.submit(miseqfolder, self.job_function(), slots=self.job_slots())
+                    self.statusBar().showMessage('{} is ready, and has been queued for analysis'.format(miseqfolder))
+        elif miseqfolder in self.monitors or (runfolder.sequencing(info, self.monitor_timeout) and
+                                              info['cycles'] > self.stalled.get(miseqfolder, -1)):
+            status = 'Sequencing'
+            self.start_monitor(miseqfolder, info)
+            status += self.sequencing_status(miseqfolder)
+        else:
+            # No cycle has completed recently e.g. the run was aborted, so it is not followed
+            status = 'Stopped'
+        item = self.run_items.get(miseqfolder)
+        if item is None:
+            item = QTreeWidgetItem(self.run_view)
+            self.run_items[miseqfolder] = item
+        item.setText(0, miseqfolder)
+        item.setText(1, str(info['readlengthforward']))
+        item.setText(2, str(info['readlengthreverse']))
+        item.setText(3, '{}/{}'.format(info['cycles'], info['totalcycles']) if info['totalcycles']
+                     else str(info['cycles']))
+        item.setText(4, status)
+        if miseqfolder != self.miseqfolder:
+            return
+        self.cycles = info['cycles']
+        if self.cycles:
+            self.readlengthforward = info['readlengthforward']
+            self.readlengthreverse = info['readlengthreverse']
+            self.forwardreads.setText('Forward Read Length: {}'.format(self.readlengthforward))
+            self.reversereads.setText('Reverse Read Length: {}'.format(self.readlengthreverse))
+            if ready and not self.queued(miseqfolder):
+                self.analysis_btn.setEnabled(True)
+            if self.results_ready(miseqfolder):
+                self.results_run = miseqfolder
+                self.reports.setEnabled(True)
+        elif self.warn_invalid:
+            self.message('IndexError', 'Not a valid MiSeq run folder',
+                         detailed='Could not find the necessary directories in the supplied folder: {}'
+                         .format(os.path.join(self.miseqpath, self.miseqfolder)))
+            print('Something went wrong')
+        self.warn_invalid = False
+
+    def sequencing_status(self, miseqfolder):
+        """
+        :param miseqfolder: name of the MiSeq run folder being sequenced
+        :return: description of when the run is expected to be ready, and whether it will then be queued
+        """
+        details = list()
+        eta = self.run_progress.get(miseqfolder, dict()).get('eta')
+        if eta is not None:
+            details.append('ready in ~{} min'.format(max(1, int(round(eta / 60)))))
+        if miseqfolder in self.auto_queue:
+            details.append('queued when ready')
+        return ' ({})'.format(', '.join(details)) if details else str()
+
+    def start_monitor(self, miseqfolder, info):
+        """
+        Follow the cycles of a run that is being sequenced, unless it is already followed
+        :param miseqfolder: name of the MiSeq run folder
+        :param info: metadata dictionary from runfolder.run_info
+        """
+        if miseqfolder in self.monitors:
+            return
+        monitor = runfolder.CycleMonitor(self.miseqpath, miseqfolder, info['readlengthforward'])
+        self.monitors[miseqfolder] = monitor
+        # File system events are not reliably delivered for network mounts, which are left to the timer
+        if not network_filesystem(monitor.path):
+            self.cycle_watcher.addPath(monitor.path)
+        self.monitor_timer.start()
+        self.poll_monitors()
+
+    def stop_monitor(self, miseqfolder):
+        """
+        Stop following the cycles of a run
+        :param miseqfolder: name of the MiSeq run folder
+        """
+        monitor = self.monitors.pop(miseqfolder, None)
+        self.run_progress.pop(miseqfolder, None)
+        if monitor is None:
+            return
+        if monitor.path in self.cycle_watcher.directories():
+            self.cycle_watcher.removePath(monitor.path)
+        if not self.monitors:
+            self.monitor_timer.stop()
+
+    def poll_monitors(self, *args):
+        """
+        Check the runs being sequenced for new cycles in the thread pool, unless a check is already in progress
+        """
+        if self.monitors and not self.polling:
+            self.polling = True
+            self.background(self.poll_cycles, list(self.monitors.values()))
+
+    def poll_cycles(self, monitors):
+        """
+        Check each monitored run for new cycles on a worker thread, and report its progress through a signal
+        :param monitors: list of runfolder.CycleMonitor
+        """
+        try:
+            for monitor in monitors:
+                monitor.poll()
+                self.signals.cycles.emit(monitor.miseqfolder, monitor.progress())
+        finally:
+            # Allow the next check even if this one failed
+            self.signals.polled.emit()
+
+    def poll_finished(self):
+        """
+        Allow the next check of the monitored runs to start
+        """
+        self.polling = False
+
+    def cycle_update(self, miseqfolder, progress):
+        """
+        Show the progress of a run being sequenced, and enable or queue its analysis once it is ready
+        :param miseqfolder: name of the MiSeq run folder
+        :param progress: progress dictionary from runfolder.CycleMonitor.progress
+        """
+        if miseqfolder not in self.monitors or miseqfolder not in self.run_data:
+            return
+        self.run_progress[miseqfolder] = progress
+        info = self.run_data[miseqfolder]
+        if not progress['ready'] and progress['idle'] > self.monitor_timeout:
+            # The run has stalled; it is followed again only if more cycles appear
+            self.stalled[miseqfolder] = max(progress['cycles'], info['cycles'])
+            self.stop_monitor(miseqfolder)
+        # The periodic scan may have counted cycles since the monitor last polled
+        self.run_update(miseqfolder, dict(info, cycles=max(progress['cycles'], info['cycles'])))
+        if miseqfolder == self.miseqfolder and miseqfolder in self.monitors and not progress['ready']:
+            self.statusBar().showMessage('{mf}: {cycles} of {needed} cycles sequenced{status}'
+                                         .format(mf=miseqfolder, cycles=progress['cycles'],
+                                                 needed=progress['needed'] or 'the required',
+                                                 status=self.sequencing_status(miseqfolder)))
+
+    def queue_when_ready(self):
+        """
+        Queue the run selected in the run browser for analysis now if it is ready, or as soon as it is
+        """
+        item = self.run_view.currentItem()
+        if item is None:
+            return
+        miseqfolder = item.text(0)
+        info = self.run_data.get(miseqfolder)
+        if info is None or not info['cycles'] or self.queued(miseqfolder):
+            return
+        self.auto_queue.add(miseqfolder)
+        self.run_update(miseqfolder, info)
+
+    def queued(self, miseqfolder):
+        """
+        :param miseqfolder: name of the MiSeq run folder
+        :return: Boolean of whether the run is waiting in, or running from, the analysis queue
+        """
+        return any(job.miseqfolder == miseqfolder and job.status in (jobqueue.PENDING, jobqueue.RUNNING)
+                   for job in self.queue.jobs)
+
+    def results_ready(self, miseqfolder):
+        """
+        :param miseqfolder: name of the MiSeq run folder
+        :return: Boolean of whether the run has reports that are complete: its most recent analysis in this session
+        finished successfully, or it has reports and has not been analysed in this session
+        """
+        if not os.path.isdir(os.path.join(self.outputpath, miseqfolder, 'reports')):
+            return False
+        jobs = [job for job in self.queue.jobs if job.miseqfolder == miseqfolder]
+        return not jobs or max(jobs, key=lambda job: job.id).status == jobqueue.DONE
 
     @staticmethod
     def message(window_title, short, detailed=None, disable=True):
@@ -102,47 +460,6 @@ class GUI(QMainWindow, design.Ui_GeneSippr):
             error.setWindowFlags(Qt.CustomizeWindowHint)
         error.exec()
 
-    def readlength_determination(self):
-        """
-
-        """
-        # Count the number of completed cycles in the run of interest
-        try:
-            #
-            cycle_folders = \
-                glob(os.path.join(self.miseqpath, self.miseqfolder, 'Data', 'Intensities', 'BaseCalls', 'L001', 'C*'))
-            self.cycles = len(cycle_folders)
-            _ = cycle_folders[0]
-            self.parseruninfo()
-            self.forwardreads.setText('Forward Read Length: {}'.format(self.readlengthforward))
-            self.reversereads.setText('Reverse Read Length: {}'.format(self.readlengthreverse))
-        except IndexError:
-            self.message('IndexError', 'Not a valid MiSeq run folder',
-                         detailed='Could not find the necessary directories in the supplied folder: {}'
-                         .format(os.path.join(self.miseqpath, self.miseqfolder)))
-            print('Something went wrong')
-
-    def parseruninfo(self):
-        """
-        Extract the number of forward and reverse reads in the run from the RunInfo.xml file
-        """
-        #
-        try:
-            runinfo = ElementTree.ElementTree(file=os.path.join(self.miseqpath, self.miseqfolder, 'RunInfo.xml'))
-            #
-            for elem in runinfo.iter():
-                for run in elem:
-                    try:
-                        num_cycles = run.attrib['NumCycles']
-                        if run.attrib['Number'] == '1':
-                            self.readlengthforward = num_cycles
-                        if run.attrib['Number'] == '4':
-                            self.readlengthreverse = num_cycles
-                    except KeyError:
-                        pass
-        except IOError:
-            pass
-
     def start_analyses(self):
         """
 
@@ -152,80 +469,407 @@ class GUI(QMainWindow, design.Ui_GeneSippr):
 
     def run(self):
         """
-
+        Add the selected run folder to the analysis queue
         """
         if self.miseqfolder:
             print('Ready to go!')
-            worker = Worker(self.sippr)
-            self.miseq_folder_btn.setEnabled(False)
             self.analysis_btn.setEnabled(False)
             self.output.setEnabled(True)
-            self.log()
-            self.threadpool.start(worker)
+            self.queue.submit(self.miseqfolder, self.job_function(), slots=self.job_slots())
         else:
             print('Hold up!')
 
-    def sippr(self):
+    def queue_panel(self):
         """
+        Add a dockable panel listing the status and priority of each queued run, with buttons to cancel a run or
+        change its priority
+        """
+        dock = QDockWidget('Analysis Queue', self)
+        dock.setObjectName('queue_dock')
+        panel = QWidget(dock)
+        layout = QVBoxLayout(panel)
+        self.queue_view = QTreeWidget(panel)
+        self.queue_view.setHeaderLabels(['MiSeq Run', 'Priority', 'Status'])
+        self.queue_view.setRootIsDecorated(False)
+        layout.addWidget(self.queue_view)
+        buttons = QHBoxLayout()
+        for label, slot in (('Raise Priority', lambda: self.job_priority(1)),
+                            ('Lower Priority', lambda: self.job_priority(-1)),
+                            ('Cancel', self.job_cancel)):
+            button = QPushButton(label, panel)
+            button.clicked.connect(slot)
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
+        self.fresh_box = QCheckBox('Analyse every sample again', panel)
+        self.fresh_box.setToolTip('Ignore the checkpoint of runs added to the queue (e.g. after the databases are '
+                                  'updated), rather than only analysing the samples without complete results. '
+                                  'Samples are complete once they have results in every report, which the '
+                                  'pipeline writes for a whole run or shard at once, so runs resume at the '
+                                  'granularity of their shards')
+        self.fresh_box.setChecked(self.fresh)
+        layout.addWidget(self.fresh_box)
+        dock.setWidget(panel)
+        self.addDockWidget(Qt.RightDockWidgetArea, dock)
+
+    def job_function(self):
+        """
+        :return: function with which to analyse a run added to the queue now, resuming from its checkpoint unless
+        every sample is to be analysed again
+        """
+        return partial(self.sippr, resume=False) if self.fresh_box.isChecked() else self.sippr
 
+    def job_slots(self):
         """
-        command = 'docker run -i --rm -v /mnt/nas:/mnt/nas ' \
-                  '-v /home/adamkoziol/Bioinformatics:/home/ubuntu/Bioinformatics ' \
-                  'olcbioinformatics/sipprverse:latest /bin/bash -c "source activate genesippr && python method.py ' \
-                  '-m /home/ubuntu/Bioinformatics/ -f 161104_M02466_0002_000000000-AV4G5 -r1 70 -r2 0 -c ' \
-                  '/home/ubuntu/Bioinformatics/sippr/gui/SampleSheet.csv ' \
-                  '-r /mnt/nas/assemblydatabases/0.2.3/databases ' \
-                  '-d /home/ubuntu/Bioinformatics/sippr/gui/161104_M02466_0002_000000000-AV4G5/sequences ' \
-                  '-o /home/ubuntu/Bioinformatics/sippr/gui/161104_M02466_0002_000000000-AV4G5"'
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-        #
-        print(self.samplesheet)
-        gar.GAR(self)
-        self.sippr_clear()
+        :return: number of workers of the queue occupied by an analysis: one for each of its shards, which run at
+        once, or every worker if the shards are sized to the host
+        """
+        return self.shards or self.queue.workers
 
-    def log(self):
+    def selected_job(self):
         """
-        Set up the timer to update the output text box with the portal.log once every second
+        :return: the jobqueue.Job selected in the queue panel, or None
         """
+        item = self.queue_view.currentItem()
+        if item is None:
+            return None
+        return item.data(0, Qt.UserRole)
 
-        self.timer.setInterval(1000)
-        self.timer.timeout.connect(self.log_read)
-        self.timer.start()
-        self.output.setEnabled(True)
+    def job_priority(self, change):
+        """
+        Change the priority of the selected job
+        :param change: amount to add to the priority
+        """
+        job = self.selected_job()
+        if job is not None:
+            self.queue.set_priority(job, job.priority + change)
+
+    def job_cancel(self):
+        """
+        Cancel the selected job
+        """
+        job = self.selected_job()
+        if job is not None:
+            self.queue.cancel(job)
+
+    def job_update(self, job):
+        """
+        Show the status of a job in the queue panel, and tidy up when a run finishes
+        :param job: jobqueue.Job whose status changed
+        """
+        item = self.job_items.get(job.id)
+        if item is None:
+            item = QTreeWidgetItem(self.queue_view)
+            item.setData(0, Qt.UserRole, job)
+            self.job_items[job.id] = item
+        item.setText(0, job.miseqfolder)
+        item.setText(1, str(job.priority))
+        item.setText(2, job.status)
+        if job.error:
+            item.setToolTip(2, job.error)
+        if job.status in (jobqueue.PENDING, jobqueue.RUNNING) and job.miseqfolder == self.results_run:
+            # The reports are rewritten by the analysis, so they cannot be shown until it is done
+            self.reports.setEnabled(False)
+        if job.status in (jobqueue.DONE, jobqueue.FAILED, jobqueue.CANCELLED):
+            self.sippr_clear(job)
+
+    def portal_log(self, miseqfolder):
+        """
+        :param miseqfolder: name of the MiSeq run folder
+        :return: path of the portal.log written by the pipeline for the run
+        """
+        return os.path.join(self.outputpath, miseqfolder, 'portal.log')
+
+    def sippr(self, job, resume=True):
+        """
+        Run the sipprverse pipeline on a queued run folder, and create the GAR if it succeeds
+        :param job: jobqueue.Job of the run folder to analyse
+        :param resume: Boolean of whether to only analyse the samples that the checkpoint of the run does not
+        record as complete
+        :return: exit status of the pipeline
+        """
+        return batch.analyse(job, self.miseqpath, self.outputpath,
+                             customsamplesheet=self.customsamplesheet,
+                             on_output=self.run_output(job.miseqfolder),
+                             on_status=self.signals.status.emit,
+                             metrics=self.metrics,
+                             on_preview=self.signals.preview.emit,
+                             engine=self.default_engine(),
+                             shards=self.shards,
+                             resume=resume,
+                             on_logs=self.signals.logs.emit)
+
+    def run_output(self, miseqfolder):
+        """
+        :param miseqfolder: name of the MiSeq run folder
+        :return: function that shows each line written by the analysis of the run in the output text box, prefixed
+        with the name of the run, as the analyses of several runs share the text box
+        """
+        def labelled(line):
+            self.signals.output.emit('[{mf}] {line}'.format(mf=miseqfolder, line=line))
+        return labelled
+
+    def preview_update(self, miseqfolder, path):
+        """
+        Show where the preview of the reports of a run being analysed can be found
+        :param miseqfolder: name of the MiSeq run folder
+        :param path: path of the HTML preview
+        """
+        self.statusBar().showMessage('Preview of {mf} updated: {path}'.format(mf=miseqfolder, path=path))
 
-    def log_read(self):
+    def show_results(self):
         """
-        Read the pipeline stdout from the portal.log
+        Load the results of the most recently analysed or selected run in the thread pool, to show in the results
+        panel
         """
+        if self.results_run:
+            self.statusBar().showMessage('Loading the results of {}'.format(self.results_run))
+            self.background(self.load_results, self.results_run)
+
+    def load_results(self, miseqfolder):
+        """
+        Read the report tables of a run on a worker thread, and report them through a signal
+        :param miseqfolder: name of the MiSeq run folder
+        """
+        # The results viewer needs the report engine, so it is only imported once results are requested
+        import resultsview
+        error = None
         try:
-            log = open('/home/adamkoziol/Bioinformatics/sippr/gui/161104_M02466_0002_000000000-AV4G5/portal.log').readlines()
-            for entry in log:
-                if 'SampleSheet:' in entry:
-                    self.samplesheet = entry.split()[-1]
-        except FileNotFoundError:
-            log = str()
-            self.samplesheet = str()
+            tables = resultsview.load_tables(self.outputpath, miseqfolder)
+        except Exception:
+            # e.g. a report that is empty, incomplete, or has no Strain column. The panel is cleared
+            error = traceback.format_exc()
+            tables = list()
+        self.signals.results.emit(miseqfolder, tables)
+        if error is not None:
+            self.signals.error.emit(error)
+
+    def results_update(self, miseqfolder, tables):
+        """
+        Show the report tables of a run in a dockable panel, which is created the first time results are shown
+        :param miseqfolder: name of the MiSeq run folder
+        :param tables: list of tuples of report dictionary and reportcache.ReportTable
+        """
+        import resultsview
+        if self.results_dock is None:
+            self.results_dock = QDockWidget(self)
+            self.results_dock.setObjectName('results_dock')
+            self.results_view = resultsview.ResultsPanel(self.results_dock)
+            self.results_dock.setWidget(self.results_view)
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.results_dock)
+        self.results_dock.setWindowTitle('Results: {}'.format(miseqfolder))
+        self.results_view.set_tables(tables)
+        self.results_dock.show()
+        self.results_dock.raise_()
+        self.statusBar().showMessage('Results of {}'.format(miseqfolder) if tables
+                                     else 'No reports found for {}'.format(miseqfolder))
+
+    def timing_panel(self):
+        """
+        Add a dockable panel showing the duration and peak memory of each stage of each run
+        """
+        dock = QDockWidget('Timing', self)
+        dock.setObjectName('timing_dock')
+        self.timing_view = QTreeWidget(dock)
+        self.timing_view.setHeaderLabels(['Run / Stage', 'Seconds', 'Process Peak RSS (MB)'])
+        self.timing_view.headerItem().setToolTip(2, 'Peak resident memory of the GUI process, or of the process '
+                                                    'creating the report; not of the analysis containers')
+        dock.setWidget(self.timing_view)
+        self.addDockWidget(Qt.RightDockWidgetArea, dock)
+
+    def timing_update(self, entry):
+        """
+        Add a timing record to the timing panel, grouped by run
+        :param entry: record dictionary from metrics.Metrics
+        """
+        parent = self.timing_items.get(entry['run'])
+        if parent is None:
+            parent = QTreeWidgetItem(self.timing_view, [entry['run']])
+            parent.setExpanded(True)
+            self.timing_items[entry['run']] = parent
+        item = QTreeWidgetItem(parent, [entry['stage'], '{:.2f}'.format(entry['seconds'])])
+        if 'peak_rss_kb' in entry:
+            item.setText(2, '{:.0f}'.format(entry['peak_rss_kb'] / 1024))
+
+    def search_panel(self):
+        """
+        Add a dockable panel to search the results index of every analysed run for the samples with the supplied
+        marker results, as with results_db.py query
+        """
+        dock = QDockWidget('Search Results', self)
+        dock.setObjectName('search_dock')
+        panel = QWidget(dock)
+        layout = QVBoxLayout(panel)
+        controls = QHBoxLayout()
+        self.search_report = QComboBox(panel)
+        self.search_report.addItem('genesippr')
+        controls.addWidget(self.search_report)
+        self.search_markers = QLineEdit(panel)
+        self.search_markers.setPlaceholderText('Markers e.g. O157=+ VT2=+')
+        self.search_markers.returnPressed.connect(self.search)
+        controls.addWidget(self.search_markers)
+        self.search_last = QSpinBox(panel)
+        self.search_last.setSpecialValueText('All runs')
+        self.search_last.setPrefix('Last ')
+        self.search_last.setSuffix(' runs')
+        self.search_last.setMaximum(9999)
+        controls.addWidget(self.search_last)
+        button = QPushButton('Search', panel)
+        button.clicked.connect(self.search)
+        controls.addWidget(button)
+        layout.addLayout(controls)
+        self.search_view = QTreeWidget(panel)
+        self.search_view.setHeaderLabels(['MiSeq Run', 'Sample'])
+        self.search_view.setRootIsDecorated(False)
+        self.search_view.itemActivated.connect(lambda item, column: self.select_run(item.text(0)))
+        layout.addWidget(self.search_view)
+        dock.setWidget(panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, dock)
+
+    def search(self):
+        """
+        Search the results index in the thread pool with the markers, report, and number of runs in the search panel
+        """
+        # Imports only sqlite3, so it does not delay the GUI
+        import results_db
         try:
-            self.output.setText(''.join(log))
+            markers = results_db.parse_markers(self.search_markers.text().split())
+        except ValueError as error:
+            self.statusBar().showMessage(str(error))
+            return
+        self.statusBar().showMessage('Searching the results of analysed runs')
+        self.background(self.search_results, markers, self.search_report.currentText(), self.search_last.value())
+
+    def search_results(self, markers, report, last):
+        """
+        Search the results index on a worker thread, and report the matches through a signal
+        :param markers: dictionary of marker: value
+        :param report: name of the report containing the markers
+        :param last: number of the most recent runs to search. All runs if 0
+        """
+        import results_db
+        index = results_db.results_index(self.outputpath)
+        self.signals.search.emit(index.reports(), index.samples_with(markers, report=report, last=last or None))
+
+    def search_update(self, reports, rows):
+        """
+        Show the results of a search, and list the reports that can be searched
+        :param reports: names of the reports in the results index
+        :param rows: list of tuples of run and sample
+        """
+        current = self.search_report.currentText()
+        self.search_report.blockSignals(True)
+        self.search_report.clear()
+        self.search_report.addItems(sorted(set(reports) | {current}))
+        self.search_report.setCurrentText(current)
+        self.search_report.blockSignals(False)
+        self.search_view.clear()
+        self.search_view.addTopLevelItems([QTreeWidgetItem([run, sample]) for run, sample in rows])
+        self.statusBar().showMessage('{} samples found'.format(len(rows)))
+
+    def append_output(self, text):
+        """
+        Add text to the end of the output text box
+        :param text: text to append
+        """
+        try:
+            self.output.moveCursor(QtGui.QTextCursor.End)
+            self.output.insertPlainText(text)
         except RuntimeError:
             pass
 
-    def sippr_clear(self):
+    def sippr_status(self, miseqfolder, returncode, stderr):
+        """
+        Report the exit status of the pipeline, and show the end of its stderr if it failed
+        :param miseqfolder: name of the MiSeq run folder
+        :param returncode: exit status of the pipeline
+        :param stderr: final lines written to stderr by the pipeline
+        """
+        self.append_output('\nPipeline for {} exited with status {}\n'.format(miseqfolder, returncode))
+        if returncode != 0:
+            self.message('Pipeline Error', 'The analysis of {} exited with status {}'.format(miseqfolder, returncode),
+                         detailed=stderr, disable=False)
+
+    def log(self, miseqfolder, portallogs):
+        """
+        Follow the logs of a run being analysed, alongside those of any other runs being analysed, and set up
+        watchers to update the output text box whenever one of them changes
+        :param miseqfolder: name of the MiSeq run folder
+        :param portallogs: list of the paths of the portal.log of the run, or of each of its shards
+        """
+        self.log_stop(miseqfolder)
+        # Lines from the logs of shards are labelled with the shard, as in the output of the pipeline
+        tails = [('[{mf}] '.format(mf=miseqfolder) if len(portallogs) == 1
+                  else '[{mf}] [shard {index}] '.format(mf=miseqfolder, index=index),
+                  LogTail(portallog, scrollback=self.scrollback))
+                 for index, portallog in enumerate(portallogs)]
+        self.followed[miseqfolder] = {'tails': tails, 'watchers': list(), 'seconds': 0, 'lines': 0}
+        # Let the text document discard its oldest lines once the scrollback is full. The output of earlier runs, and
+        # of runs still being analysed, is kept
+        self.output.document().setMaximumBlockCount(self.scrollback)
+        for portallog in portallogs:
+            watcher = LogWatcher(portallog, parent=self)
+            watcher.changed.connect(partial(self.log_read, miseqfolder))
+            watcher.start()
+            self.followed[miseqfolder]['watchers'].append(watcher)
+        self.log_read(miseqfolder)
+        self.output.setEnabled(True)
+
+    def log_stop(self, miseqfolder):
+        """
+        Read the final lines of the logs of a run, stop following them, and record the total time spent reading them
+        :param miseqfolder: name of the MiSeq run folder
+        """
+        if miseqfolder not in self.followed:
+            return
+        self.log_read(miseqfolder)
+        followed = self.followed.pop(miseqfolder)
+        for watcher in followed['watchers']:
+            watcher.stop()
+            watcher.deleteLater()
+        self.metrics.record(miseqfolder, 'log_parsing', followed['seconds'], lines=followed['lines'])
+
+    def log_read(self, miseqfolder):
+        """
+        Append any lines added to the logs of a run since the previous read to the output text box
+        :param miseqfolder: name of the MiSeq run folder
+        """
+        followed = self.followed.get(miseqfolder)
+        if followed is None:
+            return
+        for label, tail in followed['tails']:
+            start = time.perf_counter()
+            lines = tail.read()
+            followed['seconds'] += time.perf_counter() - start
+            followed['lines'] += len(lines)
+            self.samplesheet = tail.samplesheet or self.samplesheet
+            # The log was rotated, truncated, or removed, so it is followed again from its start
+            if tail.reset:
+                self.append_output('{}The log was restarted\n'.format(label))
+            if lines:
+                self.append_output(''.join(label + line for line in lines))
+
+    def sippr_clear(self, job):
         """
-        Stop the timer, and enable buttons as necessary
+        Stop following the log of a finished run, and enable buttons as necessary
+        :param job: jobqueue.Job that finished
         """
-        self.timer.stop()
-        self.miseq_folder_btn.setEnabled(True)
-        self.reports.setEnabled(True)
+        portallog = self.portal_log(job.miseqfolder)
+        self.log_stop(job.miseqfolder)
+        if job.status == jobqueue.DONE:
+            self.results_run = job.miseqfolder
+            self.reports.setEnabled(True)
         try:
-            os.remove('/home/adamkoziol/Bioinformatics/sippr/gui/portal.log')
+            os.remove(portallog)
         except:
             pass
 
     def __init__(self, args):
         super(self.__class__, self).__init__()
         self.miseqpath = os.path.join(args.miseqpath)
+        self.outputpath = os.path.join(args.outputpath)
+        self.customsamplesheet = args.customsamplesheet
+        self.shards = getattr(args, 'shards', 1)
+        self.fresh = getattr(args, 'fresh', False)
         self.referencefilepath = '/home/ubuntu/targets'
         self.readlengthforward = 'full'
         self.readlengthreverse = 'full'
@@ -233,8 +877,53 @@ class GUI(QMainWindow, design.Ui_GeneSippr):
         self.miseqfolder = str()
         self.cycles = int()
         self.samplesheet = str()
+        self.scrollback = 5000
+        # Runs whose logs are followed: the label and logtail.LogTail of each log, their logwatch.LogWatchers, and
+        # the time spent reading them and the number of lines read
+        self.followed = dict()
         self.threadpool = QThreadPool()
-        self.timer = QTimer()
+        self.signals = WorkerSignals()
+        self.signals.output.connect(self.append_output)
+        self.signals.status.connect(self.sippr_status)
+        self.signals.job.connect(self.job_update)
+        self.signals.run_info.connect(self.run_update)
+        self.signals.scanned.connect(self.scan_finished)
+        self.signals.metric.connect(self.timing_update)
+        self.signals.preview.connect(self.preview_update)
+        self.signals.cycles.connect(self.cycle_update)
+        self.signals.polled.connect(self.poll_finished)
+        self.signals.results.connect(self.results_update)
+        self.signals.error.connect(self.worker_error)
+        self.signals.search.connect(self.search_update)
+        self.signals.logs.connect(self.log)
+        self.metrics = batch.run_metrics(self.outputpath, on_record=self.signals.metric.emit)
+        self.timing_items = dict()
+        self.results_run = str()
+        self.results_dock = None
+        self.results_view = None
+        self.prewarm_delay = 1000
+        # Shared by every analysis, so that the image is pinned once and warm containers are re-used. Found on a
+        # worker thread by the prewarm, or by the first analysis, so that an unresponsive Engine API cannot delay
+        # the window
+        self.engine = None
+        self.run_items = dict()
+        self.scanning = False
+        self.warn_invalid = False
+        self.browser_interval = 30000
+        self.run_data = dict()
+        # Runs being sequenced: their runfolder.CycleMonitor, and its latest progress
+        self.monitors = dict()
+        self.run_progress = dict()
+        self.monitor_interval = 10000
+        # Seconds without a new cycle after which a run is no longer considered to be sequencing, and the number
+        # of cycles of each run that stalled
+        self.monitor_timeout = 3600
+        self.stalled = dict()
+        self.polling = False
+        # Runs to queue for analysis as soon as they are ready
+        self.auto_queue = set()
+        self.job_items = dict()
+        self.queue = jobqueue.JobQueue(workers=args.jobs, on_status=self.signals.job.emit)
         # self.error = ''
         self.setupUi(self)
         self.main()
@@ -251,9 +940,30 @@ if __name__ == '__main__':
                         help='Path of the folder containing MiSeq run data folder')
     parser.add_argument('-c', '--customsamplesheet',
                         help='Path of folder containing a custom sample sheet (still must be named "SampleSheet.csv")')
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        help='Maximum number of runs to analyse at once. Determined from the available cores and '
+                             'memory if not provided')
+    parser.add_argument('-k', '--shards',
+                        type=int,
+                        default=1,
+                        help='Split the samples of each run into this many shards, analysed at once in separate '
+                             'containers. 0 to use as many shards as the cores and memory of the host allow. Default '
+                             'is 1 (no sharding)')
+    parser.add_argument('-f', '--fresh',
+                        action='store_true',
+                        help='Analyse every sample of the runs added to the queue again, rather than resuming from '
+                             'the checkpoint of each run. Runs resume at the granularity of their shards (see '
+                             '--shards), as the pipeline writes its reports for a whole run or shard at once. Can be '
+                             'changed in the analysis queue panel')
     # Get the arguments into an object
     arguments = parser.parse_args()
     app = QApplication(sys.argv)
     ex = GUI(arguments)
     ex.show()
-    sys.exit(app.exec_())
+    status = app.exec_()
+    # Let the background imports and scans in the thread pool finish before the interpreter shuts down
+    ex.threadpool.waitForDone()
+    if ex.engine is not None:
+        ex.engine.close()
+    sys.exit(status)
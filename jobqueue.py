@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+from itertools import count
+import threading
+import traceback
+import heapq
+import os
+__author__ = 'adamkoziol'
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+def available_memory():
+    """
+    :return: bytes of memory available for new processes
+    """
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def default_workers(cores_per_job=4, memory_per_job=8 * 1024 ** 3):
+    """
+    Determine how many analyses can run at once on this host
+    :param cores_per_job: number of cores used by a single analysis
+    :param memory_per_job: bytes of memory used by a single analysis
+    :return: number of concurrent jobs limited by both the cores and the available memory (minimum of one)
+    """
+    by_cores = (os.cpu_count() or 1) // cores_per_job
+    memory = available_memory()
+    by_memory = memory // memory_per_job if memory else by_cores
+    return max(1, min(by_cores, by_memory))
+
+
+class Job(object):
+
+    def cancel(self):
+        """
+        Cancel the job. Pending jobs are never started; running jobs have their runner terminated
+        """
+        self.cancelled.set()
+        if self.status == RUNNING and self.runner is not None:
+            self.runner.terminate()
+
+    def __lt__(self, other):
+        return (-self.priority, self.id) < (-other.priority, other.id)
+
+    def __repr__(self):
+        return 'Job({id}, {folder}, priority={priority}, status={status})'\
+            .format(id=self.id, folder=self.miseqfolder, priority=self.priority, status=self.status)
+
+    def __init__(self, jobid, miseqfolder, function, priority=0, slots=1):
+        """
+        :param jobid: unique, increasing number of the job
+        :param miseqfolder: name of the MiSeq run folder to analyse
+        :param function: function called with the job as its only argument. A non-zero return value is the exit
+        status of a failed analysis
+        :param priority: jobs with higher priorities are started first
+        :param slots: number of the workers of the queue that the job occupies e.g. its number of shards
+        """
+        self.id = jobid
+        self.miseqfolder = miseqfolder
+        self.function = function
+        self.priority = priority
+        self.slots = max(1, slots)
+        self.status = PENDING
+        self.returncode = None
+        self.error = str()
+        self.cancelled = threading.Event()
+        # Set by the job function to an object with a terminate() method so that running jobs can be cancelled
+        self.runner = None
+
+
+class JobQueue(object):
+    """
+    Priority queue of run folders, which are analysed concurrently while the slots of the running jobs (e.g. their
+    shards) fit in the workers. A job is always started when nothing else is running, however many slots it needs.
+    Does not depend on Qt, so it can be used headless, or from the GUI by passing a thread-safe on_status callback
+    (e.g. a signal's emit)
+    """
+
+    def submit(self, miseqfolder, function, priority=0, slots=1):
+        """
+        Add a run folder to the queue
+        :param miseqfolder: name of the MiSeq run folder
+        :param function: function to call with the job
+        :param priority: jobs with higher priorities are started first
+        :param slots: number of workers the job occupies while it runs e.g. its number of shards
+        :return: the queued Job
+        """
+        with self.condition:
+            job = Job(next(self.counter), miseqfolder, function, priority, slots)
+            self.jobs.append(job)
+            heapq.heappush(self.heap, job)
+            self.condition.notify()
+        self.update(job)
+        return job
+
+    def set_priority(self, job, priority):
+        """
+        Change the priority of a pending job
+        :param job: Job to change
+        :param priority: new priority
+        """
+        with self.condition:
+            if job.status == PENDING:
+                job.priority = priority
+                heapq.heapify(self.heap)
+                # The job to start next may have changed
+                self.condition.notify_all()
+        self.update(job)
+
+    def cancel(self, job):
+        """
+        Cancel a pending or running job
+        :param job: Job to cancel
+        """
+        with self.condition:
+            job.cancel()
+            if job.status == PENDING:
+                self.heap.remove(job)
+                heapq.heapify(self.heap)
+                job.status = CANCELLED
+                self.condition.notify_all()
+            else:
+                return
+        self.update(job)
+
+    def work(self):
+        """
+        Repeatedly take the highest priority job from the queue and run it, until the queue is shut down
+        """
+        while True:
+            with self.condition:
+                # Once shut down, the remaining jobs are still started as workers become idle
+                while not self.startable() and (self.heap or not self.closed):
+                    self.condition.wait()
+                if not self.heap:
+                    return
+                job = heapq.heappop(self.heap)
+                job.status = RUNNING
+                self.running += 1
+                self.busy += job.slots
+            self.update(job)
+            try:
+                job.returncode = job.function(job)
+                if job.cancelled.is_set():
+                    job.status = CANCELLED
+                elif job.returncode:
+                    job.status = FAILED
+                else:
+                    job.status = DONE
+            except Exception:
+                job.error = traceback.format_exc()
+                job.status = CANCELLED if job.cancelled.is_set() else FAILED
+            with self.condition:
+                self.running -= 1
+                self.busy -= job.slots
+                self.condition.notify_all()
+            self.update(job)
+
+    def startable(self):
+        """
+        Must be called with the condition held
+        :return: Boolean of whether the highest priority pending job can start: it fits in the idle workers, or
+        nothing is running
+        """
+        return bool(self.heap) and (not self.busy or self.busy + self.heap[0].slots <= self.workers)
+
+    def update(self, job):
+        """
+        Report a change in the status of a job
+        :param job: Job that changed
+        """
+        if self.on_status is not None:
+            self.on_status(job)
+
+    def wait(self):
+        """
+        Block until every queued job has finished
+        """
+        with self.condition:
+            while self.heap or self.running:
+                self.condition.wait()
+
+    def shutdown(self, cancel=False):
+        """
+        Stop the worker threads once the queue is empty
+        :param cancel: Boolean to cancel all pending and running jobs first
+        """
+        if cancel:
+            for job in list(self.jobs):
+                if job.status in (PENDING, RUNNING):
+                    self.cancel(job)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def __init__(self, workers=None, on_status=None):
+        """
+        :param workers: maximum number of jobs to run at once. Determined from the cores and memory of the host if None
+        :param on_status: function called with a Job whenever its status changes
+        """
+        self.workers = workers if workers else default_workers()
+        self.on_status = on_status
+        self.jobs = list()
+        self.heap = list()
+        self.counter = count()
+        self.running = 0
+        # Slots occupied by the running jobs
+        self.busy = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.threads = list()
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+from collections import deque
+import os
+__author__ = 'adamkoziol'
+
+# Number of bytes at the start of the log that are compared on each read to notice that it was rewritten
+HEAD_BYTES = 1024
+
+
+class LogTail(object):
+
+    def read(self):
+        """
+        Read the lines appended to the log since the previous call. The inode and size of the file are checked
+        before reading, and its first bytes as it is read, so a rotated (new inode), truncated (smaller than the
+        stored offset), rewritten (different first bytes), or deleted log causes the reader to start over from the
+        beginning of the file, and sets self.reset to True
+        :return: list of the complete lines added since the last read
+        """
+        self.reset = False
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # The log was removed - forget the previous file so that its replacement is read from the start
+            if self.inode is not None:
+                self.restart(None)
+            return list()
+        if self.inode is None or stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.restart(stat.st_ino)
+        # Nothing has been written since the previous read
+        if stat.st_size == self.offset and stat.st_mtime_ns == self.mtime:
+            return list()
+        with open(self.path, 'rb') as log:
+            # A log truncated and rewritten to at least its previous size keeps its inode, but not its first bytes
+            if self.head and log.read(len(self.head)) != self.head:
+                self.restart(stat.st_ino)
+            log.seek(self.offset)
+            data = log.read()
+        self.mtime = stat.st_mtime_ns
+        if len(self.head) < HEAD_BYTES:
+            # The first bytes are only read while the offset is within them, so they follow on from the stored head
+            self.head = (self.head + data)[:HEAD_BYTES]
+        self.offset += len(data)
+        # Only complete lines are returned; a partially written final line is held until its newline arrives
+        data = self.partial + data
+        complete, _, self.partial = data.rpartition(b'\n')
+        if not complete and not _:
+            return list()
+        lines = (complete + b'\n').decode('utf-8', errors='replace').splitlines(True)
+        self.lines.extend(lines)
+        # Only the newly read lines need to be searched for the sample sheet
+        for entry in lines:
+            if 'SampleSheet:' in entry:
+                self.samplesheet = entry.split()[-1]
+        return lines
+
+    def restart(self, inode):
+        """
+        Clear the stored position, first bytes, partial line, scrollback, and sample sheet
+        :param inode: inode of the file to be followed from the beginning
+        """
+        # The first appearance of the log is not a restart
+        self.reset = self.inode is not None
+        self.inode = inode
+        self.offset = 0
+        self.mtime = None
+        self.head = bytes()
+        self.partial = bytes()
+        self.lines.clear()
+        self.samplesheet = str()
+
+    def text(self):
+        """
+        :return: the retained scrollback as a single string
+        """
+        return ''.join(self.lines)
+
+    def __init__(self, path, scrollback=5000):
+        """
+        :param path: path of the log file to follow
+        :param scrollback: maximum number of lines to retain
+        """
+        self.path = path
+        self.scrollback = scrollback
+        self.inode = None
+        self.offset = 0
+        self.mtime = None
+        self.head = bytes()
+        self.partial = bytes()
+        self.lines = deque(maxlen=scrollback)
+        self.samplesheet = str()
+        self.reset = False
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+import os
+__author__ = 'adamkoziol'
+
+# File systems on which inotify events are not delivered for changes made by other hosts
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'fuse.sshfs', 'afs', 'lustre', 'glusterfs',
+                       'fuse.glusterfs', 'ceph', '9p'}
+
+
+def network_filesystem(path, mounts='/proc/mounts'):
+    """
+    Determine whether the supplied path resides on a network file system
+    :param path: path of interest
+    :param mounts: table of mounted file systems
+    :return: Boolean of whether the file system type of the longest matching mount point is a network file system
+    """
+    path = os.path.realpath(path)
+    best = str()
+    fstype = str()
+    try:
+        with open(mounts) as mount_table:
+            for line in mount_table:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                        and len(mount_point) >= len(best):
+                    best = mount_point
+                    fstype = fields[2]
+    except IOError:
+        pass
+    return fstype in NETWORK_FILESYSTEMS
+
+
+class LogWatcher(QObject):
+    """
+    Emit changed whenever the watched file is modified, created, or replaced. File system events are used where
+    available, including while the folder of the file has yet to be created; on network file systems, or if no watch
+    can be set, the file is polled with an interval that backs off while the file is idle. Bursts of changes are
+    coalesced into a single emission
+    """
+    changed = pyqtSignal()
+
+    def start(self):
+        """
+        Begin watching the file
+        """
+        if not self.poll:
+            self.watch()
+        if self.poll:
+            self.signature = self.stat()
+            self.poll_timer.start(self.min_interval)
+
+    def stop(self):
+        """
+        Stop watching the file
+        """
+        self.poll_timer.stop()
+        self.coalesce_timer.stop()
+        paths = self.watcher.files() + self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+
+    def watch(self):
+        """
+        Add the log and its folder to the file system watcher. The folder is watched so that the creation of the log,
+        or its replacement after rotation, is noticed. Until the folder exists (e.g. before the pipeline has created
+        the output folder of a run), its nearest existing parent is watched instead, and the watch moves down a
+        level as each folder is created. Fall back to polling only if no watch can be set
+        """
+        while True:
+            folder = self.nearest_folder()
+            # Folders above the one to watch were only watched until it was created
+            stale = [directory for directory in self.watcher.directories() if directory != folder]
+            if stale:
+                self.watcher.removePaths(stale)
+            if folder not in self.watcher.directories() and not self.watcher.addPath(folder):
+                break
+            # A folder below may have been created before the watch was set, without notifying the watcher
+            if self.nearest_folder() == folder:
+                break
+        if os.path.isfile(self.path) and self.path not in self.watcher.files():
+            self.watcher.addPath(self.path)
+        if not self.watcher.files() and not self.watcher.directories():
+            self.poll = True
+
+    def nearest_folder(self):
+        """
+        :return: path of the folder of the file if it exists, otherwise of its nearest existing parent
+        """
+        folder = os.path.dirname(self.path)
+        while not os.path.isdir(folder) and os.path.dirname(folder) != folder:
+            folder = os.path.dirname(folder)
+        return folder
+
+    def stat(self):
+        """
+        :return: tuple of inode, size, and modification time of the file, or None if it does not exist
+        """
+        try:
+            stat = os.stat(self.path)
+            return stat.st_ino, stat.st_size, stat.st_mtime
+        except FileNotFoundError:
+            return None
+
+    def file_event(self, *args):
+        """
+        Start the coalescing timer unless it is already running; further events until it fires are absorbed
+        """
+        if not self.coalesce_timer.isActive():
+            self.coalesce_timer.start(self.coalesce)
+
+    def emit_changed(self):
+        """
+        Re-establish the watch on the log if it was replaced, move the watch towards the folder of the log as it is
+        created, and notify listeners
+        """
+        if not self.poll:
+            self.watch()
+        self.changed.emit()
+
+    def poll_file(self):
+        """
+        Compare the current state of the file to the previous poll. Poll again quickly after a change, and double
+        the interval (up to the maximum) while nothing changes
+        """
+        signature = self.stat()
+        if signature != self.signature:
+            self.signature = signature
+            self.interval = self.min_interval
+            self.file_event()
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        self.poll_timer.start(self.interval)
+
+    def __init__(self, path, coalesce=100, min_interval=250, max_interval=5000, poll=None, parent=None):
+        """
+        :param path: path of the file to watch
+        :param coalesce: milliseconds over which bursts of changes are combined into a single notification
+        :param min_interval: shortest polling interval in milliseconds
+        :param max_interval: longest polling interval in milliseconds
+        :param poll: Boolean to force (True) or disable (False) polling. Determined from the file system if None
+        :param parent: parent QObject
+        """
+        super(LogWatcher, self).__init__(parent)
+        self.path = os.path.abspath(path)
+        self.coalesce = coalesce
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.poll = network_filesystem(os.path.dirname(self.path)) if poll is None else poll
+        self.signature = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.file_event)
+        self.watcher.directoryChanged.connect(self.file_event)
+        self.coalesce_timer = QTimer(self)
+        self.coalesce_timer.setSingleShot(True)
+        self.coalesce_timer.timeout.connect(self.emit_changed)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setSingleShot(True)
+        self.poll_timer.timeout.connect(self.poll_file)
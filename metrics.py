@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+from contextlib import contextmanager
+from collections import deque
+import threading
+import resource
+import time
+import json
+import os
+__author__ = 'adamkoziol'
+
+METRICS = 'sippr_metrics.jsonl'
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of this process (Linux only), so that the peak of the next stage can be measured
+    :return: Boolean of whether the peak could be reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of this process in kB, since it started or since reset_peak_rss
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Metrics(object):
+    """
+    Records the duration and peak memory of each stage of an analysis. Each record is kept in memory, appended to a
+    JSON lines file, and passed to a callback. The peak memory is that of this process, and of the largest of its
+    finished child processes (e.g. a local pipeline, or the docker command line client). The memory of a container
+    belongs to the docker daemon, and is not included
+    """
+
+    @contextmanager
+    def stage(self, run, name, **extra):
+        """
+        Time the enclosed block
+        :param run: name of the MiSeq run
+        :param name: name of the stage
+        :param extra: additional values to include in the record
+        """
+        # The peak memory of stages running concurrently on other threads cannot be separated; only reset it when
+        # no other stage is being measured
+        with self.lock:
+            self.active += 1
+            if self.active == 1:
+                reset_peak_rss()
+        start = time.time()
+        timer = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            with self.lock:
+                self.active -= 1
+            self.record(run, name, time.perf_counter() - timer, start=start, status=status,
+                        peak_rss_kb=peak_rss(),
+                        child_process_peak_rss_kb=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+                        **extra)
+
+    def record(self, run, name, seconds, **extra):
+        """
+        Record a stage that was timed elsewhere
+        :param run: name of the MiSeq run
+        :param name: name of the stage
+        :param seconds: duration of the stage
+        :param extra: additional values to include in the record
+        """
+        entry = dict(extra, run=run, stage=name, seconds=round(seconds, 6), pid=os.getpid())
+        entry.setdefault('start', time.time() - seconds)
+        self.add(entry)
+
+    def add(self, entry):
+        """
+        Keep, write, and pass on a complete record, e.g. one made by Metrics in another process
+        :param entry: record dictionary
+        """
+        with self.lock:
+            self.records.append(entry)
+            if self.path:
+                try:
+                    # A single append of a complete line, so that concurrent processes do not interleave records
+                    with open(self.path, 'a') as metrics:
+                        metrics.write(json.dumps(entry, sort_keys=True) + '\n')
+                except (IOError, OSError):
+                    pass
+        if self.on_record is not None:
+            self.on_record(entry)
+
+    def __init__(self, path=None, on_record=None, max_records=10000):
+        """
+        :param path: JSON lines file to which records are appended. Not written if None
+        :param on_record: function called with each record dictionary
+        :param max_records: number of the most recent records to keep in memory. Every record is written to the file
+        """
+        self.path = path
+        self.on_record = on_record
+        self.records = deque(maxlen=max_records)
+        self.active = 0
+        self.lock = threading.Lock()
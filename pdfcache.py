@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import threading
+import hashlib
+import shutil
+import os
+__author__ = 'adamkoziol'
+
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'sippr_gui', 'gar')
+
+
+class PDFCache(object):
+    """
+    Content-addressed store of compiled reports. Each PDF is saved under the hash of everything used to create it,
+    and the least recently used PDFs are removed once the store exceeds its size limit
+    """
+
+    @staticmethod
+    def key(files, *parts):
+        """
+        Hash the contents of the supplied files, and any additional values
+        :param files: list of paths of input files. Missing files are hashed as absent
+        :param parts: additional values (e.g. the table headers and template version) that affect the output
+        :return: hexadecimal SHA-256 digest
+        """
+        digest = hashlib.sha256()
+        for path in files:
+            digest.update(os.path.basename(path).encode())
+            try:
+                with open(path, 'rb') as input_file:
+                    for chunk in iter(lambda: input_file.read(1 << 20), b''):
+                        digest.update(chunk)
+            except IOError:
+                digest.update(b'\0missing')
+            digest.update(b'\0')
+        for part in parts:
+            digest.update(repr(part).encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def entry(self, key):
+        """
+        :param key: hash of the inputs
+        :return: path of the cached PDF
+        """
+        return os.path.join(self.path, '{}.pdf'.format(key))
+
+    def get(self, key, destination):
+        """
+        Copy the cached PDF for the supplied key to the destination
+        :param key: hash of the inputs
+        :param destination: path to which the PDF is to be copied
+        :return: Boolean of whether the PDF was in the cache
+        """
+        entry = self.entry(key)
+        try:
+            shutil.copyfile(entry, destination)
+        except IOError:
+            return False
+        # Mark the entry as recently used
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return True
+
+    def put(self, key, pdf):
+        """
+        Add a compiled PDF to the cache, and evict old entries if the cache is too large
+        :param key: hash of the inputs
+        :param pdf: path of the compiled PDF
+        """
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            temporary = '{}.{}.{}.tmp'.format(self.entry(key), os.getpid(), threading.get_ident())
+            shutil.copyfile(pdf, temporary)
+            os.replace(temporary, self.entry(key))
+        except IOError:
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used PDFs until the cache is no larger than max_bytes
+        """
+        entries = list()
+        try:
+            for entry in os.scandir(self.path):
+                if entry.name.endswith('.pdf') and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def __init__(self, path=CACHE_PATH, max_bytes=512 * 1024 ** 2):
+        """
+        :param path: folder in which the PDFs are stored
+        :param max_bytes: maximum total size of the cached PDFs
+        """
+        self.path = path
+        self.max_bytes = max_bytes
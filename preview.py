@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+from datetime import datetime
+from html import escape
+from samplesheet import read_samplesheet
+from reportcache import ReportCache
+import gar
+import os
+__author__ = 'adamkoziol'
+
+
+class ReportPreview(object):
+    """
+    Normalised data of the reports of a run that is still being analysed. Each call to update re-reads only the
+    reports that have changed on disk, and re-normalises only their rows that have changed, so that the preview can
+    be refreshed throughout the analysis, and the final GAR can re-use the data rather than parsing it again
+    """
+
+    def update(self):
+        """
+        Re-read the reports that have changed since the last update
+        :return: list of the names of the reports whose data changed
+        """
+        changed = list()
+        for report in self.report_schema:
+            name = report['name']
+            path = os.path.join(self.reportpath, report['file'])
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if self.stamps.get(name) == stamp:
+                continue
+            try:
+                raw = gar.read_report(path, report)
+            except (gar.pandas.errors.EmptyDataError, gar.pandas.errors.ParserError, KeyError):
+                # The pipeline is still writing the report; try again at the next update
+                continue
+            self.stamps[name] = stamp
+            # As in GAR.clean_report, only the final entry of a repeated sample is kept
+            raw = raw[~raw.index.duplicated(keep='last')]
+            hashes = gar.pandas.util.hash_pandas_object(raw, index=True)
+            previous = self.report_data.get(name)
+            normalise = report.get('normalise', True)
+            # The normalisation of a value depends on the type of its whole column, so every row is re-normalised
+            # when the columns or their types change
+            if previous is None or list(raw.columns) != list(previous.columns) \
+                    or not raw.dtypes.equals(self.dtypes[name]):
+                self.report_data[name] = gar.GAR.clean_report(raw, normalise)
+            else:
+                modified = hashes.index[hashes.ne(self.hashes[name].reindex(hashes.index, fill_value=0))]
+                if not len(modified) and len(hashes) == len(self.hashes[name]):
+                    continue
+                clean = previous.reindex(raw.index)
+                if len(modified):
+                    clean.loc[modified] = gar.GAR.clean_report(raw.loc[modified], normalise)
+                self.report_data[name] = clean
+            self.hashes[name] = hashes
+            self.dtypes[name] = raw.dtypes
+            changed.append(name)
+        return changed
+
+    def sample_names(self):
+        """
+        :return: list of the samples in the sample sheet, or of every sample in the reports if there is no sheet
+        """
+        if self.sample_sheet and os.path.isfile(self.sample_sheet):
+            return read_samplesheet(self.sample_sheet).sample_ids()
+        samples = list()
+        for data in self.report_data.values():
+            samples.extend(sample for sample in data.index if sample not in samples)
+        return samples
+
+    def save_cache(self):
+        """
+        Save the current data of each report to the report cache of the run, so that the GAR can re-use them
+        without parsing the reports again, even in another process. Reports that have changed since they were read
+        are parsed again
+        """
+        report_cache = ReportCache(self.reportpath)
+        for report in self.report_schema:
+            name = report['name']
+            path = os.path.join(self.reportpath, report['file'])
+            if name in self.report_data and report_cache.load(report, path) is None:
+                report_cache.store(report, self.report_data[name], self.stamps[name])
+
+    def write_html(self):
+        """
+        Write the current data of every report as an HTML page. Samples without results yet are left blank
+        :return: path of the HTML file
+        """
+        samples = self.sample_names()
+        reported = set()
+        sections = list()
+        for report in self.report_schema:
+            sections.append('<h2>{}</h2>'.format(escape(report['title'])))
+            data = self.report_data.get(report['name'])
+            if data is None:
+                sections.append('<p>Not yet available</p>')
+                continue
+            reported.update(data.index)
+            columns = list(data.columns) if report['columns'] is None \
+                else [column for column in report['columns'] if column in data.columns]
+            sections.append(data.reindex(index=samples, columns=columns).rename_axis('Strain')
+                            .to_html(na_rep='', border=1))
+            sections.append('<p><i>{}</i></p>'.format(escape(report['caption'])))
+        page = '\n'.join(['<!DOCTYPE html>',
+                          '<html><head><meta charset="utf-8"><title>{} preview</title></head><body>'
+                          .format(escape(self.miseqfolder)),
+                          '<h1>GeneSippr Analysis Report preview: {}</h1>'.format(escape(self.miseqfolder)),
+                          '<p>Updated {time}. Results for {done} of {total} samples</p>'
+                          .format(time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                                  done=len(reported.intersection(samples)), total=len(samples))]
+                         + sections + ['</body></html>'])
+        # Replace the page in one step, so that a browser never loads a partially written preview
+        temporary = '{}.{}.tmp'.format(self.html_path, os.getpid())
+        with open(temporary, 'w') as html:
+            html.write(page)
+        os.replace(temporary, self.html_path)
+        return self.html_path
+
+    def __init__(self, outputpath, miseqfolder, sample_sheet=None, report_schema=gar.REPORT_SCHEMA):
+        """
+        :param outputpath: path of the folder containing the output folder of the run
+        :param miseqfolder: name of the MiSeq run folder
+        :param sample_sheet: path of the sample sheet used in the analysis
+        :param report_schema: reports to include, as in gar.REPORT_SCHEMA
+        """
+        self.miseqfolder = miseqfolder
+        self.reportpath = os.path.join(outputpath, miseqfolder, 'reports')
+        self.sample_sheet = sample_sheet
+        self.report_schema = report_schema
+        # Written beside the output folder of the run, as is the GAR
+        self.html_path = '{}_gar_preview.html'.format(os.path.join(outputpath, miseqfolder))
+        self.report_data = dict()
+        self.stamps = dict()
+        self.hashes = dict()
+        self.dtypes = dict()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+import pandas
+import numpy
+import hashlib
+import json
+import os
+__author__ = 'adamkoziol'
+
+CACHE_FOLDER = 'cache'
+# Increment whenever the layout of the cache changes, so that older caches are ignored
+CACHE_VERSION = 2
+
+
+def file_stamp(path):
+    """
+    :param path: path of a report
+    :return: list of the modification time in nanoseconds and the size of the report, or None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def code_type(categories):
+    """
+    :param categories: largest number of distinct values in a column
+    :return: the smallest signed NumPy integer type that can hold the code of every value, and -1 for missing values
+    """
+    for dtype in (numpy.int8, numpy.int16, numpy.int32):
+        if categories <= numpy.iinfo(dtype).max:
+            return dtype
+    return numpy.int64
+
+
+def report_settings(report):
+    """
+    :param report: dictionary of the report in gar.REPORT_SCHEMA
+    :return: dictionary of the settings of the report that change its normalised data
+    """
+    columns = report['columns']
+    return {'columns': list(columns) if columns is not None else None,
+            'normalise': report.get('normalise', True)}
+
+
+def map_codes(path):
+    """
+    :param path: path of the .npy file of the codes of a report
+    :return: the codes, memory mapped read-only
+    """
+    try:
+        return numpy.load(path, mmap_mode='r')
+    except ValueError:
+        # An empty file cannot be mapped; the codes of a report without samples are read instead
+        return numpy.load(path)
+
+
+class ReportTable(object):
+    """
+    Normalised (+/-) data of a report, stored by column as categorical codes: each cell is a small integer indexing
+    the distinct values of its column, or -1 where the sample has no value. The codes of a cached report are memory
+    mapped, so only the parts that are read are loaded
+    """
+
+    def column(self, name):
+        """
+        :param name: header of the column
+        :return: NumPy array of the codes of the column, in the order of the samples
+        """
+        return self.codes[:, self.columns.index(name)]
+
+    def value(self, row, column):
+        """
+        :param row: index of the sample
+        :param column: index of the column
+        :return: the value of the cell, or None if the sample has no value
+        """
+        code = self.codes[row, column]
+        return self.categories[column][code] if code >= 0 else None
+
+    def frame(self):
+        """
+        :return: pandas DataFrame of strings indexed by sample name, as returned by gar.GAR.clean_report
+        """
+        data = dict()
+        for index, column in enumerate(self.columns):
+            # Missing values (-1) index the final element
+            values = numpy.array(self.categories[index] + [numpy.nan], dtype=object)
+            data[column] = values[self.codes[:, index]]
+        return pandas.DataFrame(data, index=pandas.Index(self.samples, name='Strain'), columns=self.columns)
+
+    @classmethod
+    def encode(cls, data):
+        """
+        :param data: pandas DataFrame of a normalised report, as returned by gar.GAR.clean_report
+        :return: ReportTable of the data, held in memory
+        """
+        factorised = [pandas.factorize(data.iloc[:, index]) for index in range(len(data.columns))]
+        categories = [[str(value) for value in uniques] for _, uniques in factorised]
+        codes = numpy.empty(data.shape, dtype=code_type(max([len(values) for values in categories] or [0])),
+                            order='F')
+        for index, (column_codes, _) in enumerate(factorised):
+            codes[:, index] = column_codes
+        return cls(codes, data.index.tolist(), [str(column) for column in data.columns], categories)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __init__(self, codes, samples, columns, categories):
+        """
+        :param codes: two-dimensional NumPy array of the code of each sample (row) and column
+        :param samples: list of the sample names
+        :param columns: list of the column headers
+        :param categories: list of the distinct values of each column
+        """
+        self.codes = codes
+        self.samples = samples
+        self.columns = columns
+        self.categories = categories
+
+
+class ReportCache(object):
+    """
+    Normalised reports of a run, saved as ReportTables in a folder beside the reports. Each cached report records the
+    modification time and size of the CSV it was created from, and is only re-used while they are unchanged
+    """
+
+    def description(self, name):
+        """
+        :param name: name of the report in gar.REPORT_SCHEMA
+        :return: path of the description of the cached report
+        """
+        return os.path.join(self.cachepath, '{}.json'.format(name))
+
+    def load(self, report, path):
+        """
+        :param report: dictionary of the report in gar.REPORT_SCHEMA
+        :param path: path of the CSV of the report
+        :return: memory mapped ReportTable of the report, or None if it is not cached, or the report or its settings
+        have changed
+        """
+        try:
+            with open(self.description(report['name'])) as description:
+                meta = json.load(description)
+        except (IOError, ValueError):
+            return None
+        if meta.get('version') != CACHE_VERSION or meta.get('stamp') != file_stamp(path) \
+                or meta.get('settings') != report_settings(report):
+            return None
+        try:
+            codes = map_codes(os.path.join(self.cachepath, meta['codes']))
+        except (IOError, ValueError):
+            return None
+        if list(codes.shape) != [len(meta['samples']), len(meta['columns'])]:
+            return None
+        return ReportTable(codes, meta['samples'], meta['columns'], meta['categories'])
+
+    def store(self, report, data, stamp):
+        """
+        Save a normalised report. The codes are written to a new file named after their digest before the
+        description is replaced, so that a reader never pairs a description with the codes of another version
+        :param report: dictionary of the report in gar.REPORT_SCHEMA
+        :param data: pandas DataFrame of the normalised report, or a ReportTable
+        :param stamp: file_stamp of the CSV from which the data were read
+        :return: memory mapped ReportTable of the saved report
+        """
+        name = report['name']
+        table = data if isinstance(data, ReportTable) else ReportTable.encode(data)
+        os.makedirs(self.cachepath, exist_ok=True)
+        meta = {'version': CACHE_VERSION,
+                'samples': table.samples,
+                'columns': table.columns,
+                'categories': table.categories}
+        # The codes are named after the data alone, so that they are re-used if only the stamp of the report changes
+        digest = hashlib.sha256(json.dumps(meta, sort_keys=True).encode())
+        digest.update(numpy.ascontiguousarray(table.codes).tobytes())
+        meta['stamp'] = list(stamp) if stamp is not None else None
+        meta['settings'] = report_settings(report)
+        meta['codes'] = '{name}.{digest}.npy'.format(name=name, digest=digest.hexdigest()[:16])
+        codes_path = os.path.join(self.cachepath, meta['codes'])
+        if not os.path.isfile(codes_path):
+            temporary = '{}.{}.tmp'.format(codes_path, os.getpid())
+            with open(temporary, 'wb') as codes:
+                numpy.save(codes, numpy.asfortranarray(table.codes))
+            os.replace(temporary, codes_path)
+        temporary = '{}.{}.tmp'.format(self.description(name), os.getpid())
+        with open(temporary, 'w') as description:
+            json.dump(meta, description)
+        os.replace(temporary, self.description(name))
+        # Remove the codes of earlier versions of the report. Readers that have them mapped keep their copy
+        for entry in os.scandir(self.cachepath):
+            if entry.name.startswith('{}.'.format(name)) and entry.name.endswith('.npy') \
+                    and entry.name != meta['codes']:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        return ReportTable(map_codes(codes_path), table.samples, table.columns, table.categories)
+
+    def read(self, report, path):
+        """
+        :param report: dictionary of the report in gar.REPORT_SCHEMA
+        :param path: path of the CSV of the report
+        :return: ReportTable of the report: from the cache if it is current, otherwise parsed, normalised, and cached
+        """
+        table = self.load(report, path)
+        if table is None:
+            # The report engine supplies the parsing and the normalisation
+            import gar
+            stamp = file_stamp(path)
+            table = self.store(report, gar.GAR.clean_report(gar.read_report(path, report),
+                                                            report.get('normalise', True)), stamp)
+        return table
+
+    def __init__(self, reportpath):
+        """
+        :param reportpath: path of the reports folder of a run
+        """
+        self.cachepath = os.path.join(reportpath, CACHE_FOLDER)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from contextlib import closing
+import hashlib
+import sqlite3
+import sys
+import os
+
+testpath = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testpath)
+__author__ = 'adamkoziol'
+
+DATABASE = 'sippr_results.sqlite'
+# Increment whenever the values stored for a report change (e.g. its normalisation), so that every report is read
+# again the next time its run is ingested
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    run TEXT NOT NULL,
+    report TEXT NOT NULL,
+    path TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (run, report)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run TEXT NOT NULL,
+    report TEXT NOT NULL,
+    sample TEXT NOT NULL,
+    marker TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (run, report, sample, marker)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_marker ON results (report, marker, value, run);
+CREATE INDEX IF NOT EXISTS results_sample ON results (sample);
+"""
+
+
+def file_hash(path):
+    """
+    :param path: path of the file
+    :return: hexadecimal SHA-256 digest of the contents of the file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_markers(markers):
+    """
+    :param markers: list of marker results in the form marker=value e.g. ['O157=+', 'VT2=+']
+    :return: dictionary of marker: value
+    :raises ValueError: if a marker result has no value
+    """
+    parsed = dict()
+    for marker in markers:
+        name, separator, value = marker.partition('=')
+        if not separator or not name:
+            raise ValueError('Marker results must be in the form marker=value, not {}'.format(marker))
+        parsed[name] = value
+    return parsed
+
+
+class ResultsIndex(object):
+    """
+    SQLite store of the normalised (+/-) report data of every analysed run, indexed by run, sample, and marker.
+    Reports are only re-read when their modification time, size, and contents change
+    """
+
+    def connect(self):
+        """
+        :return: connection to the database. Each call opens a new connection, so the index can be used from
+        several threads
+        """
+        connection = sqlite3.connect(self.path, timeout=60)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def ingest(self, outputpath, miseqfolder):
+        """
+        Add the reports of an analysed run to the index, skipping any that are unchanged since they were last added
+        :param outputpath: path of the folder containing the output folder of the run
+        :param miseqfolder: name of the MiSeq run folder
+        :return: list of the names of the reports that were (re-)ingested
+        """
+        # The report engine supplies the report schema and the normalisation, and pulls in pandas
+        import gar
+        from reportcache import ReportCache
+        report_cache = ReportCache(os.path.join(outputpath, miseqfolder, 'reports'))
+        ingested = list()
+        with closing(self.connect()) as connection:
+            for report in gar.REPORT_SCHEMA:
+                path = os.path.join(outputpath, miseqfolder, 'reports', report['file'])
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                known = connection.execute('SELECT mtime_ns, size, sha256 FROM reports WHERE run = ? AND report = ?',
+                                           (miseqfolder, report['name'])).fetchone()
+                if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                sha256 = file_hash(path)
+                with connection:
+                    if known is None or known[2] != sha256:
+                        data = report_cache.read(report, path).frame()
+                        # One row per sample and marker
+                        long_data = data.rename_axis(index='sample', columns='marker').stack().reset_index()
+                        connection.execute('DELETE FROM results WHERE run = ? AND report = ?',
+                                           (miseqfolder, report['name']))
+                        connection.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?)',
+                                               ((miseqfolder, report['name'], str(sample), str(marker), str(value))
+                                                for sample, marker, value in long_data.itertuples(index=False)))
+                        ingested.append(report['name'])
+                    connection.execute('INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?)',
+                                       (miseqfolder, report['name'], path, stat.st_mtime_ns, stat.st_size, sha256))
+        return ingested
+
+    def ingest_all(self, outputpath):
+        """
+        Add every analysed run in the output folder to the index
+        :param outputpath: path of the folder containing the output folders of the runs
+        :return: dictionary of run name: list of (re-)ingested reports
+        """
+        ingested = dict()
+        for entry in sorted(os.scandir(outputpath), key=lambda entry: entry.name):
+            if entry.is_dir() and os.path.isdir(os.path.join(entry.path, 'reports')):
+                ingested[entry.name] = self.ingest(outputpath, entry.name)
+        return ingested
+
+    def runs(self, last=None):
+        """
+        :param last: number of the most recent runs to return. All runs if None
+        :return: list of run names, most recent first (MiSeq run names begin with the date)
+        """
+        query = 'SELECT DISTINCT run FROM reports ORDER BY run DESC'
+        parameters = tuple()
+        if last:
+            query += ' LIMIT ?'
+            parameters = (last,)
+        with closing(self.connect()) as connection:
+            return [row[0] for row in connection.execute(query, parameters)]
+
+    def samples_with(self, markers, report='genesippr', last=None):
+        """
+        Find the samples with the supplied value for every one of the supplied markers
+        :param markers: dictionary of marker: value e.g. {'O157': '+', 'VT2': '+'}. Every sample in the report if
+        empty
+        :param report: name of the report containing the markers
+        :param last: only search the most recent runs. All runs if None
+        :return: list of tuples of run and sample
+        """
+        clauses = list()
+        parameters = list()
+        for marker, value in sorted(markers.items()):
+            clauses.append('SELECT run, sample FROM results WHERE report = ? AND marker = ? AND value = ?')
+            parameters.extend([report, marker, value])
+        if not clauses:
+            clauses.append('SELECT DISTINCT run, sample FROM results WHERE report = ?')
+            parameters.append(report)
+        query = ' INTERSECT '.join(clauses)
+        if last:
+            query = 'SELECT run, sample FROM ({}) WHERE run IN ' \
+                    '(SELECT DISTINCT run FROM reports ORDER BY run DESC LIMIT ?)'.format(query)
+            parameters.append(last)
+        query += ' ORDER BY run DESC, sample'
+        with closing(self.connect()) as connection:
+            return connection.execute(query, parameters).fetchall()
+
+    def reports(self):
+        """
+        :return: list of the names of the reports in the index
+        """
+        with closing(self.connect()) as connection:
+            return [row[0] for row in connection.execute('SELECT DISTINCT report FROM reports ORDER BY report')]
+
+    def sample_results(self, sample):
+        """
+        :param sample: name of the sample
+        :return: list of tuples of run, report, marker, and value for every result of the sample
+        """
+        with closing(self.connect()) as connection:
+            return connection.execute('SELECT run, report, marker, value FROM results WHERE sample = ? '
+                                      'ORDER BY run DESC, report, marker', (sample,)).fetchall()
+
+    def __init__(self, path):
+        """
+        :param path: path of the SQLite database. Created if it does not exist
+        """
+        self.path = path
+        with closing(self.connect()) as connection:
+            connection.executescript(SCHEMA)
+            if connection.execute('PRAGMA user_version').fetchone()[0] != INDEX_VERSION:
+                # The results already indexed remain searchable until their runs are ingested again
+                with connection:
+                    connection.execute('DELETE FROM reports')
+                    connection.execute('PRAGMA user_version = {:d}'.format(INDEX_VERSION))
+
+
+def results_index(outputpath):
+    """
+    :param outputpath: path of the folder containing the output folders of the runs
+    :return: ResultsIndex stored in the output folder
+    """
+    return ResultsIndex(os.path.join(outputpath, DATABASE))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Index the results of analysed runs, and search them')
+    parser.add_argument('-o', '--outputpath',
+                        required=True,
+                        help='Path of the folder containing the output folders of the runs')
+    subparsers = parser.add_subparsers(dest='command')
+    ingest_parser = subparsers.add_parser('ingest',
+                                          help='Add analysed runs to the index')
+    ingest_parser.add_argument('miseqfolders',
+                               nargs='*',
+                               help='Names of the runs to add. Every run in the output folder if not provided')
+    query_parser = subparsers.add_parser('query',
+                                         help='Find the samples with the supplied marker results')
+    query_parser.add_argument('markers',
+                              nargs='+',
+                              help='Marker results in the form marker=value e.g. O157=+ VT2=+')
+    query_parser.add_argument('-r', '--report',
+                              default='genesippr',
+                              help='Report containing the markers. Default is genesippr')
+    query_parser.add_argument('-l', '--last',
+                              type=int,
+                              help='Only search the most recent runs')
+    sample_parser = subparsers.add_parser('sample',
+                                          help='Show every result of a sample')
+    sample_parser.add_argument('sample',
+                               help='Name of the sample')
+    args = parser.parse_args()
+    index = results_index(args.outputpath)
+    if args.command == 'ingest':
+        if args.miseqfolders:
+            ingested = {miseqfolder: index.ingest(args.outputpath, miseqfolder) for miseqfolder in args.miseqfolders}
+        else:
+            ingested = index.ingest_all(args.outputpath)
+        for miseqfolder, reports in sorted(ingested.items()):
+            print('{mf}: {reports}'.format(mf=miseqfolder, reports=', '.join(reports) or 'unchanged'))
+    elif args.command == 'query':
+        try:
+            markers = parse_markers(args.markers)
+        except ValueError as error:
+            parser.error(str(error))
+        for run, sample in index.samples_with(markers, report=args.report, last=args.last):
+            print('{run},{sample}'.format(run=run, sample=sample))
+    elif args.command == 'sample':
+        for row in index.sample_results(args.sample):
+            print(','.join(row))
+    else:
+        parser.print_help()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QLineEdit, QLabel, QTableView
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from reportcache import ReportCache
+import numpy
+import gar
+import os
+__author__ = 'adamkoziol'
+
+
+def load_tables(outputpath, miseqfolder, report_schema=gar.REPORT_SCHEMA):
+    """
+    Read the normalised reports of an analysed run, from the cache beside the reports where it is current
+    :param outputpath: path of the folder containing the output folder of the run
+    :param miseqfolder: name of the MiSeq run folder
+    :param report_schema: reports to load, as in gar.REPORT_SCHEMA
+    :return: list of tuples of the report dictionary from the schema, and its reportcache.ReportTable. Reports that
+    do not exist are left out
+    """
+    reportpath = os.path.join(outputpath, miseqfolder, 'reports')
+    report_cache = ReportCache(reportpath)
+    tables = list()
+    for report in report_schema:
+        path = os.path.join(reportpath, report['file'])
+        if os.path.isfile(path):
+            tables.append((report, report_cache.read(report, path)))
+    return tables
+
+
+def category_ranks(categories):
+    """
+    :param categories: list of the distinct values of a column
+    :return: NumPy array of the alphabetical rank of each value, indexed by code. Missing values (-1) rank last
+    """
+    ranks = numpy.empty(len(categories) + 1, dtype=numpy.int64)
+    ranks[sorted(range(len(categories)), key=lambda code: categories[code].lower())] = numpy.arange(len(categories))
+    ranks[-1] = len(categories)
+    return ranks
+
+
+class ResultsModel(QAbstractTableModel):
+    """
+    Table model of the normalised results of a report. Cells are decoded from the categorical codes of the
+    reportcache.ReportTable only when they are displayed, rows are added to the view in batches as it is scrolled, and
+    sorting and filtering operate on the codes of the whole table with NumPy, so that runs with thousands of samples
+    do not have to be held as strings or as items
+    """
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or self.table is None else len(self.columns) + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.TextAlignmentRole):
+            return None
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter if index.column() else Qt.AlignLeft | Qt.AlignVCenter
+        row = self.order[index.row()]
+        if not index.column():
+            return str(self.table.samples[row])
+        value = self.table.value(row, self.columns[index.column() - 1])
+        # As in the GAR, samples without a value are shown as absent
+        return '-' if value is None else value
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or self.table is None:
+            return None
+        if orientation == Qt.Vertical:
+            return section + 1
+        return 'Strain' if not section else self.table.columns[self.columns[section - 1]]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.fetched < len(self.order)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.batch_size, len(self.order) - self.fetched)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.fetched, self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.refresh()
+
+    def set_table(self, table, columns=None):
+        """
+        Display a report
+        :param table: reportcache.ReportTable of the report, or None to clear the table
+        :param columns: list of the headers of the columns to display. All columns if None
+        """
+        self.table = table
+        self.columns = list()
+        self.ranks = dict()
+        self.sample_ranks = None
+        if table is not None:
+            self.columns = [table.columns.index(column) for column in columns if column in table.columns] \
+                if columns is not None else list(range(len(table.columns)))
+            samples = numpy.array([str(sample).lower() for sample in table.samples])
+            self.sample_ranks = numpy.empty(len(samples), dtype=numpy.int64)
+            self.sample_ranks[numpy.argsort(samples, kind='mergesort')] = numpy.arange(len(samples))
+        self.sort_column = min(self.sort_column, len(self.columns))
+        self.refresh()
+
+    def set_filter(self, text=str(), marker=None):
+        """
+        Show only the samples that match
+        :param text: text found in the name or the genus of each sample shown, ignoring case
+        :param marker: header of a column in which each sample shown must be positive (+), or None
+        """
+        self.text = text.strip().lower()
+        self.marker = marker
+        self.refresh()
+
+    def matches(self):
+        """
+        :return: NumPy array of the indices of the samples of the table that match the filter
+        """
+        mask = numpy.ones(len(self.table), dtype=bool)
+        if self.text:
+            found = numpy.array([self.text in str(sample).lower() for sample in self.table.samples], dtype=bool)
+            if 'Genus' in self.table.columns:
+                column = self.table.columns.index('Genus')
+                genera = numpy.array([self.text in value.lower() for value in self.table.categories[column]]
+                                     + [False], dtype=bool)
+                found |= genera[self.table.codes[:, column]]
+            mask &= found
+        if self.marker in self.table.columns:
+            column = self.table.columns.index(self.marker)
+            categories = self.table.categories[column]
+            if '+' in categories:
+                mask &= self.table.codes[:, column] == categories.index('+')
+            else:
+                mask[:] = False
+        return numpy.flatnonzero(mask)
+
+    def refresh(self):
+        """
+        Filter and sort the samples, and show the first batch
+        """
+        self.beginResetModel()
+        if self.table is None:
+            self.order = numpy.arange(0)
+        else:
+            rows = self.matches()
+            if not self.sort_column:
+                keys = self.sample_ranks[rows]
+            else:
+                column = self.columns[self.sort_column - 1]
+                if column not in self.ranks:
+                    self.ranks[column] = category_ranks(self.table.categories[column])
+                keys = self.ranks[column][self.table.codes[rows, column]]
+            if self.sort_order == Qt.DescendingOrder:
+                keys = -keys
+            self.order = rows[numpy.argsort(keys, kind='mergesort')]
+        self.fetched = min(self.batch_size, len(self.order))
+        self.endResetModel()
+
+    def __init__(self, parent=None, batch_size=256):
+        """
+        :param parent: parent QObject
+        :param batch_size: number of rows to add to the view at once
+        """
+        super(ResultsModel, self).__init__(parent)
+        self.batch_size = batch_size
+        self.table = None
+        self.columns = list()
+        self.ranks = dict()
+        self.sample_ranks = None
+        self.order = numpy.arange(0)
+        self.fetched = 0
+        self.sort_column = 0
+        self.sort_order = Qt.AscendingOrder
+        self.text = str()
+        self.marker = None
+
+
+class ResultsPanel(QWidget):
+    """
+    Results of an analysed run: a report selector, filters of the sample name or genus and of marker presence, and a
+    sortable table of the selected report
+    """
+
+    def set_tables(self, tables):
+        """
+        :param tables: list of tuples of report dictionary and reportcache.ReportTable, as returned by load_tables
+        """
+        self.tables = tables
+        self.report_box.blockSignals(True)
+        self.report_box.clear()
+        for report, _ in tables:
+            self.report_box.addItem(report['title'])
+        self.report_box.blockSignals(False)
+        self.select_report(0)
+
+    def select_report(self, index):
+        """
+        Show the report at the supplied index of the tables, and list its markers in the marker filter
+        :param index: index of the report
+        """
+        if not 0 <= index < len(self.tables):
+            self.model.set_table(None)
+            self.update_count()
+            return
+        report, table = self.tables[index]
+        columns = report['columns']
+        self.model.set_table(table, columns=list(columns) if columns is not None else None)
+        self.marker_box.blockSignals(True)
+        self.marker_box.clear()
+        self.marker_box.addItem('Any markers', None)
+        for column in self.model.columns:
+            if '+' in table.categories[column]:
+                self.marker_box.addItem('{} present'.format(table.columns[column]), table.columns[column])
+        self.marker_box.blockSignals(False)
+        self.apply_filter()
+
+    def apply_filter(self, *args):
+        """
+        Filter the table with the current text and marker
+        """
+        self.model.set_filter(self.filter_edit.text(), self.marker_box.currentData())
+        self.update_count()
+
+    def update_count(self):
+        """
+        Show the number of samples shown out of the samples in the report
+        """
+        total = len(self.model.table) if self.model.table is not None else 0
+        self.count_label.setText('{shown} of {total} samples'.format(shown=len(self.model.order), total=total))
+
+    def __init__(self, parent=None):
+        super(ResultsPanel, self).__init__(parent)
+        self.tables = list()
+        layout = QVBoxLayout(self)
+        controls = QHBoxLayout()
+        self.report_box = QComboBox(self)
+        self.report_box.currentIndexChanged.connect(self.select_report)
+        controls.addWidget(self.report_box)
+        self.filter_edit = QLineEdit(self)
+        self.filter_edit.setPlaceholderText('Filter by sample or genus')
+        self.filter_edit.textChanged.connect(self.apply_filter)
+        controls.addWidget(self.filter_edit)
+        self.marker_box = QComboBox(self)
+        self.marker_box.currentIndexChanged.connect(self.apply_filter)
+        controls.addWidget(self.marker_box)
+        self.count_label = QLabel(self)
+        controls.addWidget(self.count_label)
+        layout.addLayout(controls)
+        self.model = ResultsModel(self)
+        self.view = QTableView(self)
+        self.view.setModel(self.model)
+        self.view.setSortingEnabled(True)
+        self.view.sortByColumn(0, Qt.AscendingOrder)
+        self.view.verticalHeader().setDefaultSectionSize(self.view.fontMetrics().height() + 6)
+        layout.addWidget(self.view)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+from collections import deque
+import threading
+import time
+import json
+import re
+import os
+__author__ = 'adamkoziol'
+
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'sippr_gui', 'runinfo.json')
+# Increment when the contents of the cache entries change, so that older entries are rebuilt
+CACHE_VERSION = 3
+# Folder of the base calls of a single cycle e.g. C42.1
+CYCLE_FOLDER = re.compile(r'^C(\d+)\.1$')
+
+
+def basecalls_path(miseqpath, miseqfolder):
+    """
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :return: path of the folder containing one sub-folder per completed cycle
+    """
+    return os.path.join(miseqpath, miseqfolder, 'Data', 'Intensities', 'BaseCalls', 'L001')
+
+
+def cycle_count(miseqpath, miseqfolder):
+    """
+    Count the number of completed cycles in the run
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :return: number of cycle folders
+    """
+    cycles = 0
+    try:
+        # scandir returns the entry type with each name, so no per-entry stat calls are made
+        for entry in os.scandir(basecalls_path(miseqpath, miseqfolder)):
+            if entry.name.startswith('C') and entry.is_dir():
+                cycles += 1
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return cycles
+
+
+def read_cycles(miseqpath, miseqfolder):
+    """
+    Extract the number of cycles of each read (forward, index, and reverse) in the run from the RunInfo.xml file
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :return: dictionary of read number: number of cycles
+    """
+    reads = dict()
+    try:
+        # Stream the file, and stop as soon as the list of reads has been parsed
+        for _, elem in ElementTree.iterparse(os.path.join(miseqpath, miseqfolder, 'RunInfo.xml')):
+            if elem.tag == 'Read':
+                try:
+                    reads[elem.attrib['Number']] = elem.attrib['NumCycles']
+                except KeyError:
+                    pass
+            elif elem.tag == 'Reads':
+                break
+            elem.clear()
+    except (IOError, ElementTree.ParseError):
+        pass
+    return reads
+
+
+def mtime(path):
+    """
+    :param path: path of interest
+    :return: modification time of the path in nanoseconds, or None if it does not exist
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+class RunInfoCache(object):
+    """
+    Persistent store of the cycle count and read lengths of each run. Entries are keyed on the path of the run,
+    and are re-used until the modification time of the cycle folder or of the RunInfo.xml changes
+    """
+
+    def lookup(self, miseqpath, miseqfolder, save=True):
+        """
+        Retrieve the metadata of a run, scanning the run folder only if it changed since it was cached
+        :param miseqpath: path of the folder containing MiSeq run data folders
+        :param miseqfolder: name of the MiSeq run folder
+        :param save: Boolean of whether to write a changed cache to disk
+        :return: dictionary of cycles, totalcycles, readlengthforward, readlengthreverse, and updated
+        """
+        run_path = os.path.abspath(os.path.join(miseqpath, miseqfolder))
+        stamp = [CACHE_VERSION,
+                 mtime(basecalls_path(miseqpath, miseqfolder)),
+                 mtime(os.path.join(run_path, 'RunInfo.xml'))]
+        with self.lock:
+            entry = self.entries.get(run_path)
+        if entry is not None and entry['stamp'] == stamp:
+            return entry
+        reads = read_cycles(miseqpath, miseqfolder)
+        entry = {
+            'stamp': stamp,
+            'cycles': cycle_count(miseqpath, miseqfolder),
+            'totalcycles': sum(int(cycles) for cycles in reads.values()),
+            'readlengthforward': reads.get('1', 'full'),
+            'readlengthreverse': reads.get('4', 'full'),
+            # Seconds since the epoch at which a cycle folder was last added
+            'updated': stamp[1] / 1e9 if stamp[1] is not None else None
+        }
+        with self.lock:
+            self.entries[run_path] = entry
+            self.changed = True
+        if save:
+            self.save()
+        return entry
+
+    def load(self):
+        """
+        Read the cache from disk. A missing or corrupt cache is treated as empty
+        """
+        try:
+            with open(self.path) as cache:
+                self.entries = json.load(cache)
+        except (IOError, ValueError):
+            self.entries = dict()
+
+    def save(self):
+        """
+        Write the cache to disk if it changed. The file is replaced atomically so concurrent readers never see a
+        partial file
+        """
+        if not self.path:
+            return
+        with self.lock:
+            if not self.changed:
+                return
+            self.changed = False
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                temporary = '{}.{}.tmp'.format(self.path, os.getpid())
+                with open(temporary, 'w') as cache:
+                    json.dump(self.entries, cache)
+                os.replace(temporary, self.path)
+            except OSError:
+                pass
+
+    def __init__(self, path=CACHE_PATH):
+        """
+        :param path: path of the JSON file in which the cache is stored. Not persisted if None
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = dict()
+        # Whether entries were added since the cache was loaded or saved
+        self.changed = False
+        if self.path:
+            self.load()
+
+
+cache = None
+cache_lock = threading.Lock()
+
+
+def shared_cache():
+    """
+    :return: the RunInfoCache shared by the whole process, created when it is first used
+    """
+    global cache
+    with cache_lock:
+        if cache is None:
+            cache = RunInfoCache()
+    return cache
+
+
+def run_info(miseqpath, miseqfolder, save=True):
+    """
+    Retrieve the metadata of a run from the shared cache
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :param save: Boolean of whether to write a changed cache to disk. Scans of many runs save it once at the end
+    with shared_cache().save()
+    :return: dictionary of cycles, totalcycles, readlengthforward, readlengthreverse, and updated
+    """
+    return shared_cache().lookup(miseqpath, miseqfolder, save=save)
+
+
+def ready(cycles, readlengthforward):
+    """
+    Determine whether enough cycles have completed to analyse the run: the forward reads and both index reads
+    :param cycles: number of completed cycles
+    :param readlengthforward: number of forward cycles from the RunInfo.xml
+    :return: Boolean of whether the analysis can start
+    """
+    try:
+        return cycles >= int(readlengthforward) + 16
+    except ValueError:
+        return False
+
+
+def sequencing(info, window=3600):
+    """
+    Determine whether a run that is not ready is still being sequenced, rather than aborted or abandoned
+    :param info: metadata dictionary from run_info
+    :param window: number of seconds within which a cycle must have completed
+    :return: Boolean of whether a cycle completed within the window
+    """
+    updated = info.get('updated')
+    return updated is not None and time.time() - updated <= window
+
+
+class CycleMonitor(object):
+    """
+    Follows the progress of a run that is still being sequenced. The cycle folders are listed once; after that, each
+    poll only checks for the folders of the cycles after the last one seen, so a poll costs a stat or two rather
+    than a scan of the run. The rate at which cycles appear is used to estimate when the run will be ready to analyse
+    """
+
+    def scan(self):
+        """
+        List the cycle folders once, and estimate the recent cycle rate from the modification times of the latest
+        """
+        folders = dict()
+        try:
+            for entry in os.scandir(self.path):
+                match = CYCLE_FOLDER.match(entry.name)
+                if match and entry.is_dir():
+                    folders[int(match.group(1))] = entry
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        self.scanned = True
+        # Cycles are only counted while they are consecutive, as each poll looks for the next cycle
+        while self.cycles + 1 in folders:
+            self.cycles += 1
+        for cycle in range(max(1, self.cycles - self.history.maxlen + 1), self.cycles + 1):
+            try:
+                self.history.append((folders[cycle].stat().st_mtime, cycle))
+            except OSError:
+                pass
+
+    def poll(self):
+        """
+        Check for cycles completed since the last poll
+        :return: number of completed cycles
+        """
+        if not self.scanned:
+            self.scan()
+            return self.cycles
+        found = False
+        while os.path.isdir(os.path.join(self.path, 'C{}.1'.format(self.cycles + 1))):
+            self.cycles += 1
+            found = True
+        if found:
+            self.history.append((time.time(), self.cycles))
+        return self.cycles
+
+    def rate(self):
+        """
+        :return: recent number of cycles completed per second, or None if it cannot be estimated yet
+        """
+        if len(self.history) < 2:
+            return None
+        (first_time, first_cycle), (last_time, last_cycle) = self.history[0], self.history[-1]
+        if last_time <= first_time or last_cycle <= first_cycle:
+            return None
+        return (last_cycle - first_cycle) / (last_time - first_time)
+
+    def eta(self):
+        """
+        :return: estimated seconds until enough cycles have completed to analyse the run; 0 if they have, and None
+        if the rate or the number of cycles required is not known
+        """
+        if self.needed is None:
+            return None
+        remaining = self.needed - self.cycles
+        if remaining <= 0:
+            return 0
+        rate = self.rate()
+        if rate is None:
+            return None
+        # Count from the time the latest cycle appeared, rather than from now
+        return max(0, remaining / rate - (time.time() - self.history[-1][0]))
+
+    def idle(self):
+        """
+        :return: seconds since the latest cycle appeared, or since monitoring started if no cycle has been seen
+        """
+        return time.time() - (self.history[-1][0] if self.history else self.started)
+
+    def progress(self):
+        """
+        :return: dictionary of cycles, needed (None if unknown), ready, eta, and idle
+        """
+        return {'cycles': self.cycles,
+                'needed': self.needed,
+                'ready': ready(self.cycles, self.readlengthforward),
+                'eta': self.eta(),
+                'idle': self.idle()}
+
+    def __init__(self, miseqpath, miseqfolder, readlengthforward, window=10):
+        """
+        :param miseqpath: path of the folder containing MiSeq run data folders
+        :param miseqfolder: name of the MiSeq run folder
+        :param readlengthforward: number of forward cycles from the RunInfo.xml
+        :param window: number of the most recent cycles from which the rate is estimated
+        """
+        self.miseqfolder = miseqfolder
+        self.path = basecalls_path(miseqpath, miseqfolder)
+        self.readlengthforward = readlengthforward
+        try:
+            self.needed = int(readlengthforward) + 16
+        except ValueError:
+            self.needed = None
+        self.cycles = 0
+        self.scanned = False
+        self.history = deque(maxlen=window)
+        self.started = time.time()
+
+
+def validate(miseqpath, miseqfolder):
+    """
+    Ensure that the supplied folder is a MiSeq run with enough completed cycles to be analysed
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :return: number of completed cycles, forward read length, reverse read length
+    :raises FileNotFoundError: if the run folder does not exist
+    :raises ValueError: if the folder is not a MiSeq run, or not enough cycles have completed
+    """
+    run_path = os.path.join(miseqpath, miseqfolder)
+    if not os.path.isdir(run_path):
+        raise FileNotFoundError('No MiSeq run folder {rp}!'.format(rp=run_path))
+    info = run_info(miseqpath, miseqfolder)
+    cycles = info['cycles']
+    if not cycles:
+        raise ValueError('Could not find the necessary directories in the supplied folder: {rp}'.format(rp=run_path))
+    readlengthforward, readlengthreverse = info['readlengthforward'], info['readlengthreverse']
+    if not ready(cycles, readlengthforward):
+        raise ValueError('Only {c} cycles of {rp} have completed; {n} are required'
+                         .format(c=cycles, rp=run_path, n='forward read length + 16' if readlengthforward == 'full'
+                                 else int(readlengthforward) + 16))
+    return cycles, readlengthforward, readlengthreverse
@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+from collections import deque
+from dockerapi import DockerClient, DockerError, DOCKER_SOCKET, demultiplex
+import subprocess
+import threading
+import traceback
+import hashlib
+import time
+import shlex
+import uuid
+import sys
+import os
+__author__ = 'adamkoziol'
+
+SIPPRVERSE_IMAGE = 'olcbioinformatics/sipprverse:latest'
+REFERENCE_PATH = '/mnt/nas/assemblydatabases/0.2.3/databases'
+# Paths at which the folders of a run are mounted in the sipprverse container
+MISEQ_MOUNT = '/mnt/miseq'
+OUTPUT_MOUNT = '/mnt/output'
+SAMPLESHEET_MOUNT = '/mnt/samplesheet'
+# Exit status of a runner that raised an error, or finished without an exit status
+FAILED = 1
+
+
+def sipprverse_binds(miseqpath, outputpath, customsamplesheet=None):
+    """
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param outputpath: path of the folder in which the output folder for the run is to be created
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :return: list of host:container bind mounts of the sipprverse container
+    """
+    binds = ['/mnt/nas:/mnt/nas',
+             '{}:{}'.format(os.path.abspath(miseqpath), MISEQ_MOUNT),
+             '{}:{}'.format(os.path.abspath(outputpath), OUTPUT_MOUNT)]
+    if customsamplesheet:
+        binds.append('{}:{}'.format(os.path.abspath(customsamplesheet), SAMPLESHEET_MOUNT))
+    return binds
+
+
+def sipprverse_arguments(miseqfolder, miseqpath=MISEQ_MOUNT, outputpath=OUTPUT_MOUNT, customsamplesheet=None,
+                         readlengthforward=70, readlengthreverse=0, referencepath=REFERENCE_PATH,
+                         method='method.py'):
+    """
+    Create the arguments of the sipprverse pipeline. The paths are those inside the container by default
+    :param miseqfolder: name of the MiSeq run folder
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param outputpath: path of the folder in which the output folder for the run is to be created
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :param readlengthforward: number of forward cycles to use
+    :param readlengthreverse: number of reverse cycles to use
+    :param referencepath: path of the reference databases
+    :param method: path of the method.py script of the sipprverse
+    :return: list of the command and its arguments
+    """
+    arguments = ['python', method,
+                 '-m', os.path.join(miseqpath, ''),
+                 '-f', miseqfolder,
+                 '-r1', str(readlengthforward),
+                 '-r2', str(readlengthreverse),
+                 '-r', referencepath,
+                 '-d', os.path.join(outputpath, miseqfolder, 'sequences'),
+                 '-o', os.path.join(outputpath, miseqfolder)]
+    if customsamplesheet:
+        arguments.extend(['-c', os.path.join(customsamplesheet, 'SampleSheet.csv')])
+    return arguments
+
+
+def container_arguments(miseqfolder, customsamplesheet=None, subfolder=None, **kwargs):
+    """
+    Create the arguments of the sipprverse pipeline with the paths inside the container
+    :param miseqfolder: name of the MiSeq run folder
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :param subfolder: folder below the output folder that stands in for it, and contains the SampleSheet.csv to
+    use (e.g. for a shard of the samples of the run)
+    :param kwargs: additional keyword arguments of sipprverse_arguments
+    :return: list of the command and its arguments
+    """
+    if subfolder:
+        return sipprverse_arguments(miseqfolder,
+                                    outputpath=os.path.join(OUTPUT_MOUNT, subfolder),
+                                    customsamplesheet=os.path.join(OUTPUT_MOUNT, subfolder),
+                                    **kwargs)
+    return sipprverse_arguments(miseqfolder,
+                                customsamplesheet=SAMPLESHEET_MOUNT if customsamplesheet else None,
+                                **kwargs)
+
+
+def sipprverse_script(arguments):
+    """
+    :param arguments: list of the sipprverse command and its arguments
+    :return: bash script that runs the command in the conda environment of the sipprverse image. The command
+    replaces the shell, so that signals sent to the shell reach the pipeline
+    """
+    return 'source activate genesippr && exec {}'.format(' '.join(shlex.quote(arg) for arg in arguments))
+
+
+def sipprverse_command(miseqpath, miseqfolder, outputpath, customsamplesheet=None, readlengthforward=70,
+                       readlengthreverse=0, referencepath=REFERENCE_PATH, image=SIPPRVERSE_IMAGE, subfolder=None):
+    """
+    Create the docker command to run the sipprverse pipeline on a MiSeq run
+    :param miseqpath: path of the folder containing MiSeq run data folders
+    :param miseqfolder: name of the MiSeq run folder
+    :param outputpath: path of the folder in which the output folder for the run is to be created
+    :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+    :param readlengthforward: number of forward cycles to use
+    :param readlengthreverse: number of reverse cycles to use
+    :param referencepath: path of the reference databases (must be below /mnt/nas)
+    :param image: docker image to run
+    :param subfolder: folder below outputpath that stands in for it, and contains the SampleSheet.csv to use
+    :return: command to run through the shell
+    """
+    mounts = ['-v {}'.format(shlex.quote(bind))
+              for bind in sipprverse_binds(miseqpath, outputpath, customsamplesheet)]
+    script = sipprverse_script(container_arguments(miseqfolder,
+                                                   customsamplesheet=customsamplesheet,
+                                                   subfolder=subfolder,
+                                                   readlengthforward=readlengthforward,
+                                                   readlengthreverse=readlengthreverse,
+                                                   referencepath=referencepath))
+    return 'docker run -i --rm {mounts} {image} /bin/bash -c {script}'\
+        .format(mounts=' '.join(mounts),
+                image=image,
+                script=shlex.quote(script))
+
+
+class StreamingRunner(object):
+
+    def run(self):
+        """
+        Run the command, passing each line of stdout and stderr to the callbacks as soon as it is produced
+        :return: exit status of the command. FAILED if the runner was terminated before it started
+        """
+        if self.terminated:
+            self.returncode = FAILED
+            return self.returncode
+        self.process = subprocess.Popen(self.command,
+                                        shell=self.shell,
+                                        cwd=self.cwd,
+                                        env=self.env,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        # The runner was terminated while the process was being started
+        if self.terminated:
+            self.process.terminate()
+        # Each pipe is drained by its own thread, so that a full stderr pipe cannot stall stdout (or vice versa)
+        readers = [threading.Thread(target=self.read_pipe, args=(self.process.stdout, self.stdout, self.on_stdout)),
+                   threading.Thread(target=self.read_pipe, args=(self.process.stderr, self.stderr, self.on_stderr))]
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+        for reader in readers:
+            reader.join()
+        self.returncode = self.process.wait()
+        return self.returncode
+
+    @staticmethod
+    def read_pipe(pipe, buffer, callback):
+        """
+        Read a pipe line by line until it is closed
+        :param pipe: stdout or stderr pipe of the process
+        :param buffer: bounded deque in which the most recent lines are kept
+        :param callback: function to call with each decoded line
+        """
+        with pipe:
+            for raw in iter(pipe.readline, b''):
+                line = raw.decode('utf-8', errors='replace')
+                buffer.append(line)
+                if callback is not None:
+                    callback(line)
+
+    def terminate(self):
+        """
+        Ask the running process to stop. A runner that has not started yet will not start
+        """
+        self.terminated = True
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+    def stderr_tail(self, lines=20):
+        """
+        :param lines: number of lines to return
+        :return: the final lines written to stderr as a single string
+        """
+        return ''.join(list(self.stderr)[-lines:])
+
+    def __init__(self, command, on_stdout=None, on_stderr=None, buffer_lines=1000, shell=False, cwd=None,
+                 env=None):
+        """
+        :param command: command to run; a string if shell is True, otherwise a list of arguments
+        :param on_stdout: function called with each line written to stdout
+        :param on_stderr: function called with each line written to stderr
+        :param buffer_lines: number of the most recent lines of each stream to retain
+        :param shell: Boolean of whether to run the command through the shell
+        :param cwd: working directory for the command
+        :param env: environment for the command
+        """
+        self.command = command
+        self.on_stdout = on_stdout
+        self.on_stderr = on_stderr
+        self.shell = shell
+        self.cwd = cwd
+        self.env = env
+        self.stdout = deque(maxlen=buffer_lines)
+        self.stderr = deque(maxlen=buffer_lines)
+        self.process = None
+        self.returncode = None
+        self.terminated = False
+
+
+class ContainerRunner(StreamingRunner):
+    """
+    Runs a command in a container through the Engine API, with the same interface as StreamingRunner. The command
+    is either exec'd into a running (warm) container, or run in a new container that is removed when it exits
+    """
+
+    def run(self):
+        """
+        Run the command, passing each line of stdout and stderr to the callbacks as soon as it is produced
+        :return: exit status of the command. 125 if the engine failed, as with the docker command line. FAILED if the
+        runner was terminated before it started
+        """
+        if self.terminated:
+            self.returncode = FAILED
+            return self.returncode
+        try:
+            if self.container is not None:
+                self.returncode = self.run_exec()
+            else:
+                self.returncode = self.run_container()
+        except DockerError as error:
+            self.read_line(2, '{}\n'.format(error))
+            self.returncode = 125
+        return self.returncode
+
+    def run_exec(self):
+        """
+        :return: exit status of the command exec'd into the warm container
+        """
+        # The exec instance cannot be signalled through the API, so record the process ID to allow termination
+        command = ['/bin/bash', '-c', 'echo $$ > {pid} && {script}'.format(pid=self.pidfile, script=self.script)]
+        self.exec_id = self.client.exec_create(self.container, command)
+        with self.client.exec_start(self.exec_id) as response:
+            self.read_frames(response)
+        # The engine may not have recorded the exit of the command as soon as its output ends
+        deadline = time.time() + self.exit_timeout
+        details = self.client.exec_inspect(self.exec_id)
+        while details.get('Running') and time.time() < deadline:
+            time.sleep(self.exit_poll)
+            details = self.client.exec_inspect(self.exec_id)
+        if details.get('Running') or details.get('ExitCode') is None:
+            self.read_line(2, 'The exit status of the command in container {} could not be determined\n'
+                           .format(self.container))
+            return FAILED
+        return details['ExitCode']
+
+    def run_container(self):
+        """
+        :return: exit status of a new container running the command
+        """
+        self.container_id = self.client.create_container(self.image, ['/bin/bash', '-c', self.script],
+                                                         binds=self.binds, labels={'sippr_gui': 'job'})
+        try:
+            # Attach before starting, so that no output is missed
+            with self.client.attach(self.container_id) as response:
+                self.client.start(self.container_id)
+                # The runner was terminated while the container was being created
+                if self.terminated:
+                    self.terminate()
+                self.read_frames(response)
+            return self.client.wait(self.container_id)
+        finally:
+            self.client.remove(self.container_id)
+
+    def read_frames(self, response):
+        """
+        Split the output of the container into lines
+        :param response: streaming response of the container output
+        """
+        partial = {1: b'', 2: b''}
+        for stream, payload in demultiplex(response):
+            lines = (partial.get(stream, b'') + payload).split(b'\n')
+            partial[stream] = lines.pop()
+            for line in lines:
+                self.read_line(stream, (line + b'\n').decode('utf-8', errors='replace'))
+        for stream, line in partial.items():
+            if line:
+                self.read_line(stream, line.decode('utf-8', errors='replace'))
+
+    def read_line(self, stream, line):
+        """
+        :param stream: 1 for stdout, 2 for stderr
+        :param line: decoded line
+        """
+        buffer, callback = (self.stderr, self.on_stderr) if stream == 2 else (self.stdout, self.on_stdout)
+        buffer.append(line)
+        if callback is not None:
+            callback(line)
+
+    def terminate(self):
+        """
+        Ask the running command to stop. A runner that has not started yet will not start
+        """
+        self.terminated = True
+        try:
+            if self.exec_id is not None:
+                self.client.exec_detached(self.container, ['/bin/sh', '-c',
+                                                          'kill -TERM $(cat {})'.format(self.pidfile)])
+            elif self.container_id is not None:
+                self.client.kill(self.container_id)
+        except DockerError:
+            pass
+
+    def __init__(self, client, script, image=None, binds=None, container=None, on_stdout=None, on_stderr=None,
+                 buffer_lines=1000):
+        """
+        :param client: dockerapi.DockerClient
+        :param script: bash script to run
+        :param image: image of a new container. Ignored if container is supplied
+        :param binds: list of host:container bind mounts of a new container
+        :param container: ID of a running container in which to exec the script
+        :param on_stdout: function called with each line written to stdout
+        :param on_stderr: function called with each line written to stderr
+        :param buffer_lines: number of the most recent lines of each stream to retain
+        """
+        super(ContainerRunner, self).__init__(script, on_stdout=on_stdout, on_stderr=on_stderr,
+                                              buffer_lines=buffer_lines)
+        self.client = client
+        self.script = script
+        self.image = image
+        self.binds = binds
+        self.container = container
+        self.pidfile = '/tmp/sippr_gui_{}.pid'.format(uuid.uuid4().hex)
+        # Seconds between checks of whether an exec'd command has exited, and the longest to wait for it
+        self.exit_poll = 0.1
+        self.exit_timeout = 30
+        self.exec_id = None
+        self.container_id = None
+
+
+class ParallelRunner(object):
+    """
+    Runs several runners (e.g. one for each shard of a run) at once, with the interface of a single runner
+    """
+
+    def run(self):
+        """
+        Run every runner, each on its own thread, and wait for all of them
+        :return: exit status of the first runner that failed, or 0 if all succeeded. A runner without an exit status
+        did not finish, and has failed
+        """
+        threads = [threading.Thread(target=self.run_one, args=(index, runner))
+                   for index, runner in enumerate(self.runners)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.returncode = next((runner.returncode if runner.returncode is not None else FAILED
+                                for runner in self.runners if runner.returncode != 0), 0)
+        return self.returncode
+
+    def run_one(self, index, runner):
+        """
+        Run a single runner on its own thread. An error raised by the runner (e.g. the pipeline could not be
+        started) fails the runner, rather than ending the thread without an exit status
+        :param index: position of the runner
+        :param runner: runner to run
+        """
+        try:
+            runner.run()
+        except Exception:
+            runner.stderr.append(traceback.format_exc())
+            runner.returncode = FAILED
+        if runner.returncode is None:
+            runner.returncode = FAILED
+        if self.on_finished is not None:
+            self.on_finished(index, runner.returncode)
+
+    def terminate(self):
+        """
+        Ask every runner to stop
+        """
+        for runner in self.runners:
+            runner.terminate()
+
+    def stderr_tail(self, lines=20):
+        """
+        :param lines: number of lines of each failed runner to return
+        :return: the final lines written to stderr by each runner that failed, labelled with its number
+        """
+        return ''.join('[shard {index}]\n{tail}'.format(index=index, tail=runner.stderr_tail(lines))
+                       for index, runner in enumerate(self.runners) if runner.returncode != 0)
+
+    def __init__(self, runners, on_finished=None):
+        """
+        :param runners: list of StreamingRunner or ContainerRunner objects
+        :param on_finished: function called with the position and exit status of each runner as soon as it exits
+        """
+        self.runners = runners
+        self.on_finished = on_finished
+        self.returncode = None
+
+
+class CLIEngine(object):
+    """
+    Runs the sipprverse with the docker command line, through the shell
+    """
+
+    def prepare(self):
+        """
+        Nothing to prepare; the docker command line pulls the image when it is first run
+        """
+
+    def runner(self, miseqpath, miseqfolder, outputpath, customsamplesheet=None, on_stdout=None, on_stderr=None,
+               subfolder=None):
+        """
+        :param miseqpath: path of the folder containing MiSeq run data folders
+        :param miseqfolder: name of the MiSeq run folder
+        :param outputpath: path of the folder in which the output folder for the run is to be created
+        :param customsamplesheet: path of a folder containing a custom SampleSheet.csv
+        :param on_stdout: function called with each line written to stdout
+        :param on_stderr: function called with each line written to stderr
+        :param subfolder: folder below outputpath that stands in for it, and contains the SampleSheet.csv to use
+        (e.g. for a shard of the samples of the run)
+        :return: runner of the sipprverse on the run, with run, terminate, and stderr_tail methods
+        """
+        return StreamingRunner(sipprverse_command(miseqpath, miseqfolder, outputpath,
+                                                  customsamplesheet=customsamplesheet, image=self.image,
+                                                  subfolder=subfolder),
+                               on_stdout=on_stdout, on_stderr=on_stderr, shell=True)
+
+    def close(self):
+        """
+        Nothing to release
+        """
+
+    def __init__(self, image=SIPPRVERSE_IMAGE):
+        self.image = image
+
+
+class LocalEngine(CLIEngine):
+    """
+    Runs a local installation of the sipprverse (or a stand-in with the same arguments, for testing) directly,
+    without a container or a shell
+    """
+
+    def runner(self, miseqpath, miseqfolder, outputpath, customsamplesheet=None, on_stdout=None, on_stderr=None,
+               subfolder=None):
+        if subfolder:
+            outputpath = customsamplesheet = os.path.join(outputpath, subfolder)
+        arguments = sipprverse_arguments(miseqfolder, miseqpath=os.path.abspath(miseqpath),
+                                         outputpath=os.path.abspath(outputpath),
+                                         customsamplesheet=customsamplesheet and os.path.abspath(customsamplesheet),
+                                         referencepath=self.referencepath, method=self.method)
+        arguments[0] = self.python
+        return StreamingRunner(arguments, on_stdout=on_stdout, on_stderr=on_stderr, cwd=os.path.dirname(self.method))
+
+    def __init__(self, method, referencepath=REFERENCE_PATH, python=sys.executable):
+        """
+        :param method: path of method.py of the sipprverse, or of a stand-in script
+        :param referencepath: path of the reference databases
+        :param python: interpreter with which to run the script
+        """
+        super(LocalEngine, self).__init__()
+        self.method = os.path.abspath(method)
+        self.referencepath = referencepath
+        self.python = python
+
+
+class DockerEngine(CLIEngine):
+    """
+    Runs the sipprverse through the Engine API. The image is pulled and pinned to its digest once, so that every
+    run uses the same image, and jobs are exec'd into a warm container for each set of mounts rather than paying
+    for a new container each time
+    """
+
+    def prepare(self):
+        """
+        Pull the image (once), and pin it to its digest. Uses the local image if it cannot be pulled
+        """
+        with self.lock:
+            if self.digest is not None:
+                return
+            if self.pull:
+                try:
+                    self.client.pull(self.image)
+                except DockerError as error:
+                    print(error, file=sys.stderr)
+            details = self.client.inspect_image(self.image)
+            self.digest = details['RepoDigests'][0] if details.get('RepoDigests') else details['Id']
+
+    def warm_container(self, binds):
+        """
+        :param binds: list of host:container bind mounts
+        :return: ID of a running container with the supplied mounts, started if there is none
+        """
+        key = tuple(binds)
+        with self.lock:
+            container = self.containers.get(key)
+            if container is not None:
+                try:
+                    if self.client.inspect_container(container)['State']['Running']:
+                        return container
+                except DockerError:
+                    pass
+            container = self.client.create_container(self.digest, ['/bin/bash', '-c', 'sleep infinity'],
+                                                     binds=binds,
+                                                     labels={'sippr_gui': 'warm',
+                                                             'sippr_gui.binds': hashlib.sha256(
+                                                                 repr(key).encode()).hexdigest()})
+            self.client.start(container)
+            self.containers[key] = container
+            return container
+
+    def runner(self, miseqpath, miseqfolder, outputpath, customsamplesheet=None, on_stdout=None, on_stderr=None,
+               subfolder=None):
+        # Shards are analysed within the output folder, so they share the warm container of the whole run
+        binds = sipprverse_binds(miseqpath, outputpath, customsamplesheet)
+        try:
+            self.prepare()
+            container = self.warm_container(binds) if self.warm else None
+        except DockerError as error:
+            # The engine cannot be used through its API (e.g. it refuses the version of the API); the docker
+            # command line may still work
+            print('Running {mf} with the docker command line: {error}'.format(mf=miseqfolder, error=error),
+                  file=sys.stderr)
+            return super(DockerEngine, self).runner(miseqpath, miseqfolder, outputpath, customsamplesheet,
+                                                    on_stdout=on_stdout, on_stderr=on_stderr, subfolder=subfolder)
+        script = sipprverse_script(container_arguments(miseqfolder, customsamplesheet=customsamplesheet,
+                                                       subfolder=subfolder))
+        return ContainerRunner(self.client, script, image=self.digest, binds=binds, container=container,
+                               on_stdout=on_stdout, on_stderr=on_stderr)
+
+    def close(self):
+        """
+        Remove the warm containers, and close the connections to the engine
+        """
+        with self.lock:
+            for container in self.containers.values():
+                try:
+                    self.client.remove(container)
+                except DockerError:
+                    pass
+            self.containers.clear()
+        self.client.close()
+
+    def __init__(self, client=None, image=SIPPRVERSE_IMAGE, pull=True, warm=True):
+        """
+        :param client: dockerapi.DockerClient. Connects to the default socket if None
+        :param image: name of the sipprverse image
+        :param pull: Boolean of whether to pull the image before pinning it
+        :param warm: Boolean of whether to exec runs into warm containers, rather than one container per run
+        """
+        super(DockerEngine, self).__init__(image)
+        self.client = client or DockerClient()
+        self.pull = pull
+        self.warm = warm
+        self.digest = None
+        self.containers = dict()
+        self.lock = threading.Lock()
+
+
+shared_engine = list()
+shared_engine_lock = threading.Lock()
+
+
+def default_engine():
+    """
+    :return: the engine shared by every run of this process: a DockerEngine if the engine answers on its socket with
+    a supported version of its API, otherwise a CLIEngine
+    """
+    with shared_engine_lock:
+        if not shared_engine:
+            shared_engine.append(DockerEngine() if api_available() else CLIEngine())
+        return shared_engine[0]
+
+
+def api_available(socket_path=DOCKER_SOCKET, timeout=5):
+    """
+    :param socket_path: path of the UNIX socket of the engine
+    :param timeout: seconds to wait for the engine to answer
+    :return: Boolean of whether the Engine API can be used
+    """
+    if not os.access(socket_path, os.R_OK | os.W_OK):
+        return False
+    # A short timeout, so that an unresponsive engine does not hold up the start of the application
+    client = DockerClient(socket_path, timeout=timeout)
+    try:
+        return client.ping()
+    finally:
+        client.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+from collections import namedtuple, OrderedDict
+import threading
+import csv
+import os
+__author__ = 'adamkoziol'
+
+# A sample from the [Data] section. fields holds every column of the row, keyed by the header of the column
+Sample = namedtuple('Sample', ['sample_id', 'sample_name', 'sample_project', 'description', 'index', 'index2',
+                               'fields'])
+
+
+class SampleSheet(object):
+    """
+    Illumina sample sheet, indexed by section ([Header], [Reads], [Settings], [Data], ...) in a single pass
+    """
+
+    def parse(self):
+        """
+        Read the sample sheet with the csv module, splitting it into sections. Blank lines and trailing empty
+        fields are ignored. Rows before the first section are kept, in case they hold the samples
+        """
+        section = None
+        with open(self.path, newline='', encoding='utf-8-sig') as sample_sheet:
+            for row in csv.reader(sample_sheet):
+                # Remove the empty fields that spreadsheet programs add to pad each row
+                while row and not row[-1].strip():
+                    row.pop()
+                if not row:
+                    continue
+                first = row[0].strip()
+                if first.startswith('[') and first.endswith(']'):
+                    section = first[1:-1]
+                    self.sections.setdefault(section, list())
+                else:
+                    self.sections.setdefault(section, list()).append([field.strip() for field in row])
+        # The samples are found first, as they may follow a section without a [Data] header
+        self.data()
+        self.header = self.key_values('Header')
+        self.settings = self.key_values('Settings')
+        self.reads = [int(row[0]) for row in self.sections.get('Reads', list()) if row[0].isdigit()]
+
+    def key_values(self, section):
+        """
+        :param section: name of a section of key,value rows
+        :return: OrderedDict of the keys and values of the section
+        """
+        return OrderedDict((row[0], row[1] if len(row) > 1 else str()) for row in self.sections.get(section, list()))
+
+    def data(self):
+        """
+        Create a Sample for each row of the [Data] section. Sample sheets without a [Data] section list their
+        samples after a header row starting with Sample_ID, which is moved to a [Data] section
+        """
+        if 'Data' not in self.sections:
+            for section, section_rows in self.sections.items():
+                starts = [index for index, row in enumerate(section_rows) if row[0] == 'Sample_ID']
+                if starts:
+                    self.sections['Data'] = section_rows[starts[0]:]
+                    del section_rows[starts[0]:]
+                    break
+        # Rows before the first section are only kept to find the samples
+        self.sections.pop(None, None)
+        rows = self.sections.get('Data', list())
+        if not rows:
+            return
+        self.data_header = rows[0]
+        for row in rows[1:]:
+            fields = OrderedDict(zip(self.data_header, row + [str()] * (len(self.data_header) - len(row))))
+            self.samples.append(Sample(sample_id=fields.get('Sample_ID', row[0]),
+                                       sample_name=fields.get('Sample_Name', str()),
+                                       sample_project=fields.get('Sample_Project', str()),
+                                       description=fields.get('Description', str()),
+                                       index=fields.get('index', str()),
+                                       index2=fields.get('index2', str()),
+                                       fields=fields))
+
+    def write(self, path, samples=None):
+        """
+        Write the sample sheet, optionally with only some of its samples e.g. to analyse them separately
+        :param path: path of the new sample sheet
+        :param samples: list of the Sample objects to include in the [Data] section. Every sample if None
+        """
+        samples = self.samples if samples is None else samples
+        with open(path, 'w', newline='') as sample_sheet:
+            writer = csv.writer(sample_sheet)
+            for section, rows in self.sections.items():
+                writer.writerow(['[{}]'.format(section)])
+                if section == 'Data':
+                    rows = [self.data_header] + [list(sample.fields.values()) for sample in samples]
+                writer.writerows(rows)
+                writer.writerow([])
+
+    def sample_ids(self):
+        """
+        :return: list of the Sample_ID of each sample
+        """
+        return [sample.sample_id for sample in self.samples]
+
+    def __init__(self, path):
+        """
+        :param path: path of the sample sheet
+        """
+        self.path = path
+        self.sections = OrderedDict()
+        self.header = OrderedDict()
+        self.settings = OrderedDict()
+        self.reads = list()
+        self.data_header = list()
+        self.samples = list()
+        self.parse()
+
+
+cache = dict()
+cache_lock = threading.Lock()
+
+
+def read_samplesheet(path):
+    """
+    Parse a sample sheet, re-using the previous parse of the same file if it has not changed since. The parses are
+    kept for the current process only, so processes started to create reports are passed the samples instead
+    :param path: path of the sample sheet
+    :return: SampleSheet object
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with cache_lock:
+        cached = cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    sample_sheet = SampleSheet(path)
+    with cache_lock:
+        cache[path] = (stamp, sample_sheet)
+    return sample_sheet
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+from samplesheet import read_samplesheet
+import jobqueue
+import shutil
+import csv
+import os
+__author__ = 'adamkoziol'
+
+# Reports written by each shard, which are combined into the reports folder of the run
+REPORT_FILES = ('genesippr.csv', 'sixteens_full.csv', 'GDCS.csv')
+
+
+def default_shards(samples):
+    """
+    :param samples: number of samples in the run
+    :return: number of shards that the cores and memory of this host can analyse at once
+    """
+    return max(1, min(samples, jobqueue.default_workers()))
+
+
+def split(samples, count):
+    """
+    Split samples into contiguous shards of (nearly) equal size, so that the merged reports keep the order of the
+    sample sheet
+    :param samples: list of samples
+    :param count: number of shards
+    :return: list of lists of samples. Never contains empty shards
+    """
+    count = max(1, min(count, len(samples)))
+    size, extra = divmod(len(samples), count)
+    shards = list()
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        shards.append(samples[start:end])
+        start = end
+    return shards
+
+
+def shard_path(outputpath, miseqfolder, index):
+    """
+    :param outputpath: path of the folder containing the output folder of the run
+    :param miseqfolder: name of the MiSeq run folder
+    :param index: number of the shard
+    :return: path of the folder standing in for the output folder of the analysis of the shard. The output of the
+    shard is written to a folder named after the run within it, as for the run itself
+    """
+    return os.path.join(outputpath, miseqfolder, 'shards', 'shard_{}'.format(index))
+
+
+def write_shards(sample_sheet, outputpath, miseqfolder, count, samples=None):
+    """
+    Create the folder of each shard with a sample sheet of its samples. The output of any earlier analysis of the
+    shard is removed, so that it cannot be mistaken for the results of this one
+    :param sample_sheet: path of the sample sheet of the run
+    :param outputpath: path of the folder containing the output folder of the run
+    :param miseqfolder: name of the MiSeq run folder
+    :param count: number of shards
+    :param samples: list of the samplesheet.Sample objects to analyse. Every sample in the sample sheet if None
+    :return: list of tuples of the path of each shard folder relative to outputpath, and the samples of the shard
+    """
+    sheet = read_samplesheet(sample_sheet)
+    shards = list()
+    for index, shard_samples in enumerate(split(sheet.samples if samples is None else samples, count)):
+        path = shard_path(outputpath, miseqfolder, index)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        sheet.write(os.path.join(path, 'SampleSheet.csv'), shard_samples)
+        shards.append((os.path.relpath(path, outputpath), shard_samples))
+    return shards
+
+
+def keep_reports(outputpath, miseqfolder, sample_ids, report_files=REPORT_FILES):
+    """
+    Copy the rows of already analysed samples from the reports of a run into a folder laid out like a shard, so
+    that they are merged with the results of the samples that are analysed again
+    :param outputpath: path of the folder containing the output folder of the run
+    :param miseqfolder: name of the MiSeq run folder
+    :param sample_ids: IDs of the samples to keep
+    :param report_files: names of the reports
+    :return: path of the folder, relative to outputpath
+    """
+    path = shard_path(outputpath, miseqfolder, 'completed')
+    reportpath = os.path.join(path, miseqfolder, 'reports')
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(reportpath)
+    keep = set(sample_ids)
+    for report_file in report_files:
+        try:
+            with open(os.path.join(outputpath, miseqfolder, 'reports', report_file), newline='') as report, \
+                    open(os.path.join(reportpath, report_file), 'w', newline='') as kept:
+                reader = csv.DictReader(report)
+                writer = csv.DictWriter(kept, fieldnames=reader.fieldnames or list(), lineterminator='\n')
+                writer.writeheader()
+                writer.writerows(row for row in reader if row.get('Strain') in keep)
+        except FileNotFoundError:
+            continue
+    return os.path.relpath(path, outputpath)
+
+
+def merge_reports(outputpath, miseqfolder, folders, report_files=REPORT_FILES):
+    """
+    Combine the reports of the shards of a run into the reports folder of the run, in the order of the shards.
+    Reports with different columns (e.g. the GDCS report of different genera) are aligned on the union of their
+    columns, with blank cells where a shard has no value. Values are copied as text, so the merged report is read
+    exactly as a report of the whole run would be
+    :param outputpath: path of the folder containing the output folder of the run
+    :param miseqfolder: name of the MiSeq run folder
+    :param folders: list of the paths of the shard folders, relative to outputpath
+    :param report_files: names of the reports to merge
+    :return: list of the reports that were written, or rewritten because they changed
+    """
+    reportpath = os.path.join(outputpath, miseqfolder, 'reports')
+    written = list()
+    for report_file in report_files:
+        header = list()
+        rows = list()
+        for folder in folders:
+            path = os.path.join(outputpath, folder, miseqfolder, 'reports', report_file)
+            try:
+                with open(path, newline='') as report:
+                    reader = csv.DictReader(report)
+                    header.extend(field for field in reader.fieldnames or list() if field not in header)
+                    rows.extend(reader)
+            except FileNotFoundError:
+                continue
+        if not header:
+            continue
+        merged = os.path.join(reportpath, report_file)
+        temporary = '{}.{}.tmp'.format(merged, os.getpid())
+        os.makedirs(reportpath, exist_ok=True)
+        with open(temporary, 'w', newline='') as report:
+            writer = csv.DictWriter(report, fieldnames=header, restval='', lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows)
+        # Leave an unchanged report untouched, so that watchers of the reports do not re-read it
+        try:
+            with open(temporary, 'rb') as new, open(merged, 'rb') as old:
+                unchanged = new.read() == old.read()
+        except FileNotFoundError:
+            unchanged = False
+        if unchanged:
+            os.remove(temporary)
+        else:
+            os.replace(temporary, merged)
+            written.append(report_file)
+    return written
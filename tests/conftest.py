@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+import sys
+import os
+__author__ = 'adamkoziol'
+
+# The modules of the GUI are imported from the folder above, as they are when gui.py or batch.py is run
+testpath = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(testpath))
+# Qt widgets and models are created without a display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
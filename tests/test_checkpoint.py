@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+from checkpoint import Checkpoint, MANIFEST
+from samplesheet import SampleSheet
+from runner import LocalEngine
+from jobqueue import Job
+import batch
+import json
+import os
+__author__ = 'adamkoziol'
+
+RUN = 'RUN'
+SAMPLES = ['S{}'.format(index) for index in range(5)]
+# Stand-in for method.py of the sipprverse. Writes every report for the samples of its sample sheet, or only for the
+# first of them, and exits with the status in behaviour.json beside it. The samples it was given are appended to
+# calls.txt
+METHOD = """
+import csv, json, os, sys
+here = os.path.dirname(os.path.abspath(__file__))
+arguments = sys.argv[1:]
+output = arguments[arguments.index('-o') + 1]
+sheet = arguments[arguments.index('-c') + 1] if '-c' in arguments \\
+    else os.path.join(arguments[arguments.index('-m') + 1], arguments[arguments.index('-f') + 1], 'SampleSheet.csv')
+rows = list(csv.reader(open(sheet)))
+samples = [row[0] for row in rows[rows.index(['[Data]']) + 2:] if row]
+behaviour = json.load(open(os.path.join(here, 'behaviour.json')))
+with open(os.path.join(here, 'calls.txt'), 'a') as calls:
+    calls.write(' '.join(samples) + '\\n')
+complete = samples[:behaviour.get('complete', len(samples))]
+if behaviour.get('write', True):
+    os.makedirs(os.path.join(output, 'reports'), exist_ok=True)
+    for report, header in (('genesippr.csv', 'Strain,Genus,eae'), ('sixteens_full.csv', 'Strain,Gene,Identity'),
+                           ('GDCS.csv', 'Strain,Genus,Matches')):
+        with open(os.path.join(output, 'reports', report), 'w') as csv_file:
+            written = samples if report == 'genesippr.csv' else complete
+            csv_file.write(header + '\\n' + ''.join('{},Escherichia,99%\\n'.format(sample) for sample in written))
+sys.exit(behaviour.get('status', 0))
+"""
+
+
+def write_sheet(path, samples=SAMPLES, project='P1'):
+    path.write('[Header]\nIEMFileVersion,4\n[Data]\nSample_ID,Sample_Name,Sample_Project\n'
+               + ''.join('{0},{0},{1}\n'.format(sample, project) for sample in samples), ensure=True)
+    return SampleSheet(str(path)).samples
+
+
+def write_reports(outputpath, samples, reports=('genesippr.csv', 'sixteens_full.csv', 'GDCS.csv'), value='99%'):
+    for report in reports:
+        outputpath.join(RUN, 'reports', report).write(
+            'Strain,Genus,eae\n' + ''.join('{},Escherichia,{}\n'.format(sample, value) for sample in samples),
+            ensure=True)
+
+
+def later(path):
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_samples_with_every_report_are_recorded(tmpdir):
+    samples = write_sheet(tmpdir.join('SampleSheet.csv'))
+    write_reports(tmpdir, SAMPLES)
+    write_reports(tmpdir, SAMPLES[:3], reports=('GDCS.csv',))
+    checkpoint = Checkpoint(str(tmpdir), RUN)
+    assert checkpoint.record(samples) == SAMPLES[:3]
+    # The manifest is read by the next analysis
+    assert Checkpoint(str(tmpdir), RUN).completed(samples) == SAMPLES[:3]
+
+
+def test_changed_samples_are_not_completed(tmpdir):
+    samples = write_sheet(tmpdir.join('SampleSheet.csv'))
+    write_reports(tmpdir, SAMPLES)
+    checkpoint = Checkpoint(str(tmpdir), RUN)
+    checkpoint.record(samples)
+    # A changed sample sheet entry
+    changed = write_sheet(tmpdir.join('Changed.csv'), project='P2')
+    assert checkpoint.completed(changed[:1] + samples[1:]) == SAMPLES[1:]
+    # Changed results
+    write_reports(tmpdir, SAMPLES, value='98%')
+    assert checkpoint.completed(samples) == []
+
+
+def test_reset(tmpdir):
+    samples = write_sheet(tmpdir.join('SampleSheet.csv'))
+    write_reports(tmpdir, SAMPLES)
+    checkpoint = Checkpoint(str(tmpdir), RUN)
+    checkpoint.record(samples)
+    checkpoint.reset()
+    assert not tmpdir.join(RUN, MANIFEST).check()
+    assert Checkpoint(str(tmpdir), RUN).completed(samples) == []
+
+
+def test_manifest_of_an_earlier_version_is_ignored(tmpdir):
+    samples = write_sheet(tmpdir.join('SampleSheet.csv'))
+    write_reports(tmpdir, SAMPLES)
+    Checkpoint(str(tmpdir), RUN).record(samples)
+    manifest = json.loads(tmpdir.join(RUN, MANIFEST).read())
+    manifest['version'] -= 1
+    tmpdir.join(RUN, MANIFEST).write(json.dumps(manifest))
+    assert Checkpoint(str(tmpdir), RUN).completed(samples) == []
+
+
+def test_reports_left_by_an_earlier_analysis_are_not_used(tmpdir):
+    samples = write_sheet(tmpdir.join('SampleSheet.csv'))
+    write_reports(tmpdir, SAMPLES)
+    checkpoint = Checkpoint(str(tmpdir), RUN)
+    before = checkpoint.report_stamps()
+    assert checkpoint.record(samples, before=before) == []
+    write_reports(tmpdir, SAMPLES[:2])
+    for report in ('genesippr.csv', 'sixteens_full.csv', 'GDCS.csv'):
+        later(tmpdir.join(RUN, 'reports', report))
+    assert checkpoint.record(samples, before=before) == SAMPLES[:2]
+
+
+def analyse(tmpdir, shards=1, resume=True, **behaviour):
+    """
+    Analyse the run with the stand-in pipeline
+    :return: exit status, and the samples given to each analysis of the pipeline
+    """
+    method = tmpdir.join('sipprverse', 'method.py')
+    method.write(METHOD, ensure=True)
+    tmpdir.join('sipprverse', 'behaviour.json').write(json.dumps(behaviour))
+    calls = tmpdir.join('sipprverse', 'calls.txt')
+    if calls.check():
+        calls.remove()
+    returncode = batch.analyse(Job(0, RUN, None), str(tmpdir.join('miseq')), str(tmpdir.join('out')),
+                               report=False, engine=LocalEngine(str(method)), shards=shards, resume=resume)
+    return returncode, sorted(calls.read().split()) if calls.check() else []
+
+
+def test_failed_run_resumes_from_the_samples_it_completed(tmpdir):
+    samples = write_sheet(tmpdir.join('miseq', RUN, 'SampleSheet.csv'))
+    # The pipeline dies after writing the results of three samples to every report
+    assert analyse(tmpdir, status=1, complete=3) == (1, SAMPLES)
+    checkpoint = Checkpoint(str(tmpdir.join('out')), RUN)
+    assert checkpoint.completed(samples) == SAMPLES[:3]
+    assert analyse(tmpdir) == (0, SAMPLES[3:])
+    assert Checkpoint(str(tmpdir.join('out')), RUN).completed(samples) == SAMPLES
+    assert [line.split(',')[0] for line in tmpdir.join('out', RUN, 'reports', 'GDCS.csv').read().split()[1:]] \
+        == SAMPLES
+
+
+def test_failed_run_without_new_reports_records_nothing(tmpdir):
+    samples = write_sheet(tmpdir.join('miseq', RUN, 'SampleSheet.csv'))
+    assert analyse(tmpdir, resume=False) == (0, SAMPLES)
+    # Every sample is analysed again, and the pipeline dies before writing any report
+    assert analyse(tmpdir, resume=False, status=1, write=False) == (1, SAMPLES)
+    assert Checkpoint(str(tmpdir.join('out')), RUN).completed(samples) == []
+
+
+def test_failed_shard_keeps_the_samples_it_completed(tmpdir):
+    samples = write_sheet(tmpdir.join('miseq', RUN, 'SampleSheet.csv'))
+    # Each shard dies after completing its first sample
+    assert analyse(tmpdir, shards=2, status=1, complete=1) == (1, SAMPLES)
+    assert Checkpoint(str(tmpdir.join('out')), RUN).completed(samples) == ['S0', 'S3']
+    assert analyse(tmpdir, shards=2) == (0, ['S1', 'S2', 'S4'])
+    assert Checkpoint(str(tmpdir.join('out')), RUN).completed(samples) == SAMPLES
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+from gar import GAR, REPORT_SCHEMA, read_report
+from argparse import Namespace
+import pandas
+import pytest
+__author__ = 'adamkoziol'
+
+REPORTS = {
+    'genesippr': 'Strain,Genus,eae,O157,VT1,hlyA,Unshown\n'
+                 'S1,Escherichia,99.5%,100.0%,,0,x\n'
+                 'S2,Listeria,,,,,x\n'
+                 'S1,Escherichia,98.0%,,,,x\n',
+    'sixteens_full': 'Strain,Gene,PercentIdentity,FoldCoverage\n'
+                     'S1,Escherichia coli,99.50,012.0\n'
+                     'S2,,,\n',
+    'GDCS': 'Strain,Genus,Matches,MeanCoverage,Pass/Fail\n'
+            'S1,Escherichia,40/40,25.10,+\n'
+            'S2,Listeria,38/40,0.50,-\n'
+}
+
+
+def schema(name):
+    return next(report for report in REPORT_SCHEMA if report['name'] == name)
+
+
+def clean(tmpdir, name):
+    path = tmpdir.join('{}.csv'.format(name))
+    path.write(REPORTS[name])
+    report = schema(name)
+    return GAR.clean_report(read_report(str(path), report), report['normalise'])
+
+
+def test_every_report_is_tested():
+    assert sorted(report['name'] for report in REPORT_SCHEMA) == sorted(REPORTS)
+
+
+def test_genesippr_is_normalised(tmpdir):
+    data = clean(tmpdir, 'genesippr')
+    # Only the configured columns are read, and the final entry of a repeated sample is kept
+    assert list(data.columns) == ['Genus', 'eae', 'O157', 'VT1', 'hlyA']
+    assert data.index.tolist() == ['S2', 'S1']
+    assert data.loc['S1'].tolist() == ['Escherichia', '+', '-', '-', '-']
+    assert data.loc['S2'].tolist() == ['Listeria', '-', '-', '-', '-']
+
+
+def test_sixteens_full_keeps_its_values(tmpdir):
+    data = clean(tmpdir, 'sixteens_full')
+    assert list(data.columns) == ['Gene', 'PercentIdentity', 'FoldCoverage']
+    # Values are kept exactly as written, rather than converted to numbers or to +/-
+    assert data.loc['S1'].tolist() == ['Escherichia coli', '99.50', '012.0']
+    assert data.loc['S2'].isna().all()
+
+
+def test_gdcs_keeps_its_values(tmpdir):
+    data = clean(tmpdir, 'GDCS')
+    assert data.loc['S1'].tolist() == ['Escherichia', '40/40', '25.10', '+']
+    assert data.loc['S2'].tolist() == ['Listeria', '38/40', '0.50', '-']
+
+
+def test_clean_report_of_an_empty_report():
+    data = GAR.clean_report(pandas.DataFrame({'eae': []}, index=pandas.Index([], name='Strain')))
+    assert data.empty
+    assert list(data.columns) == ['eae']
+
+
+def test_missing_report(tmpdir):
+    tmpdir.join('RUN', 'reports').ensure(dir=True)
+    with pytest.raises(FileNotFoundError):
+        GAR(Namespace(outputfolder=str(tmpdir), miseqfolder='RUN', samplesheet=str(tmpdir.join('SampleSheet.csv'))))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+from jobqueue import JobQueue, PENDING, RUNNING, DONE, FAILED, CANCELLED
+import threading
+__author__ = 'adamkoziol'
+
+TIMEOUT = 10
+
+
+class Recorder(object):
+    """
+    Job function that records the order in which jobs start, and holds each job until it is released
+    """
+
+    def __call__(self, job):
+        with self.lock:
+            self.started.append(job.miseqfolder)
+            self.running.add(job.miseqfolder)
+            self.most = max(self.most, len(self.running))
+        self.events[job.miseqfolder].set()
+        self.release.wait(TIMEOUT)
+        with self.lock:
+            self.running.discard(job.miseqfolder)
+        return self.returncodes.get(job.miseqfolder, 0)
+
+    def wait_started(self, miseqfolder):
+        assert self.events[miseqfolder].wait(TIMEOUT)
+
+    def __init__(self, folders, returncodes=None):
+        self.lock = threading.Lock()
+        self.started = list()
+        self.running = set()
+        self.most = 0
+        self.events = {folder: threading.Event() for folder in folders}
+        self.release = threading.Event()
+        self.returncodes = returncodes or dict()
+
+
+class Runner(object):
+    """
+    Stand-in for a runner of the pipeline, which runs until it is terminated
+    """
+
+    def __call__(self, job):
+        job.runner = self
+        self.started.set()
+        self.terminated.wait(TIMEOUT)
+        return 1
+
+    def terminate(self):
+        self.terminated.set()
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.terminated = threading.Event()
+
+
+def test_jobs_start_by_priority_then_submission():
+    recorder = Recorder(['first', 'low', 'high', 'later'])
+    queue = JobQueue(workers=1)
+    queue.submit('first', recorder)
+    recorder.wait_started('first')
+    queue.submit('low', recorder)
+    queue.submit('high', recorder, priority=5)
+    queue.submit('later', recorder)
+    recorder.release.set()
+    queue.wait()
+    queue.shutdown()
+    assert recorder.started == ['first', 'high', 'low', 'later']
+    assert [job.status for job in queue.jobs] == [DONE] * 4
+
+
+def test_set_priority_of_a_pending_job():
+    recorder = Recorder(['first', 'second', 'third'])
+    queue = JobQueue(workers=1)
+    queue.submit('first', recorder)
+    recorder.wait_started('first')
+    queue.submit('second', recorder)
+    third = queue.submit('third', recorder)
+    queue.set_priority(third, 1)
+    # The priority of a running job is not changed
+    queue.set_priority(queue.jobs[0], 10)
+    assert queue.jobs[0].priority == 0
+    recorder.release.set()
+    queue.wait()
+    queue.shutdown()
+    assert recorder.started == ['first', 'third', 'second']
+
+
+def test_jobs_run_concurrently_up_to_the_workers():
+    folders = ['run{}'.format(index) for index in range(5)]
+    recorder = Recorder(folders)
+    queue = JobQueue(workers=2)
+    for folder in folders:
+        queue.submit(folder, recorder)
+    recorder.wait_started('run0')
+    recorder.wait_started('run1')
+    assert [job.status for job in queue.jobs] == [RUNNING, RUNNING, PENDING, PENDING, PENDING]
+    recorder.release.set()
+    queue.wait()
+    queue.shutdown()
+    assert recorder.most == 2
+    assert sorted(recorder.started) == folders
+
+
+def test_cancel_a_pending_job():
+    recorder = Recorder(['first', 'second'])
+    statuses = list()
+    queue = JobQueue(workers=1, on_status=lambda job: statuses.append((job.miseqfolder, job.status)))
+    queue.submit('first', recorder)
+    recorder.wait_started('first')
+    second = queue.submit('second', recorder)
+    queue.cancel(second)
+    recorder.release.set()
+    queue.wait()
+    queue.shutdown()
+    assert second.status == CANCELLED
+    assert recorder.started == ['first']
+    assert ('second', CANCELLED) in statuses
+
+
+def test_cancel_a_running_job():
+    runner = Runner()
+    queue = JobQueue(workers=1)
+    job = queue.submit('run', runner)
+    assert runner.started.wait(TIMEOUT)
+    queue.cancel(job)
+    queue.wait()
+    queue.shutdown()
+    assert runner.terminated.is_set()
+    assert job.status == CANCELLED
+
+
+def test_failed_jobs():
+    recorder = Recorder(['exit', 'raise'], returncodes={'exit': 2})
+    recorder.release.set()
+    queue = JobQueue(workers=1)
+    exited = queue.submit('exit', recorder)
+    raised = queue.submit('raise', lambda job: 1 / 0)
+    queue.wait()
+    queue.shutdown()
+    assert exited.status == FAILED
+    assert exited.returncode == 2
+    assert raised.status == FAILED
+    assert 'ZeroDivisionError' in raised.error
+
+
+def test_shutdown_with_cancel():
+    runner = Runner()
+    queue = JobQueue(workers=1)
+    running = queue.submit('running', runner)
+    pending = queue.submit('pending', runner)
+    assert runner.started.wait(TIMEOUT)
+    queue.shutdown(cancel=True)
+    assert running.status == CANCELLED
+    assert pending.status == CANCELLED
+
+
+def test_jobs_occupy_their_slots():
+    folders = ['sharded', 'single', 'wide']
+    recorder = Recorder(folders)
+    queue = JobQueue(workers=3)
+    queue.submit('sharded', recorder, slots=2)
+    recorder.wait_started('sharded')
+    queue.submit('single', recorder)
+    recorder.wait_started('single')
+    assert queue.busy == 3
+    # A job that needs more slots than are idle waits for the running jobs
+    queue.submit('wide', recorder, slots=2)
+    assert not recorder.events['wide'].wait(0.2)
+    recorder.release.set()
+    queue.wait()
+    queue.shutdown()
+    assert recorder.started == folders
+    assert queue.busy == 0
+
+
+def test_job_with_more_slots_than_workers_runs_alone():
+    recorder = Recorder(['wide', 'single'])
+    queue = JobQueue(workers=2)
+    queue.submit('wide', recorder, slots=4)
+    recorder.wait_started('wide')
+    queue.submit('single', recorder)
+    assert not recorder.events['single'].wait(0.2)
+    recorder.release.set()
+    queue.wait()
+    queue.shutdown()
+    assert recorder.most == 1
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+from logtail import LogTail
+import os
+__author__ = 'adamkoziol'
+
+
+def test_appended_lines_are_read_once(tmpdir):
+    log = tmpdir.join('portal.log')
+    log.write('one\ntwo\n')
+    tail = LogTail(str(log))
+    assert tail.read() == ['one\n', 'two\n']
+    assert not tail.reset
+    assert tail.read() == []
+    log.write('three\n', mode='a')
+    assert tail.read() == ['three\n']
+    assert tail.text() == 'one\ntwo\nthree\n'
+
+
+def test_partial_lines_are_held_until_complete(tmpdir):
+    log = tmpdir.join('portal.log')
+    log.write('one\ntw')
+    tail = LogTail(str(log))
+    assert tail.read() == ['one\n']
+    log.write('o', mode='a')
+    assert tail.read() == []
+    log.write('\nthr', mode='a')
+    assert tail.read() == ['two\n']
+    assert tail.text() == 'one\ntwo\n'
+
+
+def test_log_that_does_not_exist_yet(tmpdir):
+    log = tmpdir.join('portal.log')
+    tail = LogTail(str(log))
+    assert tail.read() == []
+    log.write('one\n')
+    assert tail.read() == ['one\n']
+    # The first appearance of the log is not a restart
+    assert not tail.reset
+
+
+def test_rotated_log_is_read_from_the_start(tmpdir):
+    log = tmpdir.join('portal.log')
+    log.write('old one\nold two\n')
+    tail = LogTail(str(log))
+    tail.read()
+    replacement = tmpdir.join('portal.log.new')
+    replacement.write('new\n')
+    os.replace(str(replacement), str(log))
+    assert tail.read() == ['new\n']
+    assert tail.reset
+    assert tail.text() == 'new\n'
+
+
+def test_truncated_log_is_read_from_the_start(tmpdir):
+    log = tmpdir.join('portal.log')
+    log.write('a long first line\nsecond\n')
+    tail = LogTail(str(log))
+    tail.read()
+    with open(str(log), 'r+') as handle:
+        handle.truncate(0)
+        handle.write('short\n')
+    assert tail.read() == ['short\n']
+    assert tail.reset
+
+
+def test_log_rewritten_to_its_previous_size_is_read_from_the_start(tmpdir):
+    log = tmpdir.join('portal.log')
+    log.write('first run\n')
+    tail = LogTail(str(log))
+    tail.read()
+    inode = os.stat(str(log)).st_ino
+    # Truncated in place and rewritten to a larger size between two reads
+    with open(str(log), 'r+') as handle:
+        handle.truncate(0)
+        handle.write('second run\nmore\n')
+    assert os.stat(str(log)).st_ino == inode
+    assert tail.read() == ['second run\n', 'more\n']
+    assert tail.reset
+
+
+def test_deleted_log_is_read_from_the_start_when_it_returns(tmpdir):
+    log = tmpdir.join('portal.log')
+    log.write('one\n')
+    tail = LogTail(str(log))
+    tail.read()
+    log.remove()
+    assert tail.read() == []
+    log.write('two\n')
+    assert tail.read() == ['two\n']
+
+
+def test_scrollback_and_sample_sheet(tmpdir):
+    log = tmpdir.join('portal.log')
+    log.write(''.join('line {}\n'.format(index) for index in range(10)) + 'SampleSheet: /run/SampleSheet.csv\n')
+    tail = LogTail(str(log), scrollback=3)
+    tail.read()
+    assert tail.text() == 'line 8\nline 9\nSampleSheet: /run/SampleSheet.csv\n'
+    assert tail.samplesheet == '/run/SampleSheet.csv'
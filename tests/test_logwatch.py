@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import time
+import os
+import pytest
+__author__ = 'adamkoziol'
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+logwatch = pytest.importorskip('logwatch')
+
+
+@pytest.fixture(scope='module')
+def application():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def wait_for(application, condition, timeout=5):
+    """
+    Process Qt events until the condition is met
+    """
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        application.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+def test_network_filesystem(tmpdir):
+    mounts = tmpdir.join('mounts')
+    mounts.write('server:/export /mnt/miseq nfs4 rw 0 0\n'
+                 '/dev/sda1 / ext4 rw 0 0\n'
+                 '/dev/sdb1 /mnt/miseq/local ext4 rw 0 0\n')
+    assert logwatch.network_filesystem('/mnt/miseq/RUN/portal.log', mounts=str(mounts))
+    assert not logwatch.network_filesystem('/mnt/miseq/local/RUN', mounts=str(mounts))
+    assert not logwatch.network_filesystem('/home/user', mounts=str(mounts))
+
+
+def test_log_of_a_run_that_has_not_started(application, tmpdir):
+    folder = tmpdir.join('out', 'RUN', 'shards', 'shard_0', 'RUN')
+    watcher = logwatch.LogWatcher(str(folder.join('portal.log')), coalesce=10, poll=False)
+    changes = list()
+    watcher.changed.connect(lambda: changes.append(True))
+    tmpdir.mkdir('out')
+    watcher.start()
+    # The nearest existing folder is watched, rather than polling
+    assert not watcher.poll
+    assert watcher.watcher.directories() == [str(tmpdir.join('out'))]
+    # The watch moves down a level as each folder is created
+    tmpdir.join('out', 'RUN').mkdir()
+    assert wait_for(application, lambda: watcher.watcher.directories() == [str(tmpdir.join('out', 'RUN'))])
+    # Folders created at once are followed down to the folder of the log
+    folder.ensure(dir=True)
+    assert wait_for(application, lambda: watcher.watcher.directories() == [str(folder)])
+    del changes[:]
+    folder.join('portal.log').write('started\n')
+    assert wait_for(application, lambda: changes and watcher.watcher.files() == [str(folder.join('portal.log'))])
+    assert not watcher.poll
+    del changes[:]
+    folder.join('portal.log').write('more\n', mode='a')
+    assert wait_for(application, lambda: changes)
+    watcher.stop()
+    assert not watcher.watcher.files() and not watcher.watcher.directories()
+
+
+def test_polled_log(application, tmpdir):
+    log = tmpdir.join('portal.log')
+    watcher = logwatch.LogWatcher(str(log), coalesce=10, min_interval=10, max_interval=40, poll=True)
+    changes = list()
+    watcher.changed.connect(lambda: changes.append(True))
+    watcher.start()
+    assert not watcher.watcher.files() and not watcher.watcher.directories()
+    log.write('started\n')
+    assert wait_for(application, lambda: changes)
+    watcher.stop()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+from pdfcache import PDFCache
+import os
+__author__ = 'adamkoziol'
+
+
+def pdf(tmpdir, name, size=100):
+    path = tmpdir.join('{}.pdf'.format(name))
+    path.write(name[0] * size)
+    return str(path)
+
+
+def age(cache, key, seconds):
+    """
+    Set the last use of a cached PDF to the supplied number of seconds ago
+    """
+    stamp = os.stat(cache.entry(key)).st_mtime - seconds
+    os.utime(cache.entry(key), (stamp, stamp))
+
+
+def test_key(tmpdir):
+    first = pdf(tmpdir, 'first')
+    key = PDFCache.key([first], ('Genus', 'eae'), 1, '2026-10-18')
+    assert key == PDFCache.key([first], ('Genus', 'eae'), 1, '2026-10-18')
+    # Any change to the inputs, the settings, or the date of issue changes the key
+    assert key != PDFCache.key([first], ('Genus', 'eae'), 1, '2026-10-19')
+    assert key != PDFCache.key([first], ('Genus',), 1, '2026-10-18')
+    assert key != PDFCache.key([first, str(tmpdir.join('missing.csv'))], ('Genus', 'eae'), 1, '2026-10-18')
+    tmpdir.join('first.pdf').write('changed')
+    assert key != PDFCache.key([first], ('Genus', 'eae'), 1, '2026-10-18')
+
+
+def test_put_and_get(tmpdir):
+    cache = PDFCache(path=str(tmpdir.join('cache')))
+    destination = str(tmpdir.join('gar.pdf'))
+    assert not cache.get('a', destination)
+    cache.put('a', pdf(tmpdir, 'a'))
+    assert cache.get('a', destination)
+    assert open(destination).read() == 'a' * 100
+    assert [name for name in os.listdir(cache.path) if name.endswith('.tmp')] == []
+
+
+def test_least_recently_used_are_evicted(tmpdir):
+    cache = PDFCache(path=str(tmpdir.join('cache')), max_bytes=250)
+    cache.put('a', pdf(tmpdir, 'a'))
+    cache.put('b', pdf(tmpdir, 'b'))
+    age(cache, 'a', 200)
+    age(cache, 'b', 100)
+    # Using the older PDF makes the other the least recently used
+    assert cache.get('a', str(tmpdir.join('gar.pdf')))
+    cache.put('c', pdf(tmpdir, 'c'))
+    assert sorted(os.listdir(cache.path)) == ['a.pdf', 'c.pdf']
+
+
+def test_pdf_larger_than_the_cache(tmpdir):
+    cache = PDFCache(path=str(tmpdir.join('cache')), max_bytes=50)
+    cache.put('a', pdf(tmpdir, 'a'))
+    assert os.listdir(cache.path) == []
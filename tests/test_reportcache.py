@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+from reportcache import ReportCache, ReportTable, CACHE_FOLDER
+from gar import GAR, REPORT_SCHEMA, read_report
+import pandas
+import os
+__author__ = 'adamkoziol'
+
+GENESIPPR = 'Strain,Genus,eae,O157\nS1,Escherichia,99.5%,\nS2,Listeria,,100.0%\nS3,,,\n'
+
+
+def report_folder(tmpdir):
+    path = tmpdir.join('genesippr.csv')
+    path.write(GENESIPPR)
+    return str(tmpdir), str(path)
+
+
+def test_round_trip(tmpdir):
+    reportpath, path = report_folder(tmpdir)
+    report = REPORT_SCHEMA[0]
+    cache = ReportCache(reportpath)
+    assert cache.load(report, path) is None
+    table = cache.read(report, path)
+    expected = GAR.clean_report(read_report(path, report))
+    pandas.testing.assert_frame_equal(table.frame(), expected)
+    # The second read is served from the cache
+    cached = cache.load(report, path)
+    assert cached is not None
+    assert cached.samples == ['S1', 'S2', 'S3']
+    assert cached.value(0, cached.columns.index('eae')) == '+'
+    assert cached.value(2, cached.columns.index('Genus')) == '-'
+    pandas.testing.assert_frame_equal(cached.frame(), expected)
+    assert [name for name in os.listdir(os.path.join(reportpath, CACHE_FOLDER)) if name.endswith('.npy')]
+
+
+def test_changed_report_is_read_again(tmpdir):
+    reportpath, path = report_folder(tmpdir)
+    report = REPORT_SCHEMA[0]
+    cache = ReportCache(reportpath)
+    cache.read(report, path)
+    tmpdir.join('genesippr.csv').write(GENESIPPR + 'S4,Salmonella,,\n')
+    assert cache.load(report, path) is None
+    assert cache.read(report, path).samples == ['S1', 'S2', 'S3', 'S4']
+    # The codes of the earlier version are removed
+    assert len([name for name in os.listdir(os.path.join(reportpath, CACHE_FOLDER)) if name.endswith('.npy')]) == 1
+
+
+def test_changed_settings_invalidate_the_cache(tmpdir):
+    reportpath, path = report_folder(tmpdir)
+    report = REPORT_SCHEMA[0]
+    cache = ReportCache(reportpath)
+    cache.read(report, path)
+    raw = dict(report, normalise=False)
+    assert cache.load(raw, path) is None
+    assert cache.read(raw, path).value(0, 1) == '99.5%'
+    assert cache.load(dict(report, columns=('Genus', 'eae')), path) is None
+
+
+def test_report_without_samples(tmpdir):
+    cache = ReportCache(str(tmpdir))
+    data = pandas.DataFrame({'eae': []}, index=pandas.Index([], name='Strain'), dtype=str)
+    table = cache.store(REPORT_SCHEMA[0], data, None)
+    assert len(table) == 0
+    assert isinstance(cache.load(REPORT_SCHEMA[0], str(tmpdir.join('missing.csv'))), ReportTable)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+from contextlib import closing
+import results_db
+import pytest
+import os
+__author__ = 'adamkoziol'
+
+HEADER = 'Strain,Genus,eae,O157,VT2\n'
+
+
+def write_run(outputpath, miseqfolder, rows):
+    """
+    Write the genesippr report of an analysed run
+    :param rows: list of the rows of the report, without the header
+    """
+    report = outputpath.join(miseqfolder, 'reports', 'genesippr.csv')
+    report.write(HEADER + ''.join('{}\n'.format(row) for row in rows), ensure=True)
+    return report
+
+
+def later(path):
+    """
+    Move the modification time of a file forward, so that a rewrite is noticed however coarse the file system clock
+    """
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def index(tmpdir):
+    write_run(tmpdir, '200101_M00000_0001', ['S1,Escherichia,99%,100%,98%', 'S2,Escherichia,99%,,'])
+    write_run(tmpdir, '200102_M00000_0002', ['S3,Escherichia,,100%,98%', 'S4,Listeria,,,'])
+    return results_db.results_index(str(tmpdir))
+
+
+def test_ingest_all(tmpdir, index):
+    assert index.ingest_all(str(tmpdir)) == {'200101_M00000_0001': ['genesippr'],
+                                             '200102_M00000_0002': ['genesippr']}
+    assert index.runs() == ['200102_M00000_0002', '200101_M00000_0001']
+    assert index.runs(last=1) == ['200102_M00000_0002']
+    assert index.reports() == ['genesippr']
+    # Unchanged reports are not read again
+    assert index.ingest_all(str(tmpdir)) == {'200101_M00000_0001': [], '200102_M00000_0002': []}
+
+
+def test_samples_with(tmpdir, index):
+    index.ingest_all(str(tmpdir))
+    assert index.samples_with({'O157': '+', 'VT2': '+'}) == [('200102_M00000_0002', 'S3'),
+                                                              ('200101_M00000_0001', 'S1')]
+    assert index.samples_with({'eae': '+', 'O157': '-'}) == [('200101_M00000_0001', 'S2')]
+    assert index.samples_with({'O157': '+'}, last=1) == [('200102_M00000_0002', 'S3')]
+    assert index.samples_with({'Genus': 'Listeria'}) == [('200102_M00000_0002', 'S4')]
+    assert index.samples_with({'O157': '+'}, report='GDCS') == []
+    # Without markers, every sample in the report is found
+    assert len(index.samples_with(dict())) == 4
+
+
+def test_sample_results(tmpdir, index):
+    index.ingest_all(str(tmpdir))
+    assert index.sample_results('S2') == [('200101_M00000_0001', 'genesippr', 'Genus', 'Escherichia'),
+                                          ('200101_M00000_0001', 'genesippr', 'O157', '-'),
+                                          ('200101_M00000_0001', 'genesippr', 'VT2', '-'),
+                                          ('200101_M00000_0001', 'genesippr', 'eae', '+')]
+
+
+def test_changed_report_is_ingested_again(tmpdir, index):
+    index.ingest_all(str(tmpdir))
+    report = write_run(tmpdir, '200101_M00000_0001', ['S1,Escherichia,99%,,', 'S5,Escherichia,,100%,'])
+    later(report)
+    assert index.ingest(str(tmpdir), '200101_M00000_0001') == ['genesippr']
+    assert index.samples_with({'O157': '+'}) == [('200102_M00000_0002', 'S3'), ('200101_M00000_0001', 'S5')]
+    assert index.sample_results('S2') == []
+
+
+def test_touched_report_is_not_ingested_again(tmpdir, index):
+    index.ingest_all(str(tmpdir))
+    later(tmpdir.join('200101_M00000_0001', 'reports', 'genesippr.csv'))
+    assert index.ingest(str(tmpdir), '200101_M00000_0001') == []
+    # The new modification time is recorded, so the contents are not hashed again
+    assert index.ingest(str(tmpdir), '200101_M00000_0001') == []
+
+
+def test_index_of_an_earlier_version_is_ingested_again(tmpdir, index):
+    index.ingest_all(str(tmpdir))
+    with closing(index.connect()) as connection:
+        connection.execute('PRAGMA user_version = {:d}'.format(results_db.INDEX_VERSION - 1))
+    index = results_db.results_index(str(tmpdir))
+    # The indexed results remain searchable until the run is ingested again
+    assert len(index.samples_with(dict())) == 4
+    assert index.ingest(str(tmpdir), '200101_M00000_0001') == ['genesippr']
+
+
+def test_parse_markers():
+    assert results_db.parse_markers(['O157=+', 'VT2=-', 'Genus=']) == {'O157': '+', 'VT2': '-', 'Genus': ''}
+    for marker in ('O157', '=+'):
+        with pytest.raises(ValueError):
+            results_db.parse_markers([marker])
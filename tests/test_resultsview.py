@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+from reportcache import ReportTable
+import pandas
+import pytest
+__author__ = 'adamkoziol'
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+resultsview = pytest.importorskip('resultsview')
+Qt = QtCore.Qt
+
+
+@pytest.fixture
+def model():
+    data = pandas.DataFrame({'Genus': ['Listeria', 'Escherichia', 'escherichia', None],
+                             'eae': ['-', '+', '+', '-'],
+                             'VT1': ['-', '-', '+', None]},
+                            index=pandas.Index(['b2', 'A1', 'c3', 'a0'], name='Strain'),
+                            columns=['Genus', 'eae', 'VT1'])
+    model = resultsview.ResultsModel(batch_size=2)
+    model.set_table(ReportTable.encode(data))
+    return model
+
+
+def strains(model):
+    while model.canFetchMore():
+        model.fetchMore()
+    return [model.data(model.index(row, 0)) for row in range(model.rowCount())]
+
+
+def test_rows_are_added_in_batches(model):
+    assert model.rowCount() == 2
+    assert model.canFetchMore()
+    model.fetchMore()
+    assert model.rowCount() == 4
+    assert not model.canFetchMore()
+
+
+def test_sorted_by_sample_name(model):
+    assert strains(model) == ['a0', 'A1', 'b2', 'c3']
+    model.sort(0, Qt.DescendingOrder)
+    assert strains(model) == ['c3', 'b2', 'A1', 'a0']
+
+
+def test_sorted_by_column(model):
+    model.sort(1)
+    # Values are ranked ignoring case, in the order of the report for equal values, and missing values last
+    assert strains(model) == ['A1', 'c3', 'b2', 'a0']
+    model.sort(3)
+    assert strains(model) == ['c3', 'b2', 'A1', 'a0']
+
+
+def test_missing_values_are_shown_as_absent(model):
+    row = strains(model).index('a0')
+    assert model.data(model.index(row, 1)) == '-'
+    assert model.headerData(1, Qt.Horizontal) == 'Genus'
+
+
+def test_filtered_by_sample_or_genus(model):
+    model.set_filter('ESCH')
+    assert strains(model) == ['A1', 'c3']
+    model.set_filter(' b2 ')
+    assert strains(model) == ['b2']
+
+
+def test_filtered_by_marker(model):
+    model.set_filter(marker='VT1')
+    assert strains(model) == ['c3']
+    model.set_filter('listeria', marker='eae')
+    assert strains(model) == []
+    model.set_filter()
+    assert len(strains(model)) == 4
+
+
+def test_displayed_columns(model):
+    model.set_table(model.table, columns=['VT1', 'Missing'])
+    assert model.columnCount() == 2
+    assert model.headerData(1, Qt.Horizontal) == 'VT1'
+
+
+def test_cleared_table(model):
+    model.set_table(None)
+    assert model.rowCount() == 0
+    assert model.columnCount() == 0
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import runfolder
+import pytest
+import os
+__author__ = 'adamkoziol'
+
+RUNINFO = '<?xml version="1.0"?>\n<RunInfo><Run><Reads>\n' \
+          '<Read Number="1" NumCycles="{forward}" IsIndexedRead="N" />\n' \
+          '<Read Number="2" NumCycles="8" IsIndexedRead="Y" />\n' \
+          '<Read Number="3" NumCycles="8" IsIndexedRead="Y" />\n' \
+          '<Read Number="4" NumCycles="{reverse}" IsIndexedRead="N" />\n' \
+          '</Reads></Run></RunInfo>\n'
+
+
+def make_run(miseqpath, miseqfolder, cycles, forward=151, reverse=151):
+    """
+    Create a run folder with the supplied number of completed cycles
+    """
+    run = miseqpath.join(miseqfolder)
+    run.join('RunInfo.xml').write(RUNINFO.format(forward=forward, reverse=reverse), ensure=True)
+    for cycle in range(1, cycles + 1):
+        add_cycle(miseqpath, miseqfolder, cycle)
+    return run
+
+
+def add_cycle(miseqpath, miseqfolder, cycle):
+    os.makedirs(os.path.join(runfolder.basecalls_path(str(miseqpath), miseqfolder), 'C{}.1'.format(cycle)))
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    """
+    Count the scans of cycle folders
+    """
+    scans = list()
+    cycle_count = runfolder.cycle_count
+
+    def count(miseqpath, miseqfolder):
+        scans.append(miseqfolder)
+        return cycle_count(miseqpath, miseqfolder)
+    monkeypatch.setattr(runfolder, 'cycle_count', count)
+    return scans
+
+
+def test_lookup(tmpdir):
+    make_run(tmpdir, 'RUN', 20, forward=70, reverse=0)
+    info = runfolder.RunInfoCache(path=None).lookup(str(tmpdir), 'RUN')
+    assert info['cycles'] == 20
+    assert info['totalcycles'] == 86
+    assert (info['readlengthforward'], info['readlengthreverse']) == ('70', '0')
+
+
+def test_cached_until_a_cycle_completes(tmpdir, counted):
+    make_run(tmpdir, 'RUN', 5)
+    cache = runfolder.RunInfoCache(path=None)
+    assert cache.lookup(str(tmpdir), 'RUN')['cycles'] == 5
+    assert cache.lookup(str(tmpdir), 'RUN')['cycles'] == 5
+    assert counted == ['RUN']
+    add_cycle(tmpdir, 'RUN', 6)
+    assert cache.lookup(str(tmpdir), 'RUN')['cycles'] == 6
+    assert counted == ['RUN', 'RUN']
+
+
+def test_cached_until_the_run_info_changes(tmpdir, counted):
+    run = make_run(tmpdir, 'RUN', 5)
+    cache = runfolder.RunInfoCache(path=None)
+    assert cache.lookup(str(tmpdir), 'RUN')['readlengthforward'] == '151'
+    run.join('RunInfo.xml').write(RUNINFO.format(forward=70, reverse=70))
+    stat = os.stat(str(run.join('RunInfo.xml')))
+    os.utime(str(run.join('RunInfo.xml')), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.lookup(str(tmpdir), 'RUN')['readlengthforward'] == '70'
+    assert len(counted) == 2
+
+
+def test_saved_cache_is_reused(tmpdir, counted):
+    make_run(tmpdir, 'RUN', 5)
+    path = str(tmpdir.join('cache', 'runinfo.json'))
+    cache = runfolder.RunInfoCache(path=path)
+    cache.lookup(str(tmpdir), 'RUN', save=False)
+    assert not os.path.isfile(path)
+    cache.save()
+    assert os.path.isfile(path)
+    # Nothing changed, so the cache is not written again
+    os.remove(path)
+    cache.save()
+    assert not os.path.isfile(path)
+    cache.changed = True
+    cache.save()
+    assert runfolder.RunInfoCache(path=path).lookup(str(tmpdir), 'RUN')['cycles'] == 5
+    assert counted == ['RUN']
+
+
+def test_entries_of_an_earlier_version_are_rebuilt(tmpdir, counted):
+    make_run(tmpdir, 'RUN', 5)
+    cache = runfolder.RunInfoCache(path=None)
+    cache.lookup(str(tmpdir), 'RUN')
+    for entry in cache.entries.values():
+        entry['stamp'][0] = runfolder.CACHE_VERSION - 1
+    cache.lookup(str(tmpdir), 'RUN')
+    assert len(counted) == 2
+
+
+def test_corrupt_cache_is_ignored(tmpdir):
+    path = tmpdir.join('runinfo.json')
+    path.write('{not json')
+    assert runfolder.RunInfoCache(path=str(path)).entries == dict()
+
+
+def test_validate(tmpdir, monkeypatch):
+    monkeypatch.setattr(runfolder, 'cache', runfolder.RunInfoCache(path=None))
+    make_run(tmpdir, 'READY', 70 + 16, forward=70)
+    make_run(tmpdir, 'SEQUENCING', 20, forward=70)
+    tmpdir.join('EMPTY').ensure(dir=True)
+    assert runfolder.validate(str(tmpdir), 'READY') == (86, '70', '151')
+    with pytest.raises(ValueError):
+        runfolder.validate(str(tmpdir), 'SEQUENCING')
+    with pytest.raises(ValueError):
+        runfolder.validate(str(tmpdir), 'EMPTY')
+    with pytest.raises(FileNotFoundError):
+        runfolder.validate(str(tmpdir), 'MISSING')
+
+
+def age(miseqpath, miseqfolder, seconds):
+    """
+    Set the modification times of the cycle folders of a run, and of the folder containing them, to the past
+    """
+    path = runfolder.basecalls_path(str(miseqpath), miseqfolder)
+    past = os.stat(path).st_mtime - seconds
+    for name in os.listdir(path) + ['']:
+        os.utime(os.path.join(path, name), (past, past))
+
+
+def test_sequencing(tmpdir):
+    cache = runfolder.RunInfoCache(path=None)
+    make_run(tmpdir, 'RECENT', 20, forward=70)
+    make_run(tmpdir, 'ABORTED', 20, forward=70)
+    age(tmpdir, 'ABORTED', 2 * 3600)
+    assert runfolder.sequencing(cache.lookup(str(tmpdir), 'RECENT'))
+    assert not runfolder.sequencing(cache.lookup(str(tmpdir), 'ABORTED'))
+    assert runfolder.sequencing(cache.lookup(str(tmpdir), 'ABORTED'), window=3 * 3600)
+    assert not runfolder.sequencing({'updated': None})
+
+
+def test_cycle_monitor_follows_new_cycles(tmpdir):
+    make_run(tmpdir, 'RUN', 3, forward=70)
+    monitor = runfolder.CycleMonitor(str(tmpdir), 'RUN', '70')
+    assert monitor.poll() == 3
+    add_cycle(tmpdir, 'RUN', 4)
+    add_cycle(tmpdir, 'RUN', 5)
+    assert monitor.poll() == 5
+    progress = monitor.progress()
+    assert (progress['cycles'], progress['needed'], progress['ready']) == (5, 86, False)
+
+
+def test_cycle_monitor_eta(tmpdir, monkeypatch):
+    make_run(tmpdir, 'RUN', 10, forward=70)
+    monitor = runfolder.CycleMonitor(str(tmpdir), 'RUN', '70')
+    # The rate is not known until at least two cycles have been seen
+    assert monitor.eta() is None
+    now = 1000000.0
+    monkeypatch.setattr(runfolder.time, 'time', lambda: now)
+    monitor.scanned = True
+    monitor.cycles = 76
+    monitor.history.extend([(now - 100, 66), (now - 10, 76)])
+    # A cycle every 9 s, with 10 cycles remaining from the latest cycle 10 s ago
+    assert monitor.eta() == pytest.approx(80)
+    assert monitor.idle() == pytest.approx(10)
+    monitor.cycles = 86
+    assert monitor.eta() == 0
+    assert runfolder.CycleMonitor(str(tmpdir), 'RUN', 'full').eta() is None
+
+
+def test_idle_cycle_monitor(tmpdir):
+    make_run(tmpdir, 'STALLED', 20, forward=70)
+    age(tmpdir, 'STALLED', 2 * 3600)
+    monitor = runfolder.CycleMonitor(str(tmpdir), 'STALLED', '70')
+    monitor.poll()
+    # Idle since the latest cycle folder was written, rather than since monitoring started
+    assert monitor.progress()['idle'] > 3600
+    # A run without any cycles is idle from the start of monitoring
+    assert runfolder.CycleMonitor(str(tmpdir), 'MISSING', '70').idle() < 60
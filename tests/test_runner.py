@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+from runner import CLIEngine, LocalEngine, ParallelRunner, StreamingRunner, FAILED
+import runner
+import sys
+__author__ = 'adamkoziol'
+
+# Stand-in for method.py of the sipprverse: writes its arguments, and exits with the status in the STATUS file beside
+# it, if there is one
+METHOD = """
+import sys, os
+print('args', ' '.join(sys.argv[1:]))
+print('warning', file=sys.stderr)
+status = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'STATUS')
+sys.exit(int(open(status).read()) if os.path.isfile(status) else 0)
+"""
+
+
+def local_engine(tmpdir):
+    method = tmpdir.join('method.py')
+    method.write(METHOD)
+    return LocalEngine(str(method), referencepath='/references')
+
+
+def test_local_engine_runs_the_stand_in(tmpdir):
+    stdout = list()
+    stderr = list()
+    pipeline = local_engine(tmpdir).runner(str(tmpdir), 'RUN', str(tmpdir.join('out')),
+                                           on_stdout=stdout.append, on_stderr=stderr.append)
+    assert pipeline.run() == 0
+    assert pipeline.command[0] == sys.executable
+    assert stdout[0].startswith('args -m ')
+    assert '-f RUN' in stdout[0]
+    assert '-o {}'.format(tmpdir.join('out', 'RUN')) in stdout[0]
+    assert stderr == ['warning\n']
+
+
+def test_local_engine_shard_uses_its_own_sample_sheet(tmpdir):
+    pipeline = local_engine(tmpdir).runner(str(tmpdir), 'RUN', str(tmpdir.join('out')),
+                                           subfolder='RUN/shards/shard_0')
+    shard = str(tmpdir.join('out', 'RUN', 'shards', 'shard_0'))
+    assert pipeline.command[pipeline.command.index('-c') + 1] == '{}/SampleSheet.csv'.format(shard)
+    assert pipeline.command[pipeline.command.index('-o') + 1] == '{}/RUN'.format(shard)
+
+
+def test_local_engine_reports_failure(tmpdir):
+    tmpdir.join('STATUS').write('3')
+    pipeline = local_engine(tmpdir).runner(str(tmpdir), 'RUN', str(tmpdir))
+    assert pipeline.run() == 3
+    assert pipeline.stderr_tail() == 'warning\n'
+
+
+def test_engine_api_without_a_socket(tmpdir):
+    assert not runner.api_available(str(tmpdir.join('docker.sock')), timeout=1)
+
+
+def test_default_engine_without_the_engine_api(monkeypatch):
+    monkeypatch.setattr(runner, 'shared_engine', list())
+    monkeypatch.setattr(runner, 'api_available', lambda: False)
+    engine = runner.default_engine()
+    assert isinstance(engine, CLIEngine)
+    # The engine is shared by every run
+    assert runner.default_engine() is engine
+
+
+class RaisingRunner(StreamingRunner):
+
+    def run(self):
+        raise ConnectionRefusedError('engine went away')
+
+
+class SilentRunner(StreamingRunner):
+
+    def run(self):
+        # Finishes without an exit status
+        return None
+
+
+def test_parallel_runner_succeeds_when_every_runner_does():
+    finished = list()
+    runner = ParallelRunner([StreamingRunner([sys.executable, '-c', 'pass']) for _ in range(3)],
+                            on_finished=lambda index, returncode: finished.append((index, returncode)))
+    assert runner.run() == 0
+    assert sorted(finished) == [(0, 0), (1, 0), (2, 0)]
+
+
+def test_parallel_runner_fails_when_a_runner_raises():
+    finished = list()
+    runner = ParallelRunner([StreamingRunner([sys.executable, '-c', 'pass']), RaisingRunner(None)],
+                            on_finished=lambda index, returncode: finished.append((index, returncode)))
+    assert runner.run() == FAILED
+    assert sorted(finished) == [(0, 0), (1, FAILED)]
+    assert 'ConnectionRefusedError' in runner.stderr_tail()
+    assert '[shard 0]' not in runner.stderr_tail()
+
+
+def test_parallel_runner_fails_without_an_exit_status():
+    runner = ParallelRunner([SilentRunner(None), StreamingRunner([sys.executable, '-c', 'pass'])])
+    assert runner.run() == FAILED
+
+
+def test_parallel_runner_reports_the_first_failure():
+    runner = ParallelRunner([StreamingRunner([sys.executable, '-c', 'import sys; sys.exit({})'.format(code)])
+                             for code in (0, 2, 0)])
+    assert runner.run() == 2
+
+
+def test_terminated_runner_does_not_start():
+    runner = ParallelRunner([StreamingRunner([sys.executable, '-c', 'import time; time.sleep(30)'])])
+    runner.terminate()
+    assert runner.run() == FAILED
+    assert runner.runners[0].process is None
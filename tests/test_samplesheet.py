@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+from samplesheet import SampleSheet, read_samplesheet
+import os
+__author__ = 'adamkoziol'
+
+# Saved by a spreadsheet program: a byte order mark, and rows padded with empty fields
+SHEET = '\ufeff[Header],,,\n' \
+        'IEMFileVersion,4,,\n' \
+        'Investigator Name,"Koziol, Adam",,\n' \
+        ',,,\n' \
+        '[Reads],,,\n' \
+        '151,,,\n' \
+        '151,,,\n' \
+        '[Settings],,,\n' \
+        'ReverseComplement,0,,\n' \
+        '[Data],,,\n' \
+        'Sample_ID,Sample_Name,Sample_Project,Description,index,index2\n' \
+        '2026-SEQ-0001,E. coli,"Project, 1",O157,ACGT,TTGA\n' \
+        '2026-SEQ-0002,Listeria,Project 2,,GGCA\n'
+
+
+def test_sections(tmpdir):
+    path = tmpdir.join('SampleSheet.csv')
+    path.write(SHEET)
+    sheet = SampleSheet(str(path))
+    assert list(sheet.header.items()) == [('IEMFileVersion', '4'), ('Investigator Name', 'Koziol, Adam')]
+    assert sheet.reads == [151, 151]
+    assert sheet.settings['ReverseComplement'] == '0'
+    assert sheet.sample_ids() == ['2026-SEQ-0001', '2026-SEQ-0002']
+
+
+def test_quoted_fields_and_missing_columns(tmpdir):
+    path = tmpdir.join('SampleSheet.csv')
+    path.write(SHEET)
+    first, second = SampleSheet(str(path)).samples
+    assert first.sample_project == 'Project, 1'
+    assert (first.sample_name, first.description, first.index, first.index2) == ('E. coli', 'O157', 'ACGT', 'TTGA')
+    # Fields missing from the end of a row are empty
+    assert (second.description, second.index, second.index2) == (str(), 'GGCA', str())
+    assert list(second.fields) == ['Sample_ID', 'Sample_Name', 'Sample_Project', 'Description', 'index', 'index2']
+
+
+def test_samples_without_a_data_section(tmpdir):
+    path = tmpdir.join('SampleSheet.csv')
+    path.write('[Header]\nIEMFileVersion,4\nSample_ID,Sample_Name\nS1,one\nS2,two\n')
+    sheet = SampleSheet(str(path))
+    assert sheet.sample_ids() == ['S1', 'S2']
+    assert list(sheet.header.items()) == [('IEMFileVersion', '4')]
+
+
+def test_samples_before_any_section(tmpdir):
+    path = tmpdir.join('SampleSheet.csv')
+    path.write('Sample_ID,Sample_Name\nS1,one\n')
+    sheet = SampleSheet(str(path))
+    assert sheet.sample_ids() == ['S1']
+    assert None not in sheet.sections
+
+
+def test_sheet_without_samples(tmpdir):
+    path = tmpdir.join('SampleSheet.csv')
+    path.write('[Header]\nIEMFileVersion,4\n')
+    assert SampleSheet(str(path)).samples == []
+
+
+def test_write_round_trip(tmpdir):
+    path = tmpdir.join('SampleSheet.csv')
+    path.write(SHEET)
+    sheet = SampleSheet(str(path))
+    sheet.write(str(tmpdir.join('all.csv')))
+    written = SampleSheet(str(tmpdir.join('all.csv')))
+    assert written.sections == sheet.sections
+    assert written.samples == sheet.samples
+    # A subset of the samples is written with the other sections unchanged
+    sheet.write(str(tmpdir.join('subset.csv')), samples=sheet.samples[1:])
+    subset = SampleSheet(str(tmpdir.join('subset.csv')))
+    assert subset.sample_ids() == ['2026-SEQ-0002']
+    assert subset.header == sheet.header
+    assert subset.data_header == sheet.data_header
+
+
+def test_parsed_once_until_changed(tmpdir):
+    path = tmpdir.join('SampleSheet.csv')
+    path.write(SHEET)
+    sheet = read_samplesheet(str(path))
+    assert read_samplesheet(str(path)) is sheet
+    path.write(SHEET + '2026-SEQ-0003,Salmonella,Project 3,,TTTT\n')
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    changed = read_samplesheet(str(path))
+    assert changed is not sheet
+    assert len(changed.samples) == 3
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+from samplesheet import SampleSheet
+import shards
+import os
+__author__ = 'adamkoziol'
+
+RUN = 'RUN'
+
+
+def write_report(outputpath, folder, report_file, text):
+    """
+    Write a report of the run in the supplied folder, relative to outputpath
+    """
+    outputpath.join(folder, RUN, 'reports', report_file).write(text, ensure=True)
+
+
+def read_report(outputpath, report_file):
+    return outputpath.join(RUN, 'reports', report_file).read()
+
+
+def test_split():
+    samples = list(range(10))
+    assert shards.split(samples, 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert shards.split(samples, 1) == [samples]
+    # Never more shards than samples, nor fewer than one
+    assert shards.split(samples[:2], 5) == [[0], [1]]
+    assert shards.split(samples, 0) == [samples]
+
+
+def test_write_shards(tmpdir):
+    sheet = tmpdir.join('SampleSheet.csv')
+    sheet.write('[Header]\nIEMFileVersion,4\n[Data]\nSample_ID,Sample_Name\n'
+                + ''.join('S{0},sample {0}\n'.format(index) for index in range(5)))
+    output = tmpdir.join('out')
+    stale = output.join(RUN, 'shards', 'shard_0', RUN, 'reports', 'genesippr.csv')
+    stale.write('left over', ensure=True)
+    written = shards.write_shards(str(sheet), str(output), RUN, 2)
+    assert [folder for folder, _ in written] == [os.path.join(RUN, 'shards', 'shard_0'),
+                                                 os.path.join(RUN, 'shards', 'shard_1')]
+    assert not stale.check()
+    shard_sheets = [SampleSheet(str(output.join(folder, 'SampleSheet.csv'))) for folder, _ in written]
+    assert [sheet.sample_ids() for sheet in shard_sheets] == [['S0', 'S1', 'S2'], ['S3', 'S4']]
+    assert shard_sheets[1].header['IEMFileVersion'] == '4'
+
+
+def test_merge_reports(tmpdir):
+    folders = ['{}/shards/shard_{}'.format(RUN, index) for index in range(2)]
+    write_report(tmpdir, folders[0], 'genesippr.csv', 'Strain,Genus,eae\nS1,Escherichia,99%\nS2,Listeria,\n')
+    write_report(tmpdir, folders[1], 'genesippr.csv', 'Strain,Genus,eae\nS3,"Escherichia, probably",98%\n')
+    # The GDCS reports of different genera have different columns
+    write_report(tmpdir, folders[0], 'GDCS.csv', 'Strain,Genus,abcD\nS1,Escherichia,1.0\n')
+    write_report(tmpdir, folders[1], 'GDCS.csv', 'Strain,Genus,xyzW\nS3,Listeria,2.0\n')
+    assert shards.merge_reports(str(tmpdir), RUN, folders) == ['genesippr.csv', 'GDCS.csv']
+    assert read_report(tmpdir, 'genesippr.csv') == \
+        'Strain,Genus,eae\nS1,Escherichia,99%\nS2,Listeria,\nS3,"Escherichia, probably",98%\n'
+    assert read_report(tmpdir, 'GDCS.csv') == 'Strain,Genus,abcD,xyzW\nS1,Escherichia,1.0,\nS3,Listeria,,2.0\n'
+    assert not tmpdir.join(RUN, 'reports', 'sixteens_full.csv').check()
+    # Unchanged reports are not rewritten
+    assert shards.merge_reports(str(tmpdir), RUN, folders) == []
+    assert [name for name in os.listdir(str(tmpdir.join(RUN, 'reports'))) if name.endswith('.tmp')] == []
+
+
+def test_keep_reports(tmpdir):
+    write_report(tmpdir, '', 'genesippr.csv', 'Strain,Genus,eae\nS1,Escherichia,99%\nS2,Listeria,\nS3,Bacillus,\n')
+    folder = shards.keep_reports(str(tmpdir), RUN, ['S1', 'S3'])
+    assert folder == os.path.join(RUN, 'shards', 'shard_completed')
+    assert tmpdir.join(folder, RUN, 'reports', 'genesippr.csv').read() == \
+        'Strain,Genus,eae\nS1,Escherichia,99%\nS3,Bacillus,\n'
+    # Kept samples are merged with the samples analysed again
+    write_report(tmpdir, '{}/shards/shard_0'.format(RUN), 'genesippr.csv', 'Strain,Genus,eae\nS2,Listeria,98%\n')
+    shards.merge_reports(str(tmpdir), RUN, [folder, '{}/shards/shard_0'.format(RUN)])
+    assert read_report(tmpdir, 'genesippr.csv') == \
+        'Strain,Genus,eae\nS1,Escherichia,99%\nS3,Bacillus,\nS2,Listeria,98%\n'